@@ -1,8 +1,35 @@
 from django.contrib import admin
 
 # Register your models here.
+from django.db.models import Count
+from django.db.models.expressions import RawSQL
 from django.utils.html import format_html
-from .models import Category, Product, Review, ContactMessage, Order, OrderItem
+from .exports import streaming_export_response
+from .images import rendition_url
+from .inventory import count_stock
+from .models import Category, Product, Review, ContactMessage, Order, OrderItem, DailySales, Stock, StockMovement
+from .reports import parse_period, sales_report
+from .search import MATCH_IDS_SQL, build_match_query, fts_available
+
+
+# Export actions: the selected rows are streamed in chunks, so even "select all" on
+# a large table never loads everything into memory at once
+def export_csv(modeladmin, request, queryset):
+    return streaming_export_response(queryset, 'csv')
+export_csv.short_description = 'Export selected as CSV'
+
+
+def export_csv_gzip(modeladmin, request, queryset):
+    return streaming_export_response(queryset, 'csv', compress=True)
+export_csv_gzip.short_description = 'Export selected as CSV (gzip)'
+
+
+def export_jsonl(modeladmin, request, queryset):
+    return streaming_export_response(queryset, 'jsonl')
+export_jsonl.short_description = 'Export selected as JSON lines'
+
+
+EXPORT_ACTIONS = [export_csv, export_csv_gzip, export_jsonl]
 
 
 # Category Admin
@@ -11,10 +38,15 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'product_count', 'description_preview')
     search_fields = ('name', 'description')
     ordering = ('name',)
-    
+
+    def get_queryset(self, request):
+        # Count products in the changelist query instead of once per row
+        return super().get_queryset(request).annotate(num_products=Count('products'))
+
     def product_count(self, obj):
-        return obj.products.count()
+        return obj.num_products
     product_count.short_description = 'Number of Products'
+    product_count.admin_order_field = 'num_products'
     
     def description_preview(self, obj):
         if obj.description:
@@ -26,16 +58,17 @@ class CategoryAdmin(admin.ModelAdmin):
 # Product Admin
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price', 'featured', 'image_preview', 'review_count')
+    list_display = ('name', 'category', 'price', 'featured', 'image_preview', 'review_count', 'average_rating_display')
     list_filter = ('category', 'featured')
     search_fields = ('name', 'description')
     list_editable = ('featured', 'price')
     ordering = ('name',)
-    readonly_fields = ('image_preview_large',)
+    list_select_related = ('category',)
+    readonly_fields = ('image_preview_large', 'review_count', 'average_rating_display', 'rating_breakdown')
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('name', 'category', 'description')
+            'fields': ('name', 'sku', 'category', 'description')
         }),
         ('Pricing & Display', {
             'fields': ('price', 'featured')
@@ -43,24 +76,49 @@ class ProductAdmin(admin.ModelAdmin):
         ('Media', {
             'fields': ('image_url', 'image_preview_large')
         }),
+        ('Ratings', {
+            'fields': ('review_count', 'average_rating_display', 'rating_breakdown')
+        }),
     )
     
     def image_preview(self, obj):
         if obj.image_url:
-            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 4px;" />', obj.image_url)
+            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 4px;" />',
+                               rendition_url(obj.pk, obj.image_url, obj.image_hash, 'thumb'))
         return '-'
     image_preview.short_description = 'Image'
     
     def image_preview_large(self, obj):
         if obj.image_url:
-            return format_html('<img src="{}" width="200" style="border-radius: 8px;" />', obj.image_url)
+            return format_html('<img src="{}" width="200" style="border-radius: 8px;" />',
+                               rendition_url(obj.pk, obj.image_url, obj.image_hash, 'card'))
         return 'No image available'
     image_preview_large.short_description = 'Product Image'
     
+    def get_search_results(self, request, queryset, search_term):
+        # Use the FTS5 index instead of LIKE '%term%' scans over name and description
+        match = build_match_query(search_term)
+        if match is None or not fts_available():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=RawSQL(MATCH_IDS_SQL, [match])), False
+
+    # Ratings are read from the aggregates stored on Product, not counted per row
     def review_count(self, obj):
-        count = obj.reviews.count()
+        count = obj.review_count
         return f"{count} review{'s' if count != 1 else ''}"
     review_count.short_description = 'Reviews'
+    review_count.admin_order_field = 'review_count'
+
+    def average_rating_display(self, obj):
+        average = obj.average_rating
+        if average is None:
+            return '-'
+        return f"{average:.1f} ⭐"
+    average_rating_display.short_description = 'Avg. Rating'
+
+    def rating_breakdown(self, obj):
+        return ', '.join(f"{star}★: {count}" for star, count in obj.rating_histogram)
+    rating_breakdown.short_description = 'Rating Breakdown'
 
 
 # Review Admin
@@ -71,6 +129,8 @@ class ReviewAdmin(admin.ModelAdmin):
     search_fields = ('name', 'comment', 'product__name')
     readonly_fields = ('created_at', 'user')
     ordering = ('-created_at',)
+    list_select_related = ('product',)
+    actions = EXPORT_ACTIONS
     
     def rating_stars(self, obj):
         stars = '⭐' * obj.rating
@@ -90,6 +150,7 @@ class ContactMessageAdmin(admin.ModelAdmin):
     search_fields = ('name', 'email', 'message')
     readonly_fields = ('name', 'email', 'message', 'created_at')
     ordering = ('-created_at',)
+    actions = EXPORT_ACTIONS
     
     def message_preview(self, obj):
         return obj.message[:80] + '...' if len(obj.message) > 80 else obj.message
@@ -104,11 +165,16 @@ class ContactMessageAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ('product', 'quantity', 'subtotal')
+    readonly_fields = ('product', 'quantity', 'unit_price', 'subtotal')
     can_delete = False
-    
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
     def subtotal(self, obj):
-        return f"${obj.product.price * obj.quantity:.2f}"
+        if obj.unit_price is None:  # blank inline row
+            return '-'
+        return f"${obj.line_total:.2f}"
     subtotal.short_description = 'Subtotal'
 
 
@@ -118,14 +184,19 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ('order_number', 'user_display', 'total_items', 'order_total', 'completed', 'created_at')
     list_filter = ('completed', 'created_at')
     search_fields = ('id', 'user__username', 'user__email')
-    readonly_fields = ('created_at', 'order_total_display')
-    list_editable = ('completed',)
+    # Orders are completed by the checkout (re-priced, idempotent), not by ticking a box here
+    readonly_fields = ('created_at', 'completed', 'completed_at', 'order_total_display')
     ordering = ('-created_at',)
+    list_select_related = ('user',)
     inlines = [OrderItemInline]
+    actions = EXPORT_ACTIONS
     
     fieldsets = (
         ('Order Information', {
-            'fields': ('user', 'created_at', 'completed')
+            'fields': ('user', 'created_at', 'completed', 'completed_at')
+        }),
+        ('Delivery', {
+            'fields': ('delivery_address', 'phone_number', 'notes')
         }),
         ('Order Summary', {
             'fields': ('order_total_display',)
@@ -142,22 +213,93 @@ class OrderAdmin(admin.ModelAdmin):
         return 'Guest'
     user_display.short_description = 'Customer'
     
+    # Item count and total are stored on Order (see recalculate_order_totals)
     def total_items(self, obj):
-        total = sum(item.quantity for item in obj.items.all())
+        total = obj.item_count
         return f"{total} item{'s' if total != 1 else ''}"
     total_items.short_description = 'Items'
+    total_items.admin_order_field = 'item_count'
     
     def order_total(self, obj):
-        total = sum(item.product.price * item.quantity for item in obj.items.all())
-        return f"${total:.2f}"
+        return f"${obj.total:.2f}"
     order_total.short_description = 'Total'
+    order_total.admin_order_field = 'total'
     
     def order_total_display(self, obj):
-        total = sum(item.product.price * item.quantity for item in obj.items.all())
-        return format_html('<strong style="font-size: 18px; color: #28a745;">${:.2f}</strong>', total)
+        return format_html('<strong style="font-size: 18px; color: #28a745;">${}</strong>', f"{obj.total:.2f}")
     order_total_display.short_description = 'Order Total'
 
 
+# Stock: counts entered here are saved through freshmart.inventory, so they land in the ledger
+@admin.register(Stock)
+class StockAdmin(admin.ModelAdmin):
+    list_display = ('product', 'on_hand', 'reserved', 'available')
+    list_editable = ('on_hand',)
+    search_fields = ('product__name', 'product__sku')
+    autocomplete_fields = ('product',)
+    list_select_related = ('product',)
+    ordering = ('product__name',)
+
+    def get_readonly_fields(self, request, obj=None):
+        # reserved is only changed by carts, checkouts and the sweeper
+        return ('product', 'reserved') if obj else ('reserved',)
+
+    def save_model(self, request, obj, form, change):
+        count_stock(obj.pk, obj.on_hand, note=f'Stock count by {request.user}')
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'product', 'kind', 'on_hand_delta', 'reserved_delta', 'order', 'note')
+    list_filter = ('kind', 'created_at')
+    search_fields = ('product__name', 'note')
+    list_select_related = ('product', 'order')
+    ordering = ('-created_at', '-id')
+
+    # The ledger is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# Sales dashboard: the daily rollups (see freshmart.reports), never the orders themselves
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ('day', 'orders', 'units', 'revenue_display')
+    date_hierarchy = 'day'
+    ordering = ('-day',)
+    change_list_template = 'admin/freshmart/dailysales/change_list.html'
+
+    def revenue_display(self, obj):
+        return f"${obj.revenue:.2f}"
+    revenue_display.short_description = 'Revenue'
+    revenue_display.admin_order_field = 'revenue'
+
+    def changelist_view(self, request, extra_context=None):
+        start, end = parse_period()
+        extra_context = {
+            **(extra_context or {}),
+            'month_to_date': sales_report(start, end, by='category', limit=5),
+            'top_products': sales_report(start, end, by='product', limit=10)['rows'],
+        }
+        return super().changelist_view(request, extra_context)
+
+    # Rows are written by the rollup job only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 # # Optional: Customize Admin Site Header
 # admin.site.site_header = "FreshMart Administration"
 # admin.site.site_title = "FreshMart Admin"
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class FreshmartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'freshmart'
+
+    def ready(self):
+        # Cache invalidation and search index receivers, cart hand-over on login,
+        # giving back the stock held by deleted carts
+        from . import cart, inventory, signals  # noqa: F401
@@ -0,0 +1,226 @@
+import gzip
+import os
+import re
+from pathlib import Path
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+# Files worth pre-compressing, and the smallest one worth the extra request header
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.xml', '.html')
+MIN_COMPRESS_BYTES = 256
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # in order of preference
+
+# Only our own sources are minified; third-party assets (e.g. the admin's) are copied as they are
+MINIFY_PREFIXES = ('css/', 'js/')
+
+# ManifestStaticFilesStorage names files name.<12 hex digits>.ext
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+# After one of these (or a keyword below), "/" starts a regex rather than dividing
+REGEX_PREFIX = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'instanceof', 'new', 'void', 'delete', 'throw', 'yield', 'await'}
+
+
+def _skip_string(source, i, quote):
+    i += 1
+    while i < len(source) and source[i] != quote:
+        i += 2 if source[i] == '\\' else 1
+    return i + 1
+
+
+def _tighten_css(css):
+    css = re.sub(r'\s+', ' ', css)
+    # Whitespace next to these never matters (":" only after, for selectors like "a :hover")
+    css = re.sub(r' ?([{};,>]) ?', r'\1', css)
+    return css.replace(': ', ':').replace(';}', '}')
+
+
+def minify_css(source):
+    """Drop comments and collapse whitespace, leaving strings alone."""
+    out, code = [], []
+    i, n = 0, len(source)
+    while i < n:
+        ch = source[i]
+        if ch in '"\'':
+            end = _skip_string(source, i, ch)
+            out += [_tighten_css(''.join(code)), source[i:end]]
+            code = []
+            i = end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            code.append(' ')
+        else:
+            code.append(ch)
+            i += 1
+    out.append(_tighten_css(''.join(code)))
+    return ''.join(out).strip()
+
+
+def _skip_regex(source, i):
+    """End of the regex literal starting at i, or None if there is none (it would cross a line)."""
+    i += 1
+    in_class = False
+    while i < len(source) and (in_class or source[i] != '/'):
+        if source[i] == '\n':
+            return None
+        if source[i] == '\\':
+            i += 1
+        elif source[i] == '[':
+            in_class = True
+        elif source[i] == ']':
+            in_class = False
+        i += 1
+    if i >= len(source):
+        return None
+    i += 1
+    while i < len(source) and source[i].isalpha():  # flags
+        i += 1
+    return i
+
+
+def minify_js(source):
+    """
+    Conservative JavaScript minifier: drops comments, indentation and blank lines.
+
+    Line breaks are kept, so automatic semicolon insertion still sees the same
+    code; strings, template literals and regex literals are copied untouched.
+    """
+    out = []
+    i, n = 0, len(source)
+    templates = []  # brace depth of each ${ ... } we are inside
+    last = ''  # last significant token, to tell a regex from a division
+
+    def emit(text):
+        nonlocal last
+        # After a postfix ++ or -- a "/" divides ("++" before a regex would be a syntax error)
+        last = last + text if text in '+-' and last == text else text
+        out.append(text)
+
+    def space(newline):
+        # A run of whitespace and comments becomes one space, or one line break if it had one
+        if not out:
+            return
+        if out[-1] in (' ', '\n'):
+            if newline:
+                out[-1] = '\n'
+        else:
+            out.append('\n' if newline else ' ')
+
+    while i < n:
+        ch = source[i]
+        if ch in '"\'':
+            end = _skip_string(source, i, ch)
+            emit(source[i:end])
+            i = end
+        elif ch == '`' or (ch == '}' and templates and templates[-1] == 0):
+            # Template literal text, up to its end or the next ${
+            if ch == '}':
+                templates.pop()
+            end = i + 1
+            while end < n and source[end] != '`' and not source.startswith('${', end):
+                end += 2 if source[end] == '\\' else 1
+            if source.startswith('${', end):
+                templates.append(0)
+                end += 2
+            else:
+                end += 1
+            emit(source[i:end])
+            i = end
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            # A comment with a line break in it counts as one for semicolon insertion
+            space('\n' in source[i:end])
+            i = end
+        elif (ch == '/' and (not last or (last[-1] in REGEX_PREFIX and last not in ('++', '--'))
+                             or last in REGEX_KEYWORDS)
+              and _skip_regex(source, i) is not None):
+            end = _skip_regex(source, i)
+            emit(source[i:end])
+            i = end
+        elif ch.isspace():
+            start = i
+            while i < n and source[i].isspace():
+                i += 1
+            space('\n' in source[start:i])
+        elif ch.isalnum() or ch in '_$':
+            end = i
+            while end < n and (source[end].isalnum() or source[end] in '_$'):
+                end += 1
+            emit(source[i:end])
+            i = end
+        else:
+            if templates and ch == '{':
+                templates[-1] += 1
+            elif templates and ch == '}':
+                templates[-1] -= 1
+            emit(ch)
+            i += 1
+    if out and out[-1] in (' ', '\n'):
+        out.pop()
+    return ''.join(out) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def compress_file(path):
+    """Write path.gz (and path.br when the brotli package is installed) if it makes the file smaller."""
+    data = Path(path).read_bytes()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        variants['.br'] = brotli.compress(data, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            Path(f'{path}{suffix}').write_bytes(compressed)
+
+
+def precompressed(path, accept_encoding):
+    """The best pre-compressed variant of path the client accepts: (path, encoding or None)."""
+    for encoding, suffix in ENCODINGS:
+        if encoding in accept_encoding and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+class AssetStorage(ManifestStaticFilesStorage):
+    """
+    collectstatic storage that minifies CSS and JS, fingerprints every file
+    (name.<hash>.ext, recorded in staticfiles.json) and writes .gz/.br variants
+    next to the fingerprinted files for views.static_asset to serve.
+
+    Until collectstatic has been run there is no manifest, and {% static %}
+    falls back to the plain names so development and tests work as before.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def _save(self, name, content):
+        # Both the plain copy and the fingerprinted files go through here
+        minify = MINIFIERS.get(os.path.splitext(name)[1])
+        if minify and name.startswith(MINIFY_PREFIXES) and '.min.' not in name:
+            content.seek(0)
+            content = ContentFile(minify(content.read().decode('utf-8')).encode('utf-8'))
+        return super()._save(name, content)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        yield from super().post_process(paths, dry_run, **options)
+        for hashed_name in set(self.hashed_files.values()):
+            if hashed_name.endswith(COMPRESSIBLE):
+                compress_file(self.path(hashed_name))
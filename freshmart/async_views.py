@@ -0,0 +1,73 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_http_methods
+
+from .cache import cached_response, conditional_response
+from .cart import CartError, aget_cart, apply_changes, aread_cart, parse_changes
+from .catalog import CatalogError, aproduct_page, serialize_product
+from .inventory import InsufficientStock
+from .search import asearch_products
+from .views import listing_namespaces
+
+# Async versions of the catalog, search and cart endpoints in views.py, served in
+# their place under ASGI (FRESHMART_ASYNC_VIEWS, see urls.py). Reads go through the
+# async ORM, so a request waiting on the database doesn't hold a worker thread.
+# Writes still run in a thread: Django's transactions are sync-only.
+
+
+@conditional_response(listing_namespaces)
+@cached_response(listing_namespaces)
+async def catalog_api(request):
+    try:
+        rows, next_cursor = await aproduct_page(
+            category=request.GET.get('category'),
+            sort=request.GET.get('sort', 'default'),
+            cursor=request.GET.get('cursor'),
+            limit=request.GET.get('limit', 24),
+        )
+    except CatalogError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({
+        'results': [serialize_product(row) for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+
+@conditional_response(['products'])
+@cached_response(['products'])
+async def search_api(request):
+    try:
+        rows, next_cursor = await asearch_products(
+            request.GET.get('q', ''),
+            category=request.GET.get('category'),
+            cursor=request.GET.get('cursor'),
+            limit=request.GET.get('limit', 20),
+        )
+    except CatalogError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({
+        'results': [serialize_product(row) for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+
+@ensure_csrf_cookie
+@require_http_methods(['GET', 'POST'])
+async def cart_api(request):
+    if request.method == 'POST':
+        try:
+            changes = parse_changes(json.loads(request.body or b'{}'))
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc) if isinstance(exc, CartError) else 'Invalid JSON.'}, status=400)
+        if changes:
+            cart = await aget_cart(request, create=True)
+            try:
+                await sync_to_async(apply_changes)(cart.pk, changes)
+            except CartError as exc:
+                return JsonResponse({'error': str(exc)}, status=400)
+            except InsufficientStock as exc:
+                return JsonResponse({'error': str(exc), 'available': exc.available}, status=409)
+    return JsonResponse(await aread_cart(request))
@@ -0,0 +1,213 @@
+import json
+import threading
+from contextlib import contextmanager
+import time
+import urllib.request
+import uuid
+from urllib.error import HTTPError
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+
+from .cache import catalog_cache
+from .models import Category, Product
+from .warmup import local_host
+
+# Regressions past these are failures; below the floors a change is noise
+QUERY_SLACK = 0          # any extra query per request is a regression
+LATENCY_FLOOR_MS = 1.0   # p95 must also be this much slower in absolute terms
+STAFF_USERNAME = 'bench-admin'
+
+
+def bench_client():
+    # The test client's "testserver" host is only allowed while tests run
+    return Client(HTTP_HOST=local_host())
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the queries run in the block. (CaptureQueriesContext reads connection.queries,
+    which every request clears on request_started, so it undercounts across requests.)
+    """
+    counter = [0]
+
+    def wrapper(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+    with connection.execute_wrapper(wrapper):
+        yield counter
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 3) if ordered else 0.0
+    return {'p50_ms': at(0.50), 'p95_ms': at(0.95), 'p99_ms': at(0.99)}
+
+
+def staff_client():
+    user, _ = User.objects.get_or_create(username=STAFF_USERNAME, defaults={'is_staff': True, 'is_superuser': True})
+    client = bench_client()
+    client.force_login(user)
+    return client
+
+
+def scenarios():
+    """
+    name -> (needs staff, path) for the GET pages measured, built from the current data.
+    The order flow (cart update and checkout) is measured separately.
+    """
+    category = Category.objects.order_by('pk').values_list('pk', flat=True).first()
+    product = Product.objects.order_by('-review_count', 'pk').values_list('pk', 'name').first()
+    word = product[1].split()[1][:4] if product and len(product[1].split()) > 1 else 'fres'
+    return {
+        'home': (False, '/'),
+        'shop': (False, '/shop/'),
+        'catalog_api': (False, f'/api/products/?category={category}&sort=price-asc'),
+        'search_api': (False, f'/api/search/?q={word}'),
+        'product_detail': (False, f'/product/{product[0]}/' if product else '/product/1/'),
+        'admin_products': (True, '/admin/freshmart/product/'),
+        'admin_orders': (True, '/admin/freshmart/order/'),
+        'admin_reviews': (True, '/admin/freshmart/review/'),
+        'admin_sales': (True, '/admin/freshmart/dailysales/'),
+    }
+
+
+def clear_caches():
+    catalog_cache.clear()
+    cache.clear()
+
+
+def measure_page(client, path, requests):
+    """Query count of a cold request (empty caches), then latencies of `requests` warm ones."""
+    clear_caches()
+    with count_queries() as queries:
+        response = client.get(path)
+    if response.status_code != 200:
+        raise RuntimeError(f'GET {path} returned {response.status_code}')
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        client.get(path)
+        latencies.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+    return {'queries': queries[0], **percentiles(latencies), 'rps': round(requests / elapsed, 1)}
+
+
+def measure_order_flow(requests):
+    """A visitor adds three products to the cart and checks out: queries per order, latency per order."""
+    products = list(Product.objects.order_by('pk').values_list('pk', flat=True)[:3])
+    latencies, query_counts = [], []
+    started = time.perf_counter()
+    for _ in range(requests):
+        client = bench_client()
+        request_started = time.perf_counter()
+        with count_queries() as queries:
+            client.post('/api/cart/', json.dumps({'changes': [{'product': pk, 'delta': 1} for pk in products]}),
+                        content_type='application/json')
+            response = client.post('/api/checkout/', json.dumps({
+                'delivery_address': '1 Benchmark Road', 'phone_number': '+15550000000',
+            }), content_type='application/json', HTTP_IDEMPOTENCY_KEY=uuid.uuid4().hex)
+        latencies.append(time.perf_counter() - request_started)
+        query_counts.append(queries[0])
+        if response.status_code != 201:
+            raise RuntimeError(f'Checkout returned {response.status_code}: {response.content[:200]!r}')
+    elapsed = time.perf_counter() - started
+    return {'queries': max(query_counts), **percentiles(latencies), 'rps': round(requests / elapsed, 1)}
+
+
+def run_client_suite(requests=50, order_requests=None):
+    """Every scenario through the Django test client, in this process."""
+    anonymous, staff = bench_client(), staff_client()
+    results = {}
+    for name, (needs_staff, path) in scenarios().items():
+        results[name] = measure_page(staff if needs_staff else anonymous, path, requests)
+    results['order_flow'] = measure_order_flow(order_requests or max(1, requests // 5))
+    return results
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def run_http_suite(requests=500, concurrency=8, names=('home', 'shop', 'catalog_api', 'search_api',
+                                                        'product_detail', 'admin_products')):
+    """
+    The GET scenarios over real HTTP: a threaded WSGI server on a free local port,
+    driven by `concurrency` client threads, `requests` requests per scenario.
+    """
+    server = ThreadedWSGIServer(('127.0.0.1', 0), _QuietHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    session = staff_client().cookies['sessionid'].value
+    all_scenarios = scenarios()
+    results = {}
+    try:
+        for name in names:
+            needs_staff, path = all_scenarios[name]
+            headers = {'Cookie': f'sessionid={session}'} if needs_staff else {}
+            latencies, errors = [], []
+            remaining = iter(range(requests))
+            lock = threading.Lock()
+
+            def client():
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    request_started = time.perf_counter()
+                    try:
+                        with urllib.request.urlopen(urllib.request.Request(base + path, headers=headers)) as response:
+                            response.read()
+                    except HTTPError as exc:
+                        errors.append(exc.code)
+                    latencies.append(time.perf_counter() - request_started)
+
+            clients = [threading.Thread(target=client) for _ in range(concurrency)]
+            started = time.perf_counter()
+            for client_thread in clients:
+                client_thread.start()
+            for client_thread in clients:
+                client_thread.join()
+            elapsed = time.perf_counter() - started
+            if errors:
+                raise RuntimeError(f'GET {path} failed {len(errors)} times (e.g. HTTP {errors[0]})')
+            results[name] = {**percentiles(latencies), 'rps': round(requests / elapsed, 1)}
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def compare(baseline, current, threshold=0.25):
+    """
+    Regressions of `current` against `baseline` (both as produced by the suite), as
+    messages: any extra query, p95/p99 latency up by more than `threshold` (and
+    LATENCY_FLOOR_MS), or throughput down by more than `threshold`.
+    """
+    regressions = []
+    for section in ('client', 'http'):
+        for name, old in baseline.get(section, {}).items():
+            new = current.get(section, {}).get(name)
+            if new is None:
+                continue
+            label = f'{section}/{name}'
+            if 'queries' in old and new['queries'] > old['queries'] + QUERY_SLACK:
+                regressions.append(f"{label}: {new['queries']} queries (baseline {old['queries']})")
+            for metric in ('p95_ms', 'p99_ms'):
+                if new[metric] > old[metric] * (1 + threshold) and new[metric] - old[metric] > LATENCY_FLOOR_MS:
+                    regressions.append(f"{label}: {metric} {new[metric]:.1f} (baseline {old[metric]:.1f})")
+            if new['rps'] < old['rps'] * (1 - threshold):
+                regressions.append(f"{label}: {new['rps']:.0f} req/s (baseline {old['rps']:.0f})")
+    return regressions
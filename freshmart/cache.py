@@ -0,0 +1,311 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import has_vary_header, patch_cache_control
+from django.views.decorators.http import condition
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Small thread-safe per-process LRU map with a fixed number of entries."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    Per-process LRU in front of a shared Django cache backend, with versioned keys.
+
+    Every entry depends on one or more namespaces ("categories", "featured",
+    "category:3", "product:42", ...). Each namespace has a version number stored
+    in the shared cache and the entry key embeds the current versions, so bumping
+    a namespace makes every entry that depends on it unreachable at once, in all
+    processes, while entries depending on other namespaces keep hitting. Since
+    keys never get reused for new content, the local LRU can't serve stale data.
+    """
+
+    def __init__(self, alias='default', max_entries=256, timeout=3600, prefix='fm'):
+        self.alias = alias
+        self.local = LRUCache(max_entries)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.stats = Counter()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _version_key(self, namespace):
+        return f'{self.prefix}:v:{namespace}'
+
+    def _modified_key(self, namespace):
+        return f'{self.prefix}:t:{namespace}'
+
+    def versions(self, namespaces):
+        keys = [self._version_key(ns) for ns in namespaces]
+        found = self.shared.get_many(keys)
+        missing = {key: time.time_ns() for key in keys if key not in found}
+        if missing:
+            # Start unknown (or evicted) namespaces at a fresh value so old keys are never reused
+            self.shared.set_many(missing, timeout=None)
+            found.update(missing)
+        return [found[key] for key in keys]
+
+    def state(self, namespaces):
+        """(versions, last change timestamp) of the namespaces, from one shared-cache read."""
+        version_keys = [self._version_key(ns) for ns in namespaces]
+        modified_keys = [self._modified_key(ns) for ns in namespaces]
+        found = self.shared.get_many(version_keys + modified_keys)
+        now = time.time()
+        missing = {key: time.time_ns() for key in version_keys if key not in found}
+        # An unknown change time counts as "now": clients just fetch the page once more
+        missing.update({key: now for key in modified_keys if key not in found})
+        if missing:
+            self.shared.set_many(missing, timeout=None)
+            found.update(missing)
+        return [found[key] for key in version_keys], max(found[key] for key in modified_keys)
+
+    def make_key(self, name, namespaces, *parts):
+        raw = repr((self.versions(namespaces), parts))
+        return f'{self.prefix}:{name}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def find(self, name, namespaces, *parts):
+        """(key, cached value or _MISSING): the lookup half of get_or_set."""
+        key = self.make_key(name, namespaces, *parts)
+        value = self.local.get(key)
+        if value is not _MISSING:
+            self.stats['local_hits'] += 1
+            return key, value
+        value = self.shared.get(key, _MISSING)
+        if value is not _MISSING:
+            self.stats['shared_hits'] += 1
+            self.local.set(key, value)
+        else:
+            self.stats['misses'] += 1
+        return key, value
+
+    def store(self, key, value):
+        self.shared.set(key, value, self.timeout)
+        self.local.set(key, value)
+
+    def get_or_set(self, name, namespaces, builder, *parts):
+        # A builder may return None to say "don't cache this one"
+        key, value = self.find(name, namespaces, *parts)
+        if value is _MISSING:
+            value = builder()
+            if value is not None:
+                self.store(key, value)
+        return value
+
+    async def aget_or_set(self, name, namespaces, builder, *parts):
+        # For async views: `builder` is a coroutine function. The shared backend may do
+        # network I/O, so it is used from a worker thread rather than the event loop.
+        key, value = await sync_to_async(self.find, thread_sensitive=False)(name, namespaces, *parts)
+        if value is _MISSING:
+            value = await builder()
+            if value is not None:
+                await sync_to_async(self.store, thread_sensitive=False)(key, value)
+        return value
+
+    def bump(self, *namespaces):
+        now = time.time()
+        for namespace in set(namespaces):
+            key = self._version_key(namespace)
+            try:
+                self.shared.incr(key)
+            except ValueError:
+                self.shared.set(key, time.time_ns(), timeout=None)
+            self.stats['invalidations'] += 1
+        self.shared.set_many({self._modified_key(ns): now for ns in namespaces}, timeout=None)
+
+    def snapshot(self):
+        hits = self.stats['local_hits'] + self.stats['shared_hits']
+        lookups = hits + self.stats['misses']
+        return {
+            **{name: self.stats[name] for name in ('local_hits', 'shared_hits', 'misses', 'invalidations')},
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+            'local_entries': len(self.local),
+        }
+
+    def clear(self):
+        self.local.clear()
+        self.stats.clear()
+
+
+catalog_cache = TieredCache(
+    max_entries=getattr(settings, 'FRESHMART_CACHE_LOCAL_ENTRIES', 256),
+    timeout=getattr(settings, 'FRESHMART_CACHE_TIMEOUT', 3600),
+)
+
+
+def cacheable(request):
+    # Logged-in users and pending flash messages change the page header
+    return request.method == 'GET' and not request.user.is_authenticated and not len(get_messages(request))
+
+
+def cached_response(namespaces):
+    """
+    Cache a view's full response for anonymous GET requests.
+
+    `namespaces` is a list, or a callable taking the view arguments and returning
+    one. Logged-in users and requests with pending flash messages always get a
+    fresh render, since the page header differs for them. Async views are
+    supported; the checks that may load the session or user run in a thread.
+
+    Responses that are per visitor are not stored: those that used the CSRF token
+    (the cached page would carry one visitor's token to everyone, and no cookie),
+    set cookies or vary on Cookie. A hit replays the stored headers with the content.
+    """
+    def depends_on(request, *args, **kwargs):
+        return namespaces(request, *args, **kwargs) if callable(namespaces) else namespaces
+
+    def to_cache(request, response):
+        if response.status_code != 200:
+            return None
+        if hasattr(response, 'render'):
+            response.render()
+        # CSRF_COOKIE_USED is what Django before 4.1 set instead
+        if (request.META.get('CSRF_COOKIE_NEEDS_UPDATE') or request.META.get('CSRF_COOKIE_USED')
+                or response.cookies or has_vary_header(response, 'Cookie')):
+            return None
+        return (response.content, list(response.items()))
+
+    def from_cache(cached):
+        content, headers = cached
+        response = HttpResponse(content)
+        for header, value in headers:
+            response[header] = value
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def decorator(view):
+        name = f'page:{view.__name__}'
+
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                def lookup():
+                    if not cacheable(request):
+                        return None
+                    return catalog_cache.find(name, depends_on(request, *args, **kwargs), request.get_full_path())
+
+                found = await sync_to_async(lookup)()
+                if found is None:
+                    return await view(request, *args, **kwargs)
+                key, cached = found
+                if cached is not _MISSING:
+                    return from_cache(cached)
+                response = await view(request, *args, **kwargs)
+                value = to_cache(request, response)
+                if value is not None:
+                    await sync_to_async(catalog_cache.store, thread_sensitive=False)(key, value)
+                response['X-Cache'] = 'MISS'
+                return response
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not cacheable(request):
+                return view(request, *args, **kwargs)
+            rendered = {}
+
+            def build():
+                rendered['response'] = view(request, *args, **kwargs)
+                return to_cache(request, rendered['response'])
+
+            cached = catalog_cache.get_or_set(name, depends_on(request, *args, **kwargs), build, request.get_full_path())
+            if 'response' in rendered:
+                response = rendered['response']
+                response['X-Cache'] = 'MISS'
+                return response
+            return from_cache(cached)
+        return wrapper
+    return decorator
+
+
+def conditional_response(namespaces):
+    """
+    Answer conditional GETs of a catalog view without running it.
+
+    The ETag comes from the versions of the namespaces the response depends on
+    (plus its URL and FRESHMART_RELEASE), Last-Modified from when they last
+    changed; both are read from the shared cache, not the database. A client
+    or CDN holding the current copy gets 304 Not Modified before the view, its
+    templates or its queries run. `namespaces` is as for cached_response, and
+    as there, only anonymous requests without flash messages are covered, and
+    async views are supported.
+    """
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, '_catalog_validators'):
+            request._catalog_validators = (None, None)
+            if (request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+                    and not len(get_messages(request))):
+                depends_on = namespaces(request, *args, **kwargs) if callable(namespaces) else namespaces
+                versions, modified = catalog_cache.state(depends_on)
+                raw = repr((versions, request.get_full_path(), getattr(settings, 'FRESHMART_RELEASE', '')))
+                request._catalog_validators = (
+                    hashlib.md5(raw.encode()).hexdigest(),
+                    datetime.fromtimestamp(modified, timezone.utc),
+                )
+        return request._catalog_validators
+
+    def decorator(view):
+        conditional = condition(
+            etag_func=lambda *args, **kwargs: validators(*args, **kwargs)[0],
+            last_modified_func=lambda *args, **kwargs: validators(*args, **kwargs)[1],
+        )(view)
+
+        def finish(response):
+            if response.has_header('ETag'):
+                # Caches may keep it, but must check back with the validators before reuse
+                patch_cache_control(response, no_cache=True)
+            return response
+
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # Computed (and kept on the request) in a thread: it may load the session and user
+                await sync_to_async(validators)(request, *args, **kwargs)
+                return finish(await conditional(request, *args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return finish(conditional(request, *args, **kwargs))
+        return wrapper
+    return decorator
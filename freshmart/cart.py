@@ -0,0 +1,228 @@
+from decimal import Decimal
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.dispatch import receiver
+
+from .cache import catalog_cache
+from .db import serialized_write
+from .images import rendition_url
+from .inventory import InsufficientStock, reserve
+from .models import Order, OrderItem, Product, recalculate_order_totals
+from .signals import invalidate
+
+# The cart is the visitor's open Order (completed=False). Its id is kept in the
+# session, so anonymous visitors get a cart too; it is claimed by the user on login.
+SESSION_KEY = 'cart_id'
+MAX_QUANTITY = 99
+MAX_CHANGES = 100
+
+
+class CartError(ValueError):
+    """Raised for a malformed cart update or one naming an unknown product."""
+
+
+def parse_changes(data):
+    """
+    Coalesce a batch of cart changes into {product_id: (quantity or None, delta)}.
+
+    Each change is {"product": id, "delta": n} or {"product": id, "quantity": n};
+    a quantity replaces whatever came before it for that product, later deltas add up.
+    """
+    changes = data.get('changes') if isinstance(data, dict) else None
+    if not isinstance(changes, list) or len(changes) > MAX_CHANGES:
+        raise CartError(f'Expected "changes": a list of at most {MAX_CHANGES} changes.')
+    merged = {}
+    for change in changes:
+        try:
+            product_id = int(change['product'])
+            if 'quantity' in change:
+                merged[product_id] = (int(change['quantity']), 0)
+            else:
+                quantity, delta = merged.get(product_id, (None, 0))
+                merged[product_id] = (quantity, delta + int(change['delta']))
+        except (KeyError, TypeError, ValueError):
+            raise CartError(f'Invalid change {change!r}.')
+    return merged
+
+
+def _cart_query(user, cart_id):
+    if user is not None:
+        return Order.objects.filter(user=user, completed=False).order_by('-pk')
+    if cart_id:
+        return Order.objects.filter(pk=cart_id, completed=False, user__isnull=True)
+    return None
+
+
+def get_cart(request, create=False):
+    """Return the visitor's open Order, creating it if asked to, or None."""
+    user = request.user if request.user.is_authenticated else None
+    cart_id = request.session.get(SESSION_KEY)
+    query = _cart_query(user, cart_id)
+    cart = query.first() if query is not None else None
+    if cart is None and create:
+        cart = Order.objects.create(user=user)
+    if cart is None:
+        request.session.pop(SESSION_KEY, None)
+    elif cart.pk != cart_id:
+        request.session[SESSION_KEY] = cart.pk
+    return cart
+
+
+async def aget_cart(request, create=False):
+    user = await request.auser()
+    user = user if user.is_authenticated else None
+    cart_id = await request.session.aget(SESSION_KEY)
+    query = _cart_query(user, cart_id)
+    cart = await query.afirst() if query is not None else None
+    if cart is None and create:
+        cart = await Order.objects.acreate(user=user)
+    if cart is None:
+        await request.session.apop(SESSION_KEY, None)
+    elif cart.pk != cart_id:
+        await request.session.aset(SESSION_KEY, cart.pk)
+    return cart
+
+
+@serialized_write
+def apply_changes(cart_id, changes):
+    """
+    Apply coalesced changes to a cart in one transaction and re-price it.
+
+    Reads the affected items and prices in two queries, then writes with one
+    bulk_update and one bulk_create whatever the size of the batch. Stock of
+    tracked products is reserved to match (raises InsufficientStock).
+    """
+    if not Order.objects.filter(pk=cart_id, completed=False).exists():
+        raise CartError('This cart has already been checked out.')
+    prices = dict(Product.objects.filter(pk__in=changes).values_list('pk', 'price'))
+    unknown = set(changes) - set(prices)
+    if unknown:
+        raise CartError(f"Unknown product(s): {', '.join(map(str, sorted(unknown)))}.")
+    items = {}
+    for item in OrderItem.objects.filter(order_id=cart_id, product_id__in=changes):
+        items.setdefault(item.product_id, item)
+
+    to_create, to_update, to_delete = [], [], []
+    quantities = {}
+    for product_id, (quantity, delta) in changes.items():
+        item = items.get(product_id)
+        if quantity is None:
+            quantity = item.quantity if item else 0
+        quantity = quantities[product_id] = max(0, min(MAX_QUANTITY, quantity + delta))
+        if item is None:
+            if quantity:
+                to_create.append(OrderItem(order_id=cart_id, product_id=product_id,
+                                           quantity=quantity, unit_price=prices[product_id]))
+        elif quantity == 0:
+            to_delete.append(item.pk)
+        elif quantity != item.quantity:
+            item.quantity = quantity
+            to_update.append(item)
+
+    reserve(cart_id, quantities)
+    if to_delete:
+        OrderItem.objects.filter(pk__in=to_delete).delete()
+    OrderItem.objects.bulk_update(to_update, ['quantity'])
+    OrderItem.objects.bulk_create(to_create)
+    # Re-price every line at the current product price, then refresh the stored totals
+    current_price = Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1]
+    OrderItem.objects.filter(order_id=cart_id).update(unit_price=Subquery(current_price))
+    recalculate_order_totals([cart_id])
+    invalidate(f'cart:{cart_id}')
+
+
+def empty_cart():
+    return {'id': None, 'items': [], 'item_count': 0, 'total': 0.0}
+
+
+def _cart_rows(cart_id):
+    return (
+        OrderItem.objects.filter(order_id=cart_id, order__completed=False)
+        .order_by('pk')
+        .values('product_id', 'quantity', 'product__name', 'product__price', 'product__image_url',
+                'product__image_hash')
+    )
+
+
+def _payload(cart_id, rows):
+    items, total = [], Decimal('0')
+    for row in rows:
+        line_total = row['product__price'] * row['quantity']
+        total += line_total
+        items.append({
+            'id': row['product_id'],
+            'name': row['product__name'],
+            'price': float(row['product__price']),
+            'imageSrc': rendition_url(row['product_id'], row['product__image_url'],
+                                      row['product__image_hash'], 'thumb'),
+            'quantity': row['quantity'],
+            'lineTotal': float(line_total),
+        })
+    return {
+        'id': cart_id,
+        'items': items,
+        'item_count': sum(item['quantity'] for item in items),
+        'total': float(total),
+    }
+
+
+def cart_payload(cart_id):
+    return _payload(cart_id, _cart_rows(cart_id))
+
+
+async def acart_payload(cart_id):
+    return _payload(cart_id, [row async for row in _cart_rows(cart_id)])
+
+
+def read_cart(request):
+    """The visitor's cart priced at current prices, cached until it or any product changes."""
+    cart_id = request.session.get(SESSION_KEY)
+    if cart_id is None and request.user.is_authenticated:
+        cart = get_cart(request)
+        cart_id = cart.pk if cart else None
+    if cart_id is None:
+        return empty_cart()
+    return catalog_cache.get_or_set('cart', [f'cart:{cart_id}', 'products'], lambda: cart_payload(cart_id), cart_id)
+
+
+async def aread_cart(request):
+    cart_id = await request.session.aget(SESSION_KEY)
+    if cart_id is None and (await request.auser()).is_authenticated:
+        cart = await aget_cart(request)
+        cart_id = cart.pk if cart else None
+    if cart_id is None:
+        return empty_cart()
+    return await catalog_cache.aget_or_set('cart', [f'cart:{cart_id}', 'products'],
+                                           lambda: acart_payload(cart_id), cart_id)
+
+
+@receiver(user_logged_in)
+def claim_cart_on_login(sender, request, user, **kwargs):
+    """Hand the anonymous cart to the user who logged in, merged into their open cart if they have one."""
+    if request is None or not hasattr(request, 'session'):
+        return
+    cart_id = request.session.get(SESSION_KEY)
+    guest = Order.objects.filter(pk=cart_id, completed=False, user__isnull=True).first() if cart_id else None
+    own = Order.objects.filter(user=user, completed=False).order_by('-pk').first()
+    if guest is None:
+        if own is not None:
+            request.session[SESSION_KEY] = own.pk
+        else:
+            request.session.pop(SESSION_KEY, None)
+    elif own is None:
+        guest.user = user
+        guest.save(update_fields=['user'])
+    else:
+        changes = {product_id: (None, quantity)
+                   for product_id, quantity in guest.items.values_list('product_id', 'quantity')}
+        with transaction.atomic():
+            guest.delete()  # Gives back its reserved stock, for the merged cart to reserve again
+            if changes:
+                try:
+                    apply_changes(own.pk, changes)
+                except InsufficientStock as exc:
+                    # Merge what is left of the products that ran short
+                    apply_changes(own.pk, {**changes, **{pk: (units, 0) for pk, units in exc.available.items()}})
+        request.session[SESSION_KEY] = own.pk
@@ -0,0 +1,158 @@
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+from .images import rendition_url
+from .models import Category, Product
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Sort modes used by the shop page (same values as the <select id="sort-options">).
+# Each one maps to (field, descending). The primary key is always the tie breaker,
+# so the (field, id) pair is unique and can be used as a keyset cursor.
+SORTS = {
+    'default': ('id', False),
+    'price-asc': ('price', False),
+    'price-desc': ('price', True),
+    'name-asc': ('name', False),
+    'name-desc': ('name', True),
+}
+
+# Only the columns the storefront cards need, so pages come straight from the index + row
+CARD_FIELDS = (
+    'id', 'name', 'price', 'description', 'image_url', 'image_hash', 'category__name',
+    'review_count', 'rating_sum',
+)
+
+
+class CatalogError(ValueError):
+    """Raised for a bad sort, category or cursor in a catalog request."""
+
+
+def encode_cursor(sort, row):
+    field, _ = SORTS[sort]
+    value = row[field]
+    if isinstance(value, Decimal):
+        value = str(value)
+    payload = json.dumps([value, row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    field, _ = SORTS[sort]
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id = int(last_id)
+        if field == 'price':
+            value = Decimal(value)
+        elif field == 'id':
+            value = int(value)
+        elif not isinstance(value, str):
+            raise TypeError(value)
+    except (binascii.Error, InvalidOperation, TypeError, ValueError):
+        raise CatalogError('Invalid cursor.')
+    return value, last_id
+
+
+def _category_lookup(value):
+    if value.isdigit():
+        return {'pk': int(value)}
+    return {'name__iexact': value}
+
+
+def resolve_category(value):
+    """Accept a category id or (case-insensitive) name and return its id."""
+    if not value or value == 'all':
+        return None
+    category_id = Category.objects.filter(**_category_lookup(value)).values_list('pk', flat=True).first()
+    if category_id is None:
+        raise CatalogError(f'Unknown category "{value}".')
+    return category_id
+
+
+async def aresolve_category(value):
+    if not value or value == 'all':
+        return None
+    category_id = await Category.objects.filter(**_category_lookup(value)).values_list('pk', flat=True).afirst()
+    if category_id is None:
+        raise CatalogError(f'Unknown category "{value}".')
+    return category_id
+
+
+def after_cursor(field, descending, value, last_id):
+    """
+    Keyset predicate for "rows after (value, last_id)" in the given order.
+
+    Written as `field >= value AND (field > value OR id > last_id)` so SQLite can
+    seek straight into the (field, id) index instead of scanning past skipped rows.
+    """
+    if field == 'id':
+        return Q(id__lt=last_id) if descending else Q(id__gt=last_id)
+    if descending:
+        return Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(id__lt=last_id))
+    return Q(**{f'{field}__gte': value}) & (Q(**{f'{field}__gt': value}) | Q(id__gt=last_id))
+
+
+def _page_query(category_id, sort, cursor, limit):
+    if sort not in SORTS:
+        raise CatalogError(f'Unknown sort "{sort}".')
+    try:
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise CatalogError('Invalid limit.')
+    field, descending = SORTS[sort]
+
+    queryset = Product.objects.all()
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+    if cursor:
+        value, last_id = decode_cursor(sort, cursor)
+        queryset = queryset.filter(after_cursor(field, descending, value, last_id))
+
+    prefix = '-' if descending else ''
+    ordering = [f'{prefix}{field}'] if field == 'id' else [f'{prefix}{field}', f'{prefix}id']
+    return queryset.order_by(*ordering).values(*CARD_FIELDS)[:limit + 1], limit
+
+
+def _page(rows, sort, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, rows[-1])
+    return rows, next_cursor
+
+
+def product_page(category=None, sort='default', cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of products as (rows, next_cursor).
+
+    Every page is a single indexed range query of `limit + 1` rows, so asking for
+    page 500 costs the same as asking for page 1.
+    """
+    queryset, limit = _page_query(resolve_category(category), sort, cursor, limit)
+    return _page(list(queryset), sort, limit)
+
+
+async def aproduct_page(category=None, sort='default', cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """product_page for async views, through the async ORM."""
+    queryset, limit = _page_query(await aresolve_category(category), sort, cursor, limit)
+    return _page([row async for row in queryset], sort, limit)
+
+
+def serialize_product(row):
+    # The product objects script.js renders cards, the detail modal and the cart from
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'category': row['category__name'].lower(),
+        'price': float(row['price']),
+        'description': row['description'],
+        'imageSrc': rendition_url(row['id'], row['image_url'], row['image_hash'], 'card'),
+        'reviewCount': row['review_count'],
+        'rating': round(row['rating_sum'] / row['review_count'], 2) if row['review_count'] else None,
+    }
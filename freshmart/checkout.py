@@ -0,0 +1,107 @@
+import logging
+
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .cart import MAX_QUANTITY
+from .db import serialized_write
+from .inventory import InsufficientStock, commit
+from .models import IdempotencyKey, Order, OrderItem, Product, recalculate_order_totals
+from .rankings import update_rankings
+from .reports import INLINE_ROLLUP_ORDERS, roll_up
+from .signals import invalidate
+
+MAX_KEY_LENGTH = 64
+
+log = logging.getLogger('freshmart.checkout')
+
+
+class CheckoutError(ValueError):
+    """Raised when a cart can't be checked out; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def request_owner(request):
+    # Idempotency keys are scoped per customer, so one customer can't replay another's response
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'session:{request.session.session_key or ""}'
+
+
+def find_replay(owner, key):
+    """(status_code, response) recorded for this key, or None if it hasn't been used."""
+    return IdempotencyKey.objects.filter(owner=owner, key=key).values_list('status_code', 'response').first()
+
+
+def complete_order(cart_id, owner, key, details):
+    """
+    Check out a cart in one short transaction; returns (status_code, response, replayed).
+    Once it has committed, the order is added to the sales rollups and rankings.
+    """
+    status, response, replayed = _complete_order(cart_id, owner, key, details)
+    if not replayed:
+        roll_up_sales()
+    return status, response, replayed
+
+
+def roll_up_sales():
+    """
+    Add the orders completed since the last rollup (normally just this one) to the sales
+    rollups and rankings, in transactions of their own after the checkout's. A failure
+    is logged, not raised: the order stands, and `manage.py rollup_sales` catches up.
+    """
+    try:
+        _, product_ids = roll_up(max_orders=INLINE_ROLLUP_ORDERS)
+        serialized_write(update_rankings)(product_ids)
+    except Exception:
+        log.exception('Rolling up sales after a checkout failed')
+
+
+@serialized_write
+def _complete_order(cart_id, owner, key, details):
+    """
+    The checkout transaction.
+
+    Everything that doesn't need the write lock (form validation, finding the
+    cart) happens before this is called; inside, it is a handful of single-row
+    or single-order statements. The key is checked again under the lock, so a
+    concurrent duplicate of the same request gets the first one's response
+    instead of running twice, and the conditional UPDATE on completed=False
+    makes sure a cart is only ever completed once.
+    """
+    replay = find_replay(owner, key)
+    if replay is not None:
+        return (*replay, True)
+
+    completed = Order.objects.filter(pk=cart_id, completed=False).update(
+        completed=True, completed_at=timezone.now(), **details,
+    )
+    if not completed:
+        raise CheckoutError('This cart has already been checked out.', status=409)
+
+    # Re-price at the current product prices and validate what is being bought
+    items = OrderItem.objects.filter(order_id=cart_id)
+    current_price = Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1]
+    items.update(unit_price=Subquery(current_price))
+    check = items.aggregate(
+        lines=Count('pk'),
+        invalid=Count('pk', filter=Q(quantity__lt=1) | Q(quantity__gt=MAX_QUANTITY) | Q(unit_price__lte=0)),
+    )
+    if not check['lines']:
+        raise CheckoutError('Your cart is empty.')
+    if check['invalid']:
+        raise CheckoutError('Your cart has items that can no longer be ordered.')
+    try:
+        commit(cart_id)  # Stock: the conditional UPDATE refuses to oversell
+    except InsufficientStock as exc:
+        raise CheckoutError(str(exc), status=409)
+    recalculate_order_totals([cart_id])
+
+    item_count, total = Order.objects.values_list('item_count', 'total').get(pk=cart_id)
+    response = {'order': cart_id, 'status': 'completed', 'item_count': item_count, 'total': str(total)}
+    IdempotencyKey.objects.create(owner=owner, key=key, order_id=cart_id, status_code=201, response=response)
+    invalidate(f'cart:{cart_id}')
+    return 201, response, False
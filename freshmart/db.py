@@ -0,0 +1,69 @@
+import functools
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+
+# Writers in this process queue on a lock instead of all contending for SQLite's
+# write lock, whose busy handler polls with sleeps of up to 100ms; SQLite's own
+# locking then only has to arbitrate between processes
+_write_lock = threading.Lock()
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database table is locked' in message or 'busy' in message
+
+
+def serialized_write(func=None, *, using='default', retries=None, backoff=None):
+    """
+    Run `func` in its own transaction, retrying when SQLite says the database is locked.
+
+    With transaction_mode IMMEDIATE the write lock is taken at BEGIN, so a lock
+    error means busy_timeout ran out while other writers held it; backing off and
+    trying again lets bursts of writes queue up instead of failing. `func` must be
+    safe to re-run. Inside an existing transaction it runs once in a savepoint,
+    so an exception still undoes its writes, since only the outermost transaction
+    can be retried.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if connections[using].in_atomic_block:
+                with transaction.atomic(using=using):
+                    return func(*args, **kwargs)
+            attempts = settings.FRESHMART_WRITE_RETRIES if retries is None else retries
+            delay = settings.FRESHMART_WRITE_BACKOFF if backoff is None else backoff
+            for attempt in range(attempts + 1):
+                try:
+                    with _write_lock, transaction.atomic(using=using):
+                        return func(*args, **kwargs)
+                except OperationalError as exc:
+                    if attempt == attempts or not is_lock_error(exc):
+                        raise
+                time.sleep(delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+        return wrapper
+    return decorator(func) if func is not None else decorator
+
+
+def add_counts(model, key_fields, count_fields, rows, using='default', batch_size=500):
+    """
+    Add to counter columns, creating the rows that don't exist yet.
+
+    `rows` are tuples of key values followed by count values. Each batch is one
+    INSERT ... ON CONFLICT (keys) DO UPDATE SET n = n + excluded.n, so nothing
+    is read back first. `key_fields` must be covered by a unique constraint.
+    """
+    table = model._meta.db_table
+    keys = [model._meta.get_field(name).column for name in key_fields]
+    counts = [model._meta.get_field(name).column for name in count_fields]
+    columns = ', '.join(keys + counts)
+    values = ', '.join(['%s'] * (len(keys) + len(counts)))
+    sets = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in counts)
+    sql = f'INSERT INTO {table} ({columns}) VALUES ({values}) ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {sets}'
+    rows = list(rows)
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
@@ -0,0 +1,177 @@
+import csv
+import json
+import zlib
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import ContactMessage, Order, OrderItem, Review
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() just returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+# Every export returns a queryset ready for .iterator(chunk_size=...): related rows come
+# from select_related joins or from one prefetch query per chunk, never one per row.
+def order_queryset(queryset):
+    items = OrderItem.objects.select_related('product').only(
+        'order_id', 'product_id', 'product__name', 'quantity', 'unit_price',
+    )
+    return (
+        queryset.select_related('user')
+        .only('created_at', 'completed', 'item_count', 'total', 'user__username', 'user__email')
+        .prefetch_related(Prefetch('items', queryset=items))
+        .order_by('pk')
+    )
+
+
+def order_record(order):
+    return {
+        'order_id': order.pk,
+        'created_at': order.created_at.isoformat(),
+        'completed': order.completed,
+        'customer': order.user.username if order.user else '',
+        'email': order.user.email if order.user else '',
+        'item_count': order.item_count,
+        'total': str(order.total),
+        'items': [
+            {
+                'product_id': item.product_id,
+                'product': item.product.name,
+                'quantity': item.quantity,
+                'unit_price': str(item.unit_price),
+                'line_total': str(item.line_total),
+            }
+            for item in order.items.all()
+        ],
+    }
+
+
+def order_csv_rows(record):
+    # One CSV row per order line; orders without lines still get one row
+    order = {key: value for key, value in record.items() if key != 'items'}
+    for item in record['items'] or [{}]:
+        yield {**order, **item}
+
+
+def review_queryset(queryset):
+    return (
+        queryset.select_related('product', 'user')
+        .only('name', 'rating', 'comment', 'created_at', 'product__name', 'user__username')
+        .order_by('pk')
+    )
+
+
+def review_record(review):
+    return {
+        'review_id': review.pk,
+        'created_at': review.created_at.isoformat(),
+        'product_id': review.product_id,
+        'product': review.product.name,
+        'name': review.name,
+        'username': review.user.username if review.user else '',
+        'rating': review.rating,
+        'comment': review.comment,
+    }
+
+
+def contact_queryset(queryset):
+    return queryset.order_by('pk')
+
+
+def contact_record(message):
+    return {
+        'message_id': message.pk,
+        'created_at': message.created_at.isoformat(),
+        'name': message.name,
+        'email': message.email,
+        'message': message.message,
+    }
+
+
+# name -> (model, queryset preparer, record builder, CSV columns, CSV row splitter)
+EXPORTS = {
+    'orders': (
+        Order, order_queryset, order_record,
+        ['order_id', 'created_at', 'completed', 'customer', 'email', 'item_count', 'total',
+         'product_id', 'product', 'quantity', 'unit_price', 'line_total'],
+        order_csv_rows,
+    ),
+    'reviews': (
+        Review, review_queryset, review_record,
+        ['review_id', 'created_at', 'product_id', 'product', 'name', 'username', 'rating', 'comment'],
+        None,
+    ),
+    'contacts': (
+        ContactMessage, contact_queryset, contact_record,
+        ['message_id', 'created_at', 'name', 'email', 'message'],
+        None,
+    ),
+}
+
+EXPORT_NAMES = {model: name for name, (model, *_rest) in EXPORTS.items()}
+
+
+def export_lines(name, queryset=None, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the export of `queryset` (default: every row) as text, a line at a time."""
+    model, prepare, to_record, columns, split_rows = EXPORTS[name]
+    if queryset is None:
+        queryset = model.objects.all()
+    records = (to_record(obj) for obj in prepare(queryset).iterator(chunk_size=chunk_size))
+
+    if fmt == 'jsonl':
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+        return
+
+    writer = csv.DictWriter(Echo(), fieldnames=columns, extrasaction='ignore')
+    yield writer.writeheader()
+    for record in records:
+        for row in (split_rows(record) if split_rows else [record]):
+            yield writer.writerow(row)
+
+
+def encode(lines, compress=False, buffer_size=64 * 1024):
+    """Encode lines to bytes, buffered into ~64KB pieces and optionally gzip-compressed on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: gzip container
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            chunk = b''.join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b''.join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_filename(name, fmt, compress=False):
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    return f"freshmart-{name}-{stamp}.{fmt}{'.gz' if compress else ''}"
+
+
+def streaming_export_response(queryset, fmt='csv', compress=False):
+    name = EXPORT_NAMES[queryset.model]
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if compress:
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(
+        encode(export_lines(name, queryset, fmt), compress=compress),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(name, fmt, compress)}"'
+    return response
@@ -0,0 +1,208 @@
+import csv
+import gzip
+import hashlib
+import json
+import os
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Category, Product
+
+# Sitemaps and product feeds are files under FRESHMART_FEED_ROOT, written by
+# `manage.py build_catalog_files` and served as they are (views.catalog_file, or the web
+# server in front), so a crawler never costs a query:
+#   sitemap.xml                          index of the sitemaps below
+#   sitemaps/pages.xml.gz                home, shop, contact
+#   sitemaps/products-<n>.xml.gz         product pages of shard n
+#   feeds/products-<n>.csv.gz, .jsonl.gz the product feed of shard n
+#   feeds/index.json                     the feed shards, for partners
+# Shard n holds the products with ids n * SHARD_SIZE to (n + 1) * SHARD_SIZE - 1, so a
+# product never moves between shards. Each shard's signature (product count, latest
+# updated_at, a digest of the ids of those sold out) is kept in manifest.json; a run
+# rewrites only the shards whose signature changed, all of them if a category changed.
+SHARD_SIZE = 10_000  # sitemaps may list up to 50,000 URLs
+FORMAT_VERSION = 2
+MANIFEST = 'manifest.json'
+FEED_COLUMNS = [
+    'id', 'sku', 'title', 'description', 'link', 'image_link', 'price', 'category',
+    'availability', 'rating', 'review_count', 'updated_at',
+]
+PAGES = ['freshmart:home', 'freshmart:shop', 'freshmart:contact']
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+@contextmanager
+def publish(path, compress=True):
+    """
+    A text file for writing `path`: it is written beside it under a temporary name and
+    renamed over it on success, so readers see the old file or the new one, never part of one.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        if compress:
+            f = gzip.open(tmp, 'wt', encoding='utf-8', newline='', compresslevel=6)
+        else:
+            f = open(tmp, 'w', encoding='utf-8', newline='')
+        with f:
+            yield f
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def absolute(path):
+    return settings.FRESHMART_SITE_URL.rstrip('/') + path
+
+
+def shard_files(shard):
+    return [f'sitemaps/products-{shard:04d}.xml.gz', f'feeds/products-{shard:04d}.csv.gz',
+            f'feeds/products-{shard:04d}.jsonl.gz']
+
+
+def shard_signatures():
+    """
+    {shard: [products, latest updated_at, digest of the sold out ids]}, from one grouped
+    query and one over the sold out products. Stock changes don't touch updated_at, and
+    unlike a sum of ids the digest changes whenever the set of sold out products does.
+    """
+    rows = (
+        Product.objects.order_by().annotate(shard=F('pk') / SHARD_SIZE).values('shard')
+        .annotate(products=Count('pk'), latest=Max('updated_at'))
+    )
+    sold_out = {}
+    for pk in (Product.objects.filter(stock__on_hand__lte=F('stock__reserved')).order_by('pk')
+               .values_list('pk', flat=True).iterator(chunk_size=10_000)):
+        sold_out.setdefault(pk // SHARD_SIZE, hashlib.sha1()).update(b'%d,' % pk)
+    return {
+        row['shard']: [row['products'], row['latest'].isoformat(),
+                       sold_out[row['shard']].hexdigest() if row['shard'] in sold_out else '']
+        for row in rows
+    }
+
+
+def feed_record(row):
+    available = row['stock__on_hand'] is None or row['stock__on_hand'] > row['stock__reserved']
+    return {
+        'id': row['pk'],
+        'sku': row['sku'] or '',
+        'title': row['name'],
+        'description': row['description'],
+        'link': absolute(reverse('freshmart:product_detail', args=[row['pk']])),
+        # The image proxy's URL is stable; it redirects to the current rendition
+        'image_link': absolute(reverse('freshmart:product_image', args=[row['pk'], 'large', 'jpg']))
+        if row['image_url'] else '',
+        'price': str(row['price']),
+        'category': row['category__name'],
+        'availability': 'in stock' if available else 'out of stock',
+        'rating': round(row['rating_sum'] / row['review_count'], 2) if row['review_count'] else None,
+        'review_count': row['review_count'],
+        'updated_at': row['updated_at'].isoformat(),
+    }
+
+
+def write_shard(root, shard):
+    """Write shard `shard`'s sitemap and feed files, streaming its products once; returns their count."""
+    low = shard * SHARD_SIZE
+    rows = (
+        Product.objects.filter(pk__gte=low, pk__lt=low + SHARD_SIZE).order_by('pk')
+        .values('pk', 'sku', 'name', 'description', 'price', 'image_url', 'category__name', 'updated_at',
+                'rating_sum', 'review_count', 'stock__on_hand', 'stock__reserved')
+        .iterator(chunk_size=2000)
+    )
+    count = 0
+    with ExitStack() as stack:
+        sitemap, csv_file, jsonl = (stack.enter_context(publish(root / name)) for name in shard_files(shard))
+        sitemap.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n')
+        writer = csv.writer(csv_file)
+        writer.writerow(FEED_COLUMNS)
+        for row in rows:
+            record = feed_record(row)
+            sitemap.write(f"<url><loc>{escape(record['link'])}</loc>"
+                          f"<lastmod>{row['updated_at'].date().isoformat()}</lastmod></url>\n")
+            writer.writerow(['' if record[column] is None else record[column] for column in FEED_COLUMNS])
+            jsonl.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+        sitemap.write('</urlset>\n')
+    return count
+
+
+def write_pages(root):
+    with publish(root / 'sitemaps/pages.xml.gz') as f:
+        f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n')
+        for name in PAGES:
+            f.write(f'<url><loc>{escape(absolute(reverse(name)))}</loc></url>\n')
+        f.write('</urlset>\n')
+
+
+def write_indexes(root, shards):
+    """sitemap.xml and feeds/index.json for the shards in the manifest."""
+    ordered = sorted(shards.items(), key=lambda item: int(item[0]))
+    with publish(root / 'sitemap.xml', compress=False) as f:
+        f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">\n')
+        f.write(f"<sitemap><loc>{escape(absolute('/sitemaps/pages.xml.gz'))}</loc></sitemap>\n")
+        for shard, entry in ordered:
+            f.write(f"<sitemap><loc>{escape(absolute('/' + shard_files(int(shard))[0]))}</loc>"
+                    f"<lastmod>{entry['signature'][1]}</lastmod></sitemap>\n")
+        f.write('</sitemapindex>\n')
+    with publish(root / 'feeds/index.json', compress=False) as f:
+        json.dump({
+            'generated_at': timezone.now().isoformat(),
+            'columns': FEED_COLUMNS,
+            'shards': [
+                {'csv': absolute('/' + shard_files(int(shard))[1]), 'jsonl': absolute('/' + shard_files(int(shard))[2]),
+                 'products': entry['signature'][0], 'updated_at': entry['signature'][1]}
+                for shard, entry in ordered
+            ],
+        }, f, indent=1)
+
+
+def read_manifest(root):
+    try:
+        return json.loads((root / MANIFEST).read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build(full=False, root=None):
+    """
+    Bring the files under `root` (default FRESHMART_FEED_ROOT) up to date with the
+    catalog, rewriting every shard if `full`. Returns {'written': [shards], 'removed':
+    [shards], 'unchanged': n, 'products': products written}.
+    """
+    root = Path(root or settings.FRESHMART_FEED_ROOT)
+    manifest = read_manifest(root)
+    config = {'version': FORMAT_VERSION, 'shard_size': SHARD_SIZE, 'site_url': settings.FRESHMART_SITE_URL}
+    categories = Category.objects.aggregate(latest=Max('updated_at'))['latest']
+    categories = categories.isoformat() if categories else None
+    # Category names are in every feed row: a change to one rewrites everything
+    stale = full or manifest.get('config') != config or manifest.get('categories') != categories
+    previous = {} if stale else manifest.get('shards', {})
+
+    signatures = shard_signatures()
+    written = [shard for shard, signature in sorted(signatures.items())
+               if previous.get(str(shard), {}).get('signature') != signature]
+    removed = [int(shard) for shard in manifest.get('shards', {}) if int(shard) not in signatures]
+    products = 0
+    shards = {shard: entry for shard, entry in previous.items() if int(shard) in signatures}
+    for shard in written:
+        products += write_shard(root, shard)
+        shards[str(shard)] = {'signature': signatures[shard]}
+    for shard in removed:
+        for name in shard_files(shard):
+            (root / name).unlink(missing_ok=True)
+
+    if stale or written or removed or not (root / 'sitemap.xml').exists():
+        if stale:
+            write_pages(root)
+        write_indexes(root, shards)
+        # Written last: if a run dies before this, the next one redoes its shards
+        with publish(root / MANIFEST, compress=False) as f:
+            json.dump({'config': config, 'categories': categories, 'shards': shards}, f)
+    return {'written': written, 'removed': removed, 'unchanged': len(signatures) - len(written), 'products': products}
@@ -1,15 +1,19 @@
 from django import forms 
 from django.core.validators import EmailValidator
-from .models import ProductReview, ContactMessage ,Order
+from .models import Review, ContactMessage ,Order
 
 class ProductReviewForm(forms.ModelForm):
     class Meta:
-        model = ProductReview
-        fields = ['rating','comment']
+        model = Review
+        fields = ['name','rating','comment']
         widgets = {
+            'name':forms.TextInput(attrs={
+                'class':'form-control',
+                'placeholder':'Your name'
+            }),
             'rating':forms.Select(choices = [(i,i) for i in range(1,6)],
                                   attrs={'class':'forms = control'}),
-            'comment':forms.Textarea(attr={
+            'comment':forms.Textarea(attrs={
                 'class': ' form-control',
                 'rows':4,
                 'placeholder':'Share your Experience with this product...'
@@ -23,8 +27,8 @@ class ProductReviewForm(forms.ModelForm):
 class ContactForm(forms.ModelForm):
     class Meta:
         model = ContactMessage
-        fields = ['name','email','subject','message']
-        widget = {
+        fields = ['name','email','message']
+        widgets = {
             'name': forms.Textarea(attrs={
                 'class':'form-control',
                 'placeholder':'Your name',
@@ -35,11 +39,6 @@ class ContactForm(forms.ModelForm):
                 'placeholder':'your.email@example.com',
                 'required':True
             }),
-            'subject':forms.TextInput(attrs={
-                'class':'form-control',
-                'placeholder':'Subject',
-                'required':True
-            }),
             'message':forms.Textarea(attrs={
                 'class': 'form-control',
                 'rows':5,
@@ -49,7 +48,7 @@ class ContactForm(forms.ModelForm):
        }
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        validator = EmailValidator
+        validator = EmailValidator()
         validator(email)
         return email
 
@@ -61,11 +60,11 @@ class ContactForm(forms.ModelForm):
 class CheckoutForm(forms.ModelForm):
     class Meta:
         model = Order
-        field = ['delivery_address','phone_number','notes']
+        fields = ['delivery_address','phone_number','notes']
         widgets = {
             'delivery_address':forms.Textarea(attrs={
                 'class':'form-control',
-                'row':3,
+                'rows':3,
                 'placeholder':'Enter your full delivery address'
             }),
             'phone_number':forms.TextInput(attrs={
@@ -78,6 +77,12 @@ class CheckoutForm(forms.ModelForm):
                 'placeholder':'Any Special instructions (optional)'
             })
         }
+    def clean_delivery_address(self):
+        address = self.cleaned_data.get('delivery_address', '').strip()
+        if not address:
+            raise forms.ValidationError('Enter a delivery address')
+        return address
+
     def clean_phone_number(self):
         phone = self.cleaned_data.get('phone_number')
         import re
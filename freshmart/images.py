@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+# Fixed renditions (max width, max height); aspect ratio is kept
+SIZES = {
+    'thumb': (160, 160),
+    'card': (480, 360),
+    'large': (1200, 900),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+FETCH_TIMEOUT = 10
+
+# Renditions are stored under MEDIA_ROOT/<IMAGE_DIR>/<hash[:2]>/<hash>/<size>.<format>, where
+# the hash is of the source image's bytes: the same picture used by several products is
+# stored once, and a URL's content never changes, so it can be cached forever.
+IMAGE_DIR = 'products'
+
+# One worker renders a given image at a time; hashes share a fixed set of locks, so the
+# table doesn't grow with every image a long-lived worker has seen
+_locks = [threading.Lock() for _ in range(64)]
+
+
+class ImageError(Exception):
+    """Raised when a product image can't be fetched or decoded."""
+
+
+def fetch_url(url):
+    """
+    Default fetcher: http(s) URLs via urllib, capped at MAX_SOURCE_BYTES. Other schemes
+    (file://, ftp://) are refused, since image URLs come from catalog feeds; a custom
+    FRESHMART_IMAGE_FETCHER can allow them.
+    """
+    import urllib.request  # Only needed when an image is made; it is slow to import at startup
+
+    if not url.lower().startswith(('http://', 'https://')):
+        raise ImageError(f'Not an http(s) URL: {url}')
+    request = urllib.request.Request(url, headers={'User-Agent': 'FreshMart image proxy'})
+    try:
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            data = response.read(MAX_SOURCE_BYTES + 1)
+    except (OSError, ValueError) as exc:
+        raise ImageError(f'Could not fetch {url}: {exc}')
+    if len(data) > MAX_SOURCE_BYTES:
+        raise ImageError(f'{url} is larger than {MAX_SOURCE_BYTES} bytes')
+    return data
+
+
+def get_fetcher():
+    # Swappable (e.g. for tests or a CDN origin) with FRESHMART_IMAGE_FETCHER = 'dotted.path'
+    return import_string(getattr(settings, 'FRESHMART_IMAGE_FETCHER', 'freshmart.images.fetch_url'))
+
+
+def rendition_dir(image_hash):
+    return f'{IMAGE_DIR}/{image_hash[:2]}/{image_hash}'
+
+
+def rendition_name(image_hash, size, fmt):
+    return f'{rendition_dir(image_hash)}/{size}.{fmt}'
+
+
+def rendition_url(product_id, image_url, image_hash, size='card', fmt='webp'):
+    """URL of a product image rendition: the stored file once generated, else the proxy view."""
+    if not image_url:
+        return ''
+    if image_hash:
+        return settings.MEDIA_URL + rendition_name(image_hash, size, fmt)
+    return reverse('freshmart:product_image', args=[product_id, size, fmt])
+
+
+def renditions_exist(image_hash):
+    root = Path(settings.MEDIA_ROOT)
+    return all((root / rendition_name(image_hash, size, fmt)).exists() for size in SIZES for fmt in FORMATS)
+
+
+def render_renditions(data, image_hash):
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    directory = Path(settings.MEDIA_ROOT) / rendition_dir(image_hash)
+    directory.mkdir(parents=True, exist_ok=True)
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            image = ImageOps.exif_transpose(source).convert('RGB')
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as exc:
+        raise ImageError(f'Not a usable image: {exc}')
+    for size, bounds in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail(bounds, Image.Resampling.LANCZOS)
+        for fmt, (pil_format, options) in FORMATS.items():
+            target = directory / f'{size}.{fmt}'
+            tmp = directory / f'.{size}.{fmt}.{os.getpid()}.{threading.get_ident()}'
+            resized.save(tmp, pil_format, **options)
+            os.replace(tmp, target)  # readers never see a half-written file
+
+
+def generate_renditions(image_url, force=False):
+    """
+    Fetch an image and write all renditions; returns the content hash.
+
+    Touches no database, so it can run in worker threads. Pillow releases the
+    GIL while decoding, resizing and encoding, so threads really run in parallel.
+    """
+    data = get_fetcher()(image_url)
+    image_hash = hashlib.sha256(data).hexdigest()[:40]
+    with _locks[int(image_hash[:8], 16) % len(_locks)]:  # the other workers wait for its files
+        if force or not renditions_exist(image_hash):
+            render_renditions(data, image_hash)
+    return image_hash
+
+
+def ensure_product_image(product_id):
+    """Generate the renditions of one product if needed and store the hash; returns the hash or ''."""
+    from .signals import invalidate  # imported here: signals -> search -> catalog -> images
+
+    image_url, image_hash = Product.objects.values_list('image_url', 'image_hash').get(pk=product_id)
+    if not image_url:
+        return ''
+    if image_hash and renditions_exist(image_hash):
+        return image_hash
+    new_hash = generate_renditions(image_url)
+    # Only store it if image_url didn't change in the meantime
+    if Product.objects.filter(pk=product_id, image_url=image_url).update(image_hash=new_hash):
+        invalidate(f'product:{product_id}')
+    return new_hash
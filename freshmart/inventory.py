@@ -0,0 +1,255 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .db import add_counts, serialized_write
+from .models import Order, OrderItem, Product, Reservation, Stock, StockMovement
+
+# Units are reserved while they sit in a cart and taken off on_hand at checkout. Every
+# Stock change is one conditional UPDATE per order, with a CASE per product, like
+#   UPDATE stock SET reserved = reserved + n WHERE on_hand >= reserved + n
+# so it is the WHERE clause, not a value read earlier, that prevents overselling, and
+# a cart costs the same few statements whatever its size. Each change is recorded in
+# the StockMovement ledger in the same transaction.
+
+
+class InsufficientStock(ValueError):
+    """A cart wants more of some products than is left; `available` maps their ids to the units it can have."""
+
+    def __init__(self, available, names):
+        self.available = available
+        super().__init__('Not enough stock: ' + ', '.join(
+            f'{names.get(pk, pk)} ({units} left)' for pk, units in sorted(available.items())
+        ) + '.')
+
+
+def _shortage(available):
+    return InsufficientStock(available, dict(Product.objects.filter(pk__in=available).values_list('pk', 'name')))
+
+
+def _per_product(values):
+    """CASE product_id WHEN ... THEN n ... END for a {product_id: n} dict."""
+    return Case(*[When(pk=pk, then=Value(n)) for pk, n in values.items()],
+                default=Value(0), output_field=IntegerField())
+
+
+def _holdings(order_id, products):
+    """{product_id: (units the order can have, units it holds)} for the stock-tracked `products`."""
+    held = Reservation.objects.filter(order_id=order_id, product_id=OuterRef('pk')).values('quantity')[:1]
+    rows = (
+        Stock.objects.filter(pk__in=products)
+        .annotate(held=Coalesce(Subquery(held), 0))
+        .values_list('pk', 'on_hand', 'reserved', 'held')
+    )
+    return {pk: (max(0, on_hand - reserved + held), held) for pk, on_hand, reserved, held in rows}
+
+
+def _release(holds, kind, link_orders=True):
+    """Give back the units of `holds`, (id, order_id, product_id, quantity) rows, and delete them."""
+    per_product = {}
+    for _, _, product_id, quantity in holds:
+        per_product[product_id] = per_product.get(product_id, 0) + quantity
+    Stock.objects.filter(pk__in=per_product).update(reserved=F('reserved') - _per_product(per_product))
+    Reservation.objects.filter(pk__in=[pk for pk, _, _, _ in holds]).delete()
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=product_id, order_id=order_id if link_orders else None, kind=kind,
+                      reserved_delta=-quantity, note='' if link_orders else f'Order #{order_id} deleted')
+        for _, order_id, product_id, quantity in holds
+    ])
+
+
+def _release_expired_of(order_id, products, now):
+    """Release other carts' expired holds on `products` (not swept yet); True if there were any."""
+    holds = list(
+        Reservation.objects.filter(product_id__in=products, expires_at__lte=now)
+        .exclude(order_id=order_id)
+        .values_list('pk', 'order_id', 'product_id', 'quantity')
+    )
+    if holds:
+        _release(holds, 'expire')
+    return bool(holds)
+
+
+def _check(order_id, wanted, now):
+    """Raise InsufficientStock unless the order can have `wanted` units; returns _holdings."""
+    stock = _holdings(order_id, wanted)
+    short = [pk for pk, (limit, _) in stock.items() if wanted[pk] > limit]
+    if short and _release_expired_of(order_id, short, now):
+        stock = _holdings(order_id, wanted)
+        short = [pk for pk, (limit, _) in stock.items() if wanted[pk] > limit]
+    if short:
+        raise _shortage({pk: stock[pk][0] for pk in short})
+    return stock
+
+
+def reserve(order_id, quantities):
+    """
+    Make an open cart's holds match `quantities`, {product_id: units in the cart}, for
+    the stock-tracked products among them, and push back the expiry of all its holds.
+
+    Runs inside the caller's transaction (cart.apply_changes) and raises
+    InsufficientStock if an increase can't be met, for the caller to roll back.
+    """
+    now = timezone.now()
+    stock = _check(order_id, quantities, now)
+    if not stock:
+        return
+    deltas = {pk: quantities[pk] - held for pk, (_, held) in stock.items() if quantities[pk] != held}
+    increases = {pk: delta for pk, delta in deltas.items() if delta > 0}
+    decreases = {pk: -delta for pk, delta in deltas.items() if delta < 0}
+    if increases:
+        wanted = _per_product(increases)
+        updated = Stock.objects.filter(pk__in=increases, on_hand__gte=F('reserved') + wanted).update(
+            reserved=F('reserved') + wanted,
+        )
+        if updated < len(increases):
+            # Another process took units between our check and the UPDATE (not on SQLite,
+            # where the write lock is held from BEGIN)
+            raise _shortage({pk: limit for pk, (limit, _) in stock.items() if pk in increases})
+    if decreases:
+        Stock.objects.filter(pk__in=decreases).update(reserved=F('reserved') - _per_product(decreases))
+
+    expires_at = now + timedelta(seconds=settings.FRESHMART_RESERVATION_TTL)
+    Reservation.objects.bulk_create(
+        [Reservation(order_id=order_id, product_id=pk, quantity=quantities[pk], expires_at=expires_at)
+         for pk in deltas if quantities[pk]],
+        update_conflicts=True, unique_fields=['order', 'product'], update_fields=['quantity', 'expires_at'],
+    )
+    emptied = [pk for pk in deltas if not quantities[pk]]
+    if emptied:
+        Reservation.objects.filter(order_id=order_id, product_id__in=emptied).delete()
+    Reservation.objects.filter(order_id=order_id).update(expires_at=expires_at)
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=pk, order_id=order_id, kind='reserve' if delta > 0 else 'release',
+                      reserved_delta=delta)
+        for pk, delta in deltas.items()
+    ])
+
+
+def commit(order_id):
+    """
+    Take a checked-out order's units off on_hand and drop its holds. Units whose hold
+    expired come out of what is still available; raises InsufficientStock if that's
+    not enough. Runs inside the checkout transaction (checkout._complete_order).
+    """
+    units = dict(
+        OrderItem.objects.filter(order_id=order_id, product__stock__isnull=False)
+        .order_by().values('product_id').annotate(n=Sum('quantity')).values_list('product_id', 'n')
+    )
+    held_products = Reservation.objects.filter(order_id=order_id).values('product_id')
+    if not units and not held_products.exists():
+        return
+    stock = _check(order_id, units, timezone.now())
+    # Holds on products no longer in the order are given back too
+    stock.update(_holdings(order_id, held_products.exclude(product_id__in=units)))
+    sold = {pk: units.get(pk, 0) for pk in stock}
+    held = {pk: held for pk, (_, held) in stock.items()}
+    taken, released = _per_product(sold), _per_product(held)
+    updated = Stock.objects.filter(pk__in=stock, on_hand__gte=F('reserved') - released + taken).update(
+        on_hand=F('on_hand') - taken, reserved=F('reserved') - released,
+    )
+    if updated < len(stock):
+        raise _shortage({pk: limit for pk, (limit, _) in stock.items() if pk in units})
+    Reservation.objects.filter(order_id=order_id).delete()
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=pk, order_id=order_id, kind='sell', on_hand_delta=-sold[pk], reserved_delta=-held[pk])
+        for pk in stock
+    ])
+
+
+@serialized_write
+def release_expired(limit=1000, now=None):
+    """Release up to `limit` holds past their expiry, oldest first; returns how many."""
+    holds = list(
+        Reservation.objects.filter(expires_at__lte=now or timezone.now())
+        .order_by('expires_at')[:limit]
+        .values_list('pk', 'order_id', 'product_id', 'quantity')
+    )
+    if holds:
+        _release(holds, 'expire')
+    return len(holds)
+
+
+def sweep(batch_size=1000):
+    """Release every expired hold, a batch per transaction; returns how many."""
+    released = 0
+    while True:
+        count = release_expired(batch_size)
+        released += count
+        if count < batch_size:
+            return released
+
+
+# Deleting a cart (e.g. when a guest cart is merged on login) gives back what it held
+@receiver(pre_delete, sender=Order)
+def release_order_holds(sender, instance, **kwargs):
+    holds = list(Reservation.objects.filter(order=instance).values_list('pk', 'order_id', 'product_id', 'quantity'))
+    if holds:
+        _release(holds, 'release', link_orders=False)
+
+
+@serialized_write
+def receive_stock(product_id, quantity, note=''):
+    """Add delivered units to a product's stock, starting to track it if it wasn't."""
+    if quantity <= 0:
+        raise ValueError('Received quantity must be positive.')
+    add_counts(Stock, ['product'], ['on_hand', 'reserved'], [(product_id, quantity, 0)])
+    StockMovement.objects.create(product_id=product_id, kind='receive', on_hand_delta=quantity, note=note)
+
+
+@serialized_write
+def count_stock(product_id, on_hand, note=''):
+    """Set on_hand to the result of a stock count, recording the difference; returns it."""
+    if on_hand < 0:
+        raise ValueError('Stock on hand cannot be negative.')
+    stock, _ = Stock.objects.select_for_update().get_or_create(pk=product_id)
+    delta = on_hand - stock.on_hand
+    if delta:
+        Stock.objects.filter(pk=product_id).update(on_hand=F('on_hand') + delta)
+        StockMovement.objects.create(product_id=product_id, kind='adjust', on_hand_delta=delta, note=note)
+    return delta
+
+
+def audit():
+    """
+    Products whose counters disagree with the ledger or, for reserved, with the live holds:
+    a list of (product_id, field, counter value, ledger value, holds or None).
+    """
+    ledger = {
+        row['product_id']: row for row in
+        StockMovement.objects.order_by().values('product_id')
+        .annotate(on_hand=Sum('on_hand_delta'), reserved=Sum('reserved_delta'))
+    }
+    holds = dict(
+        Reservation.objects.order_by().values('product_id').annotate(n=Sum('quantity')).values_list('product_id', 'n')
+    )
+    problems = []
+    for pk, on_hand, reserved in Stock.objects.order_by('pk').values_list('pk', 'on_hand', 'reserved').iterator():
+        row = ledger.get(pk, {'on_hand': 0, 'reserved': 0})
+        if on_hand != row['on_hand']:
+            problems.append((pk, 'on_hand', on_hand, row['on_hand'], None))
+        if not reserved == row['reserved'] == holds.get(pk, 0):
+            problems.append((pk, 'reserved', reserved, row['reserved'], holds.get(pk, 0)))
+    return problems
+
+
+@serialized_write
+def rebuild():
+    """
+    Reset the counters: on_hand from the ledger, reserved from the live holds (they are
+    what checkouts and the sweeper give back). Returns the number of products fixed.
+    """
+    fixed = 0
+    for pk, field, counter, ledger, holds in audit():
+        value = ledger if field == 'on_hand' else holds
+        Stock.objects.filter(pk=pk).update(**{field: value})
+        # A correcting entry, so the ledger sums to the counters again
+        StockMovement.objects.create(product_id=pk, kind='adjust', **{f'{field}_delta': value - ledger},
+                                     note=f'rebuild_stock: {field} was {counter}')
+        fixed += 1
+    return fixed
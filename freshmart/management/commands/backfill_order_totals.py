@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from freshmart.models import Order, recalculate_order_totals
+
+
+class Command(BaseCommand):
+    help = "Recalculate the stored item count and total of every Order from its item price snapshots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Orders recalculated per transaction (default: 5000).')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        last_id = Order.objects.aggregate(last=Max('pk'))['last'] or 0
+
+        # Walk the primary key in ranges so each transaction (and write lock) stays short
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            ids = Order.objects.filter(pk__gt=start, pk__lte=start + batch_size).values('pk')
+            with transaction.atomic():
+                updated += recalculate_order_totals(ids)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Recalculated totals for {updated} orders in {elapsed:.2f}s.'))
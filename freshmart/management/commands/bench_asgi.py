@@ -0,0 +1,206 @@
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from freshmart.warmup import local_host
+from freshmart.models import Category, Product
+
+MODES = {
+    # mode: value of FRESHMART_ASYNC_VIEWS in the child process
+    'wsgi': '0',
+    'asgi': '1',
+}
+
+
+def default_paths():
+    """A mix of catalog pages, searches and cart reads built from the current data."""
+    paths = ['/api/products/', '/api/products/?sort=price-asc', '/api/products/?sort=name-desc', '/api/cart/']
+    paths += [f'/api/products/?category={pk}' for pk in Category.objects.values_list('pk', flat=True)[:5]]
+    for name in Product.objects.order_by('pk').values_list('name', flat=True)[:5]:
+        word = name.split()[0] if name.split() else ''
+        if word:
+            paths.append(f'/api/search/?q={word[:4]}')
+    return paths
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_wsgi(paths, total, concurrency, host):
+    """`concurrency` threads calling the WSGI handler, like a threaded WSGI server's workers."""
+    handler = WSGIHandler()
+    latencies, errors = [], []
+    lock = threading.Lock()
+    issued = iter(range(total))
+
+    def worker():
+        while True:
+            with lock:
+                n = next(issued, None)
+            if n is None:
+                break
+            path, _, query = paths[n % len(paths)].partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                'SERVER_NAME': host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': host, 'REMOTE_ADDR': '127.0.0.1',
+                'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            status = []
+            started = time.perf_counter()
+            body = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+            b''.join(body)
+            body.close()
+            latencies.append(time.perf_counter() - started)
+            if not status[0].startswith('200'):
+                errors.append(status[0])
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_asgi(paths, total, concurrency, host):
+    """`concurrency` requests in flight at once on one event loop, as under an ASGI server."""
+    application = ASGIHandler()
+    latencies, errors = [], []
+    issued = iter(range(total))
+
+    async def request(path):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', host.encode())],
+            'client': ('127.0.0.1', 0), 'server': (host, 80),
+        }
+        disconnected = asyncio.Event()
+        body_sent = False
+        status = []
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        try:
+            await application(scope, receive, send)
+        finally:
+            disconnected.set()
+        return status[0]
+
+    async def worker():
+        for n in issued:
+            started = time.perf_counter()
+            status = await request(paths[n % len(paths)])
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and latency of the catalog, search and cart APIs served by the "
+        "sync views under WSGI and the async views under ASGI, at the same concurrency on "
+        "this machine. Each mode runs in its own process, driving Django's handler directly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=list(MODES), help='Modes to compare (default: wsgi asgi).')
+        parser.add_argument('--concurrency', type=int, default=64, help='Requests in flight (default: 64).')
+        parser.add_argument('--requests', type=int, default=3000, help='Requests per mode (default: 3000).')
+        parser.add_argument('--paths', nargs='+', help='URLs to cycle through (default: a mix of API calls).')
+        parser.add_argument('--uncached', action='store_true',
+                            help='Use a dummy cache, so every request reaches the database.')
+        # Internal: run one mode in a child process started with its settings
+        parser.add_argument('--worker', choices=list(MODES), help='(internal)')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.worker(options)
+        unknown = set(options['modes']) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+        paths = options['paths'] or default_paths()
+
+        results = []
+        for mode in options['modes']:
+            env = {**os.environ, 'FRESHMART_ASYNC_VIEWS': MODES[mode]}
+            command = [
+                sys.executable, '-m', 'django', 'bench_asgi', '--worker', mode,
+                '--concurrency', str(options['concurrency']), '--requests', str(options['requests']),
+                '--paths', *paths,
+            ]
+            if options['uncached']:
+                command.append('--uncached')
+            self.stdout.write(f"Running {mode}: {options['requests']} requests, {options['concurrency']} concurrent...")
+            output = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+            if output.returncode:
+                raise CommandError(output.stderr)
+            results.append({'mode': mode, **json.loads(output.stdout.strip().splitlines()[-1])})
+
+        self.stdout.write(f"\n{'mode':<6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for row in results:
+            self.stdout.write(
+                f"{row['mode']:<6} {row['requests_per_s']:>9,.0f} {row['p50_ms']:>8.1f} "
+                f"{row['p99_ms']:>8.1f} {row['errors']:>7}"
+            )
+
+    def worker(self, options):
+        if (options['worker'] == 'asgi') != settings.FRESHMART_ASYNC_VIEWS:
+            raise CommandError('Started with the wrong FRESHMART_ASYNC_VIEWS.')
+        caches = settings.CACHES
+        if options['uncached']:
+            caches = {**caches, 'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        paths, host = options['paths'], local_host()
+        with override_settings(CACHES=caches):
+            connection.close()
+            # Warm up: imports, URL resolution and the caches
+            warmup = len(paths) * 2
+            if options['worker'] == 'wsgi':
+                run_wsgi(paths, warmup, 1, host)
+                latencies, errors, elapsed = run_wsgi(paths, options['requests'], options['concurrency'], host)
+            else:
+                asyncio.run(run_asgi(paths, warmup, 1, host))
+                latencies, errors, elapsed = asyncio.run(
+                    run_asgi(paths, options['requests'], options['concurrency'], host))
+        latencies.sort()
+        self.stdout.write(json.dumps({
+            'requests_per_s': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'errors': len(errors),
+        }))
@@ -0,0 +1,111 @@
+import ipaddress
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from freshmart.benchmarks import bench_client, count_queries, percentiles
+from freshmart.ratelimit import CacheTokenBuckets, RateLimiter, TokenBuckets, limiter
+
+UNLIMITED = (10 ** 9, 1)
+SCOPE_LIMITS = {'bench': {'ip': UNLIMITED, 'session': UNLIMITED}, 'bench-tight': {'ip': (1, 60 * 60)}}
+
+
+def make_requests(count, clients):
+    factory = RequestFactory()
+    session_cookie = settings.SESSION_COOKIE_NAME
+    requests = []
+    for n in range(count):
+        request = factory.post('/contact/', REMOTE_ADDR=str(ipaddress.IPv4Address('10.0.0.0') + n % clients))
+        request.COOKIES[session_cookie] = f'session{n % clients}'
+        requests.append(request)
+    return requests
+
+
+def time_checks(rate_limiter, requests, scope):
+    """Mean microseconds per check over `requests`."""
+    started = time.perf_counter()
+    for request in requests:
+        rate_limiter.check(request, scope)
+    return (time.perf_counter() - started) / len(requests) * 1e6
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the rate limiter's cost per request: checks of the in-process buckets for a "
+        "returning client, for a new client each time (with LRU evictions) and over the limit, "
+        "from several threads at once, and against a cache backend; then a rejected POST /contact/ "
+        "through the whole middleware stack."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=200_000, help='Checks per scenario (default: 200000).')
+        parser.add_argument('--entries', type=int, default=10_000, help='Buckets kept by the LRU (default: 10000).')
+        parser.add_argument('--threads', type=int, default=8, help='Threads in the contended scenario (default: 8).')
+        parser.add_argument('--cache', default='default',
+                            help='CACHES alias for the shared-buckets scenario (default: default).')
+
+    def handle(self, *args, **options):
+        checks, entries = options['checks'], options['entries']
+        results = []
+        with override_settings(FRESHMART_RATE_LIMITS=SCOPE_LIMITS):
+            returning = make_requests(checks, 100)
+            new_clients = make_requests(checks, entries * 4)
+
+            local = RateLimiter(TokenBuckets(entries))
+            time_checks(local, returning[:1000], 'bench')  # warm-up
+            results.append(('returning client', time_checks(local, returning, 'bench')))
+            results.append(('new client each time', time_checks(local, new_clients, 'bench')))
+            results.append(('over the limit (429)', time_checks(local, returning, 'bench-tight')))
+            evictions = local.buckets.evictions
+
+            per_thread = checks // options['threads']
+
+            def worker(offset):
+                time_checks(local, new_clients[offset:offset + per_thread], 'bench')
+            threads = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(options['threads'])]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            results.append((f"{options['threads']} threads (wall time / check)",
+                            elapsed / (per_thread * len(threads)) * 1e6))
+
+            shared = RateLimiter(CacheTokenBuckets(options['cache']))
+            results.append((f"cache backend '{options['cache']}'",
+                            time_checks(shared, returning[:checks // 10], 'bench')))
+
+        self.stdout.write(f"\n{'scenario':<36} {'µs/check':>9}")
+        for label, micros in results:
+            self.stdout.write(f"{label:<36} {micros:>9.2f}")
+        self.stdout.write(f"({evictions} LRU evictions, {len(local.buckets)} buckets kept)")
+
+        # End to end: a client over the contact form's limit (without a warning logged per 429)
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        with override_settings(FRESHMART_RATE_LIMITS={'contact': {'ip': (1, 60 * 60)}}):
+            limiter.clear()
+            client = bench_client()
+            client.post('/contact/', {})
+            latencies = []
+            with count_queries() as queries:
+                for _ in range(1000):
+                    started = time.perf_counter()
+                    response = client.post('/contact/', {})
+                    latencies.append(time.perf_counter() - started)
+            limiter.clear()
+        request_logger.setLevel(level)
+        stats = percentiles(latencies)
+        self.stdout.write(
+            f"\nRejected POST /contact/ through the full stack: HTTP {response.status_code}, "
+            f"p50 {stats['p50_ms'] * 1000:.0f}µs, p99 {stats['p99_ms'] * 1000:.0f}µs, "
+            f"{queries[0]} queries in 1000 requests"
+        )
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,140 @@
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from freshmart.catalog import SORTS, product_page
+from freshmart.db import is_lock_error, serialized_write
+from freshmart.models import Category, Product, Review
+
+
+def write_review(product_id):
+    # A review insert also updates the product's rating aggregates: two writes per transaction
+    Review.objects.create(product_id=product_id, name='bench', rating=random.randint(1, 5), comment='Benchmark review')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare read and write throughput of the SQLite profiles in settings.SQLITE_PROFILES "
+        "under concurrent load, on a scratch copy of the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', default=['basic', 'tuned'],
+                            help='Profiles to compare (default: basic tuned).')
+        parser.add_argument('--readers', type=int, default=4, help='Reader threads (default: 4).')
+        parser.add_argument('--writers', type=int, default=4, help='Writer threads (default: 4).')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile (default: 5).')
+        # Internal: run the load in a child process that was started with one profile's settings
+        parser.add_argument('--worker', action='store_true', help='(internal)')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.worker(options)
+        unknown = set(options['profiles']) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(sorted(unknown))}")
+
+        results = []
+        with tempfile.TemporaryDirectory() as scratch:
+            for profile in options['profiles']:
+                path = os.path.join(scratch, f'{profile}.sqlite3')
+                self.copy_database(path, wal=profile != 'basic')
+                env = {**os.environ, 'FRESHMART_SQLITE_PROFILE': profile, 'FRESHMART_SQLITE_PATH': path}
+                command = [
+                    sys.executable, '-m', 'django', 'bench_sqlite', '--worker',
+                    '--readers', str(options['readers']), '--writers', str(options['writers']),
+                    '--duration', str(options['duration']),
+                ]
+                self.stdout.write(f'Running {profile} profile for {options["duration"]:g}s...')
+                output = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+                if output.returncode:
+                    raise CommandError(output.stderr)
+                results.append({'profile': profile, **json.loads(output.stdout.strip().splitlines()[-1])})
+
+        self.stdout.write(f"\n{'profile':<8} {'reads/s':>10} {'writes/s':>10} {'failed writes':>14} {'write p99 ms':>13}")
+        for row in results:
+            self.stdout.write(
+                f"{row['profile']:<8} {row['reads_per_s']:>10,.0f} {row['writes_per_s']:>10,.0f} "
+                f"{row['failed_writes']:>14} {row['write_p99_ms']:>13.1f}"
+            )
+
+    def copy_database(self, path, wal):
+        source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+        target = sqlite3.connect(path)
+        source.backup(target)
+        target.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        source.close()
+        target.close()
+
+    def worker(self, options):
+        call_command('migrate', verbosity=0)
+        product_ids = list(Product.objects.values_list('pk', flat=True)[:500])
+        if not product_ids:
+            category, _ = Category.objects.get_or_create(name='Benchmark')
+            Product.objects.bulk_create([
+                Product(category=category, name=f'Bench product {i}', description='', price=Decimal('1.00'))
+                for i in range(100)
+            ])
+            product_ids = list(Product.objects.values_list('pk', flat=True))
+        connection.close()
+
+        tuned = bool(settings.DATABASES['default'].get('OPTIONS'))
+        write = serialized_write(write_review) if tuned else transaction.atomic(write_review)
+        counts = []  # one Counter per thread, summed at the end
+        latencies = []
+        stop = time.perf_counter() + options['duration']
+
+        def reader():
+            mine = Counter()
+            counts.append(mine)
+            while time.perf_counter() < stop:
+                product_page(sort=random.choice(list(SORTS)), limit=24)
+                mine['reads'] += 1
+            connection.close()
+
+        def writer():
+            mine = Counter()
+            counts.append(mine)
+            while time.perf_counter() < stop:
+                started = time.perf_counter()
+                try:
+                    write(random.choice(product_ids))
+                    mine['writes'] += 1
+                except OperationalError as exc:
+                    if not is_lock_error(exc):
+                        raise
+                    mine['failed_writes'] += 1
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = sum(counts, Counter())
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+        self.stdout.write(json.dumps({
+            'reads_per_s': total['reads'] / elapsed,
+            'writes_per_s': total['writes'] / elapsed,
+            'failed_writes': total['failed_writes'],
+            'write_p99_ms': p99,
+        }))
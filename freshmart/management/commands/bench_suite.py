@@ -0,0 +1,115 @@
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from freshmart.benchmarks import compare, run_client_suite, run_http_suite
+from freshmart.management.commands.seed_bench import SCALES
+from freshmart.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the shop, home, product, API and admin pages and the order flow on seeded data: "
+        "query counts, p50/p95/p99 latency and throughput, through the test client and over local "
+        "HTTP. Results are compared with a JSON baseline (written with --save-baseline), and the "
+        "command fails if any of them regressed past --threshold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='small', help='seed_bench scale (default: small).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--db', help='Database file to use; seeded first if empty. Default: a temporary one.')
+        parser.add_argument('--baseline', default=str(settings.BASE_DIR / 'bench_baseline.json'),
+                            help='Baseline JSON file (default: bench_baseline.json in the project).')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed slowdown, as a fraction (default: 0.25).')
+        parser.add_argument('--requests', type=int, default=50, help='Test-client requests per page (default: 50).')
+        parser.add_argument('--http-requests', type=int, default=500, help='HTTP requests per page (default: 500).')
+        parser.add_argument('--concurrency', type=int, default=8, help='HTTP client threads (default: 8).')
+        parser.add_argument('--no-http', action='store_true', help='Skip the HTTP load.')
+        parser.add_argument('--output', help='Also write the results to this JSON file.')
+        # Internal: run the suite in a child process whose settings point at the benchmark database
+        parser.add_argument('--worker', action='store_true', help='(internal)')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.worker(options)
+        with tempfile.TemporaryDirectory() as scratch:
+            path = options['db'] or os.path.join(scratch, 'bench.sqlite3')
+            env = {
+                **os.environ,
+                'FRESHMART_SQLITE_PATH': path,
+                'FRESHMART_OUTBOX_PATH': os.path.join(scratch, 'outbox.sqlite3'),
+                'FRESHMART_ASYNC_VIEWS': '0',
+            }
+            command = [
+                sys.executable, '-m', 'django', 'bench_suite', '--worker',
+                '--scale', options['scale'], '--seed', str(options['seed']),
+                '--requests', str(options['requests']), '--http-requests', str(options['http_requests']),
+                '--concurrency', str(options['concurrency']),
+            ]
+            if options['no_http']:
+                command.append('--no-http')
+            self.stdout.write(f"Benchmarking on {path} ({options['scale']} scale)...")
+            output = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+            if output.returncode:
+                raise CommandError(output.stderr)
+            results = json.loads(output.stdout.strip().splitlines()[-1])
+
+        self.report(results)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2) + '\n')
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Saved the baseline to {baseline_path}.'))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f'No baseline at {baseline_path}; run with --save-baseline.'))
+            return
+        baseline = json.loads(baseline_path.read_text())
+        if baseline['meta']['scale'] != results['meta']['scale']:
+            raise CommandError(f"The baseline was recorded at {baseline['meta']['scale']} scale.")
+        regressions = compare(baseline, results, options['threshold'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {baseline_path}.'))
+
+    def report(self, results):
+        self.stdout.write(f"\n{'scenario':<24} {'queries':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+        for section in ('client', 'http'):
+            for name, row in results.get(section, {}).items():
+                self.stdout.write(
+                    f"{section + '/' + name:<24} {row.get('queries', ''):>7} {row['p50_ms']:>8.2f} "
+                    f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['rps']:>8.0f}"
+                )
+
+    def worker(self, options):
+        call_command('migrate', verbosity=0)
+        if not Product.objects.exists():
+            call_command('seed_bench', scale=options['scale'], seed=options['seed'], stdout=self.stderr)
+        results = {
+            'meta': {
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'products': Product.objects.count(),
+            },
+            'client': run_client_suite(options['requests']),
+        }
+        if not options['no_http']:
+            results['http'] = run_http_suite(options['http_requests'], options['concurrency'])
+        self.stdout.write(json.dumps(results))
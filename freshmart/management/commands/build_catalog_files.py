@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from freshmart.feeds import build
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the sitemaps and the product feed (CSV and JSON lines, gzipped, in shards) to "
+        "FRESHMART_FEED_ROOT, rewriting only the shards whose products changed since the last run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rewrite every shard.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = build(full=options['full'])
+        elapsed = time.perf_counter() - started
+        removed = f", removed {len(result['removed'])}" if result['removed'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(result['written'])} shards ({result['products']} products){removed}, "
+            f"{result['unchanged']} unchanged, in {elapsed:.2f}s to {settings.FRESHMART_FEED_ROOT}."
+        ))
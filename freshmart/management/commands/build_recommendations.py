@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from freshmart.models import CoPurchase, Recommendation
+from freshmart.recommendations import index_new_orders, refresh_recommendations, reset
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the \"frequently bought together\" index with the orders completed since the last run, "
+        "then rebuild the recommendation lists of the products they contain."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Forget the index and rebuild it from every order.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes counting co-purchases (default: 1, counted in this process).')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Orders read and written per transaction (default: 5000).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['full']:
+            reset()
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        processed, touched = index_new_orders(options['batch_size'], options['workers'], log)
+        counted = time.perf_counter()
+        refresh_recommendations(touched)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {processed} orders in {counted - started:.2f}s and rebuilt {len(touched)} products' lists "
+            f"in {elapsed - (counted - started):.2f}s ({CoPurchase.objects.count()} pair rows, "
+            f"{Recommendation.objects.count()} recommendations)."
+        ))
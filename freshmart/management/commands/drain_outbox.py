@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from freshmart.outbox import drain
+
+
+class Command(BaseCommand):
+    help = (
+        "Write queued contact messages and reviews to the database. Runs until stopped, "
+        "polling every --interval seconds; with --once it drains what is queued and exits. "
+        "After a crash just start it again: nothing applied is repeated, nothing queued is lost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds between polls.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Entries per transaction.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            started = time.perf_counter()
+            applied = drain(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Applied {applied} submissions in {time.perf_counter() - started:.2f}s."
+            ))
+            return
+        try:
+            while True:
+                applied = drain(options['batch_size'])
+                if applied:
+                    self.stdout.write(f"Applied {applied} submissions.")
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
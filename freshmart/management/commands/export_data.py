@@ -0,0 +1,50 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from freshmart.exports import DEFAULT_CHUNK_SIZE, EXPORTS, encode, export_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream orders, reviews or contact messages to a CSV or JSON-lines file, "
+        "optionally gzip-compressed. Memory use stays flat however many rows there are."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv',
+                            help='Output format (default: csv).')
+        parser.add_argument('--output', '-o', default='-',
+                            help="Output file, or '-' for stdout (default).")
+        parser.add_argument('--gzip', action='store_true',
+                            help='Gzip the output while it is written.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Rows fetched per database round trip (default: {DEFAULT_CHUNK_SIZE}).')
+
+    def handle(self, *args, **options):
+        dataset, path = options['dataset'], options['output']
+        started = time.perf_counter()
+        lines = export_lines(dataset, fmt=options['format'], chunk_size=max(1, options['chunk_size']))
+
+        written = 0
+        try:
+            out = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        try:
+            for chunk in encode(lines, compress=options['gzip']):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if path == '-':
+                out.flush()
+            else:
+                out.close()
+
+        if path != '-':
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"Exported {dataset} to {path} ({written / 1024:,.0f} KB) in {elapsed:.2f}s."
+            ))
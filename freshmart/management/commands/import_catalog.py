@@ -0,0 +1,217 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import URLValidator
+
+from freshmart.cache import catalog_cache
+from freshmart.db import serialized_write
+from freshmart.models import Category, Product
+from freshmart.search import index_products
+
+# Input columns -> Product fields. "sku" is the upsert key, "category" is a category name.
+IMPORT_FIELDS = ('sku', 'name', 'category', 'price', 'description', 'image_url', 'featured')
+REQUIRED_FIELDS = ('sku', 'name', 'category', 'price')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', ''}
+MAX_PRICE = Decimal('999999.99')  # Product.price is max_digits=8, decimal_places=2
+
+validate_url = URLValidator()
+
+
+def read_csv(stream):
+    for line_number, row in enumerate(csv.DictReader(stream), start=2):
+        yield line_number, row
+
+
+def read_jsonl(stream):
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield line_number, {'__error__': f'Invalid JSON: {exc.msg}', '__raw__': line.rstrip('\n')}
+            continue
+        if not isinstance(row, dict):
+            row = {'__error__': 'Expected a JSON object', '__raw__': line.rstrip('\n')}
+        yield line_number, row
+
+
+def clean_row(row):
+    """Validate one input row and return a dict of Product field values, or raise ValueError."""
+    if '__error__' in row:
+        raise ValueError(row['__error__'])
+    missing = [field for field in REQUIRED_FIELDS if not str(row.get(field) or '').strip()]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+
+    values = {
+        'sku': str(row['sku']).strip(),
+        'name': str(row['name']).strip(),
+        'category': str(row['category']).strip(),
+        'description': str(row.get('description') or '').strip(),
+        'image_url': str(row.get('image_url') or '').strip(),
+    }
+    if len(values['sku']) > 64:
+        raise ValueError('sku is longer than 64 characters')
+    if len(values['name']) > 200:
+        raise ValueError('name is longer than 200 characters')
+    if len(values['category']) > 100:
+        raise ValueError('category is longer than 100 characters')
+
+    try:
+        price = Decimal(str(row['price']).strip().lstrip('$'))
+    except InvalidOperation:
+        raise ValueError(f"Invalid price {row['price']!r}")
+    if not price.is_finite() or price < 0 or price > MAX_PRICE:
+        raise ValueError(f"Price out of range: {row['price']!r}")
+    values['price'] = price.quantize(Decimal('0.01'))
+
+    if values['image_url']:
+        try:
+            validate_url(values['image_url'])
+        except ValidationError:
+            raise ValueError(f"Invalid image_url {values['image_url']!r}")
+
+    featured = str(row.get('featured') or '').strip().lower()
+    if featured not in TRUE_VALUES | FALSE_VALUES:
+        raise ValueError(f"Invalid featured flag {row['featured']!r}")
+    values['featured'] = featured in TRUE_VALUES
+    return values
+
+
+def update_fields(row):
+    """
+    The Product fields an upsert of `row` overwrites: only the columns it has, so an
+    existing product keeps e.g. its description if a JSON-lines row leaves it out.
+    """
+    fields = [field for field in IMPORT_FIELDS if field in row and field != 'sku']
+    if 'image_url' in fields:
+        # Reset the rendition hash; prewarm_images (or the image proxy) regenerates it,
+        # and unchanged pictures hash to renditions that already exist
+        fields.append('image_hash')
+    return (*fields, 'updated_at')
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a CSV or JSON-lines product feed into the catalog, upserting Products by sku. "
+        "Columns: sku, name, category, price, description, image_url, featured."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file, or '-' for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: guessed from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per bulk upsert (default: 1000).')
+        parser.add_argument('--batches-per-transaction', type=int, default=10,
+                            help='Batches committed together, so write locks stay short (default: 10).')
+        parser.add_argument('--rejects', default='rejects.jsonl',
+                            help='Where rows that fail validation are written (default: rejects.jsonl).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Parse and validate only; report throughput without writing.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if path == '-' and not options['format']:
+            raise CommandError('--format is required when reading from stdin.')
+        self.batch_size = max(1, options['batch_size'])
+        self.batches_per_transaction = max(1, options['batches_per_transaction'])
+        self.dry_run = options['dry_run']
+
+        self.categories = {name.lower(): pk for pk, name in Category.objects.values_list('pk', 'name')}
+        self.touched_categories = set()
+        self.imported = self.rejected = 0
+        started = time.perf_counter()
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            with open(options['rejects'], 'w', encoding='utf-8') as rejects:
+                reader = read_jsonl(stream) if fmt == 'jsonl' else read_csv(stream)
+                self.run(reader, rejects)
+        except OSError as exc:
+            raise CommandError(str(exc))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if self.imported and not self.dry_run:
+            # bulk_create skips model signals, so invalidate the affected cache namespaces here too
+            catalog_cache.bump('products', 'featured', 'categories',
+                               *(f'category:{pk}' for pk in self.touched_categories))
+
+        elapsed = time.perf_counter() - started
+        rate = (self.imported + self.rejected) / elapsed if elapsed else 0
+        verb = 'Validated' if self.dry_run else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {self.imported} rows, rejected {self.rejected} "
+            f"in {elapsed:.2f}s ({rate:,.0f} rows/s)."
+        ))
+        if self.rejected:
+            self.stdout.write(f"Rejected rows written to {options['rejects']}")
+
+    def run(self, reader, rejects):
+        # Parsing happens outside transactions; each transaction only covers the
+        # upserts of `batches_per_transaction` ready-made batches, so the SQLite
+        # write lock is held briefly and memory stays at a few batches.
+        batches = self.batches(reader, rejects)
+        while True:
+            chunk = list(islice(batches, self.batches_per_transaction))
+            if not chunk:
+                break
+            self.write_chunk(chunk)
+
+    def batches(self, reader, rejects):
+        """(update fields, products) batches; a row with other columns than the one before starts a new batch."""
+        batch, fields = [], None
+        for line_number, row in reader:
+            try:
+                values = clean_row(row)
+            except ValueError as exc:
+                self.rejected += 1
+                rejects.write(json.dumps({'line': line_number, 'error': str(exc), 'row': row}, default=str) + '\n')
+                continue
+            self.imported += 1
+            if self.dry_run:
+                continue
+            row_fields = update_fields(row)
+            if batch and (row_fields != fields or len(batch) >= self.batch_size):
+                yield fields, batch
+                batch = []
+            fields = row_fields
+            values['category_id'] = self.category_id(values.pop('category'))
+            batch.append(Product(**values))
+        if batch:
+            yield fields, batch
+
+    def category_id(self, name):
+        key = name.lower()
+        if key not in self.categories:
+            category, _ = Category.objects.get_or_create(name=name)
+            self.categories[key] = category.pk
+        self.touched_categories.add(self.categories[key])
+        return self.categories[key]
+
+    @serialized_write
+    def write_chunk(self, chunk):
+        # Upserts are idempotent, so a chunk can be retried if the database is locked
+        for fields, batch in chunk:
+            self.upsert(batch, fields)
+
+    def upsert(self, batch, fields):
+        Product.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=fields,
+        )
+        # bulk_create skips the receivers that maintain the search index
+        index_products(skus=[product.sku for product in batch])
@@ -0,0 +1,29 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from freshmart.models import Watermark
+from freshmart.outbox import outbox_path, stats, watermark_name
+
+
+class Command(BaseCommand):
+    help = "Show how many contact messages and reviews are waiting in the outbox, and how long the oldest has waited."
+
+    def handle(self, *args, **options):
+        current = stats()
+        path = outbox_path()
+        size = sum(os.path.getsize(f) for f in (path, f'{path}-wal') if os.path.exists(f))
+        self.stdout.write(f"Outbox: {path} ({size / 1024:.0f} KiB)")
+        for kind, count in current['pending'].items():
+            self.stdout.write(f"  {kind}: {count} pending")
+        if current['oldest'] is not None:
+            self.stdout.write(f"  oldest waiting {time.time() - current['oldest']:.1f}s")
+        watermark = Watermark.objects.filter(name=watermark_name()).first()
+        if watermark:
+            self.stdout.write(f"Applied through entry #{watermark.order_id}, last batch at {watermark.updated_at:%Y-%m-%d %H:%M:%S}")
+        waiting = sum(current['pending'].values())
+        if waiting:
+            self.stdout.write(self.style.WARNING(f"{waiting} submissions waiting; is a drainer running?"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Outbox is empty."))
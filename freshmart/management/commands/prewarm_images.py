@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from freshmart.cache import catalog_cache
+from freshmart.images import ImageError, generate_renditions, renditions_exist
+from freshmart.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the resized image renditions of every product that needs them, in parallel "
+        "(e.g. after import_catalog, which skips the per-product save signals)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Parallel fetch/resize threads (default: 4).')
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist.')
+        parser.add_argument('--ids', type=int, nargs='+', help='Only these product ids.')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image_url='').order_by('pk')
+        if options['ids']:
+            products = products.filter(pk__in=options['ids'])
+        rows = list(products.values_list('pk', 'image_url', 'image_hash'))
+        if not options['force']:
+            rows = [row for row in rows if not (row[2] and renditions_exist(row[2]))]
+        # Several products may share one image URL: fetch and resize it once
+        by_url = {}
+        for pk, image_url, _ in rows:
+            by_url.setdefault(image_url, []).append(pk)
+
+        started = time.perf_counter()
+        updated = failed = 0
+        # Workers only fetch and resize; the database is written from this thread
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = {pool.submit(generate_renditions, url, options['force']): url for url in by_url}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    image_hash = future.result()
+                except ImageError as exc:
+                    failed += len(by_url[url])
+                    self.stderr.write(str(exc))
+                    continue
+                updated += Product.objects.filter(pk__in=by_url[url], image_url=url).update(image_hash=image_hash)
+
+        if updated:
+            catalog_cache.bump('products', 'featured', *(f'product:{pk}' for pk, _, _ in rows))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated images for {updated} products ({len(by_url)} distinct images) '
+            f'in {elapsed:.2f}s, {failed} failed.'
+        ))
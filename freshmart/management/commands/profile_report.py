@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from freshmart.profiling import load_view_stats, percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Print per-view latency percentiles collected by RequestProfilerMiddleware "
+        "(merged across all server processes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', choices=['p50', 'p90', 'p99', 'count'], default='p99',
+                            help='Sort views by this column (default: p99).')
+        parser.add_argument('--json', action='store_true', help='Print JSON instead of a table.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Delete the collected stats after printing them.')
+
+    def handle(self, *args, **options):
+        directory = Path(settings.FRESHMART_PROFILE_DIR)
+        rows = []
+        for view, stats in load_view_stats(directory).items():
+            samples = stats['samples']
+            wall = sorted(sample[0] for sample in samples)
+            rows.append({
+                'view': view,
+                'count': stats['count'],
+                'p50': percentile(wall, 0.50),
+                'p90': percentile(wall, 0.90),
+                'p99': percentile(wall, 0.99),
+                'avg_db_ms': round(sum(sample[1] for sample in samples) / len(samples), 2),
+                'avg_queries': round(sum(sample[2] for sample in samples) / len(samples), 1),
+            })
+        rows.sort(key=lambda row: row[options['sort']], reverse=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+        elif not rows:
+            self.stdout.write(f'No profiling data in {directory}. Is FRESHMART_PROFILE_SAMPLE_RATE set?')
+        else:
+            self.stdout.write(f"{'view':<45} {'count':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+                              f"{'db ms':>7} {'queries':>8}")
+            for row in rows:
+                self.stdout.write(
+                    f"{row['view'][:45]:<45} {row['count']:>7} {row['p50']:>8.1f} {row['p90']:>8.1f} "
+                    f"{row['p99']:>8.1f} {row['avg_db_ms']:>7.1f} {row['avg_queries']:>8.1f}"
+                )
+
+        if options['reset']:
+            for path in directory.glob('views-*.json'):
+                path.unlink()
+            self.stdout.write(self.style.SUCCESS('Profiling stats reset.'))
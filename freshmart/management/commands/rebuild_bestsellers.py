@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from freshmart.cache import catalog_cache
+from freshmart.db import serialized_write
+from freshmart.models import Bestseller, ProductSales
+from freshmart.rankings import refresh_top_lists, refresh_windows
+from freshmart.reports import reset_rollups, roll_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups, rolling 7/30-day counters and bestseller lists from completed "
+        "orders. Run it with --windows-only once a day so products that stopped selling drop out of the rankings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--windows-only', action='store_true',
+                            help="Keep the daily sales; only roll the windows forward and rebuild the lists.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recounted = 'kept the daily sales'
+        if not options['windows_only']:
+            # Batch by batch, each in its own transaction; the rankings are only replaced at the end
+            reset_rollups()
+            orders, _ = roll_up()
+            recounted = f'rolled up {orders} orders'
+        self.refresh()
+        catalog_cache.bump('bestsellers')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rankings ({recounted}, {ProductSales.objects.count()} products with recent sales, "
+            f"{Bestseller.objects.count()} list entries) in {elapsed:.2f}s."
+        ))
+
+    @serialized_write
+    def refresh(self):
+        refresh_windows()
+        refresh_top_lists()
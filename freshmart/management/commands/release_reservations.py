@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from freshmart.inventory import sweep
+
+
+class Command(BaseCommand):
+    help = (
+        "Give back the stock held by carts left alone for longer than FRESHMART_RESERVATION_TTL. "
+        "Runs until stopped, sweeping every --interval seconds; with --once it sweeps once and exits. "
+        "(Checkouts and cart updates that run short also release expired holds themselves.)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Sweep once and exit.")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between sweeps.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Holds released per transaction.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            started = time.perf_counter()
+            released = sweep(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Released {released} expired reservations in {time.perf_counter() - started:.2f}s."
+            ))
+            return
+        try:
+            while True:
+                released = sweep(options['batch_size'])
+                if released:
+                    self.stdout.write(f"Released {released} expired reservations.")
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from freshmart.db import serialized_write
+from freshmart.models import Watermark
+from freshmart.rankings import update_rankings
+from freshmart.reports import WATERMARK, reset_rollups, roll_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Add the orders completed since the last run to the daily sales rollups that the sales "
+        "report and the bestseller rankings read. Checkout keeps up on its own; run this after "
+        "importing orders, or with --rebuild to recount the whole history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Drop the rollups and recount every order.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Orders per transaction.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['rebuild']:
+            reset_rollups()
+        processed, product_ids = roll_up(batch_size=options['batch_size'])
+        serialized_write(update_rankings)(product_ids)
+        elapsed = time.perf_counter() - started
+        watermark = Watermark.objects.filter(name=WATERMARK).first()
+        through = f" (through order #{watermark.order_id})" if watermark and watermark.order_id else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {processed} orders over {len(product_ids)} products{through} in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,174 @@
+import random
+import time
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from freshmart.models import Category, Order, OrderItem, Product, Review
+
+# name: (categories, products, reviews, orders)
+SCALES = {
+    'tiny': (5, 200, 1_000, 300),
+    'small': (20, 10_000, 100_000, 20_000),
+    'medium': (40, 100_000, 1_000_000, 200_000),
+    'large': (60, 150_000, 3_000_000, 1_000_000),
+}
+BATCH_SIZE = 5000
+HISTORY_DAYS = 90
+
+ADJECTIVES = ['Organic', 'Fresh', 'Local', 'Ripe', 'Crunchy', 'Sweet', 'Smoked', 'Wholegrain', 'Wild',
+              'Roasted', 'Creamy', 'Spicy', 'Frozen', 'Free-range', 'Seasonal', 'Artisan']
+NOUNS = ['Apples', 'Bananas', 'Carrots', 'Spinach', 'Tomatoes', 'Milk', 'Cheddar', 'Yogurt', 'Bread',
+         'Bagels', 'Salmon', 'Chicken', 'Rice', 'Pasta', 'Coffee', 'Tea', 'Almonds', 'Granola', 'Honey',
+         'Olive Oil', 'Eggs', 'Butter', 'Oranges', 'Grapes', 'Potatoes', 'Onions', 'Peppers', 'Cookies']
+CATEGORY_NAMES = ['Fruits', 'Vegetables', 'Dairy', 'Bakery', 'Meat', 'Seafood', 'Pantry', 'Snacks',
+                  'Beverages', 'Frozen', 'Breakfast', 'Household', 'Baby', 'Pets', 'Deli', 'Organic']
+COMMENTS = ['Great quality, will buy again.', 'Fresh and tasty.', 'Arrived a bit bruised.',
+            'Good value for money.', 'Not what I expected.', 'My family loves these!', 'Average.']
+# Ratings lean positive, as on most storefronts
+RATING_WEIGHTS = [4, 6, 15, 35, 40]
+
+
+def insert_rows(model, fields, rows):
+    """
+    Plain INSERTs with executemany, for the million-row tables: bulk_create's
+    per-object work dominates there. Values must already be in database form.
+    """
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {model._meta.db_table} ({columns}) VALUES ({placeholders})', rows)
+
+
+def zipf_weights(n, exponent=1.1):
+    """Cumulative weights for picking item i with probability ~ 1 / (i + 1)^exponent."""
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(n)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an empty database with realistic, seeded benchmark data: categories, products, "
+        "reviews and completed orders, written with bulk inserts. Popularity follows a Zipf "
+        "distribution, so a few products get most reviews and sales. Use it on a scratch "
+        "database (FRESHMART_SQLITE_PATH); the same --seed always produces the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='small',
+                            help='Preset sizes (default: small). The options below override it.')
+        parser.add_argument('--categories', type=int)
+        parser.add_argument('--products', type=int)
+        parser.add_argument('--reviews', type=int)
+        parser.add_argument('--orders', type=int, help='Completed orders, 1-8 items each.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="Don't build the search index, sales rollups and recommendations.")
+
+    def handle(self, *args, **options):
+        if Product.objects.exists() or Order.objects.exists():
+            raise CommandError('The database already has products or orders; seed an empty one.')
+        sizes = dict(zip(('categories', 'products', 'reviews', 'orders'), SCALES[options['scale']]))
+        sizes.update({name: options[name] for name in sizes if options[name] is not None})
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+
+        category_ids = self.create_categories(sizes['categories'])
+        popularity = zipf_weights(sizes['products'])
+        # Reviews are drawn first, so the products can be inserted with their rating aggregates
+        reviewed = array('I', rng.choices(range(sizes['products']), cum_weights=popularity, k=sizes['reviews']))
+        ratings = array('B', rng.choices(range(1, 6), weights=RATING_WEIGHTS, k=sizes['reviews']))
+        products = self.create_products(rng, sizes['products'], category_ids, reviewed, ratings)
+        self.stdout.write(f"{len(products)} products in {time.perf_counter() - started:.1f}s")
+        self.create_reviews(rng, products, reviewed, ratings)
+        self.stdout.write(f"{len(reviewed)} reviews in {time.perf_counter() - started:.1f}s")
+        items = self.create_orders(rng, sizes['orders'], products, popularity)
+        self.stdout.write(f"{sizes['orders']} orders ({items} items) in {time.perf_counter() - started:.1f}s")
+
+        if not options['skip_derived']:
+            for command, kwargs in (('rebuild_search_index', {}), ('rollup_sales', {}),
+                                    ('build_recommendations', {'full': True})):
+                call_command(command, stdout=self.stdout, **kwargs)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {sizes['categories']} categories, {len(products)} products, {len(reviewed)} reviews "
+            f"and {sizes['orders']} orders in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def create_categories(self, count):
+        names = CATEGORY_NAMES[:count]
+        names += [f'{CATEGORY_NAMES[i % len(CATEGORY_NAMES)]} {i // len(CATEGORY_NAMES) + 1}'
+                  for i in range(len(names), count)]
+        Category.objects.bulk_create([Category(name=name, description=f'{name} aisle') for name in names])
+        return list(Category.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_products(self, rng, count, category_ids, reviewed, ratings):
+        stars = [[0] * 5 for _ in range(count)]
+        for product, rating in zip(reviewed, ratings):
+            stars[product][rating - 1] += 1
+        products = []
+        with transaction.atomic():
+            for start in range(0, count, BATCH_SIZE):
+                batch = []
+                for i in range(start, min(count, start + BATCH_SIZE)):
+                    histogram = stars[i]
+                    # Log-normal prices: mostly a few dollars, a long tail of pricier items
+                    price = Decimal(str(round(min(999.0, rng.lognormvariate(1.3, 0.8)) + 0.49, 2)))
+                    batch.append(Product(
+                        category_id=rng.choice(category_ids),
+                        sku=f'BENCH-{i:07d}',
+                        name=f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} #{i}',
+                        description=f'{rng.choice(ADJECTIVES)} and {rng.choice(ADJECTIVES).lower()}, '
+                                    f'from our {rng.choice(NOUNS).lower()} range.',
+                        price=price,
+                        featured=i < 8,
+                        review_count=sum(histogram),
+                        rating_sum=sum(star * n for star, n in enumerate(histogram, start=1)),
+                        **{f'stars_{star}': n for star, n in enumerate(histogram, start=1)},
+                    ))
+                products.extend(Product.objects.bulk_create(batch))
+        return [(product.pk, product.price) for product in products]
+
+    def create_reviews(self, rng, products, reviewed, ratings):
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with transaction.atomic():
+            for start in range(0, len(reviewed), BATCH_SIZE):
+                insert_rows(Review, ['product', 'name', 'rating', 'comment', 'created_at', 'updated_at'], [
+                    (products[reviewed[i]][0], f'Customer {rng.randrange(100_000)}', ratings[i],
+                     rng.choice(COMMENTS), now, now)
+                    for i in range(start, min(len(reviewed), start + BATCH_SIZE))
+                ])
+
+    def create_orders(self, rng, count, products, popularity):
+        now = timezone.now()
+        items = 0
+        with transaction.atomic():
+            for start in range(0, count, BATCH_SIZE):
+                orders, lines = [], []
+                for _ in range(start, min(count, start + BATCH_SIZE)):
+                    basket = {rng.choices(range(len(products)), cum_weights=popularity)[0]
+                              for _ in range(rng.randint(1, 8))}
+                    basket_lines = [(products[i][0], rng.choice((1, 1, 1, 2, 3)), products[i][1]) for i in basket]
+                    orders.append(Order(
+                        completed=True,
+                        completed_at=now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400)),
+                        delivery_address='1 Benchmark Road', phone_number='+15550000000',
+                        item_count=sum(quantity for _, quantity, _ in basket_lines),
+                        total=sum(quantity * price for _, quantity, price in basket_lines),
+                    ))
+                    lines.append(basket_lines)
+                Order.objects.bulk_create(orders)
+                insert_rows(OrderItem, ['order', 'product', 'quantity', 'unit_price'], [
+                    (order.pk, product_id, quantity, str(price))
+                    for order, basket_lines in zip(orders, lines)
+                    for product_id, quantity, price in basket_lines
+                ])
+                items += sum(len(basket_lines) for basket_lines in lines)
+            # created_at is auto_now_add; backdate it to the completion time
+            Order.objects.update(created_at=F('completed_at'))
+        return items
@@ -0,0 +1,128 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+
+from freshmart.warmup import warm_up
+
+# Run in a fresh interpreter by --profile: boot the WSGI application (warming it up or
+# not, per FRESHMART_WARMUP), then GET each path twice
+PROFILE_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from freshmart_project.wsgi import application
+ready = time.perf_counter()
+from freshmart.warmup import wsgi_get
+hits, first_response_at = [], None
+for path in sys.argv[1:]:
+    timings = []
+    for _ in range(2):
+        request_started = time.perf_counter()
+        status = wsgi_get(application, path)
+        timings.append((time.perf_counter() - request_started) * 1000)
+        first_response_at = first_response_at or time.time()
+    hits.append([path, status, *timings])
+print(json.dumps({'ready_ms': (ready - started) * 1000, 'first_response_at': first_response_at, 'hits': hits}))
+"""
+
+
+def parse_importtime(stderr):
+    """(module, self µs, cumulative µs) rows from python -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(own), int(cumulative)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Warm up this process the way wsgi.py / asgi.py do with FRESHMART_WARMUP on: compile "
+        "every template, build the URL tables and GET FRESHMART_WARMUP_PATHS; fails if a "
+        "template doesn't compile. With --profile, start fresh processes instead and report "
+        "per-module import times, time to ready and first-request latency, with and without warm-up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-requests', action='store_true', help="Only compile templates and resolve URLs.")
+        parser.add_argument('--profile', action='store_true', help="Profile process startup in child processes.")
+        parser.add_argument('--paths', nargs='+', help="Pages to time with --profile (default: FRESHMART_WARMUP_PATHS).")
+        parser.add_argument('--runs', type=int, default=3, help="Processes started per mode with --profile (default: 3).")
+        parser.add_argument('--top', type=int, default=20, help="Slowest modules to list with --profile (default: 20).")
+
+    def handle(self, *args, **options):
+        if options['profile']:
+            return self.profile(options)
+        application = None if options['no_requests'] else get_wsgi_application()
+        report = warm_up(application)
+        self.stdout.write(f"Compiled {report['templates']} templates in {report['templates_ms']:.0f}ms")
+        self.stdout.write(f"Resolved {report['url_names']} URL names in {report['urls_ms']:.0f}ms")
+        if application is not None:
+            statuses = ', '.join(f'{path} {status}' for path, status in report['requests'].items())
+            self.stdout.write(f"Requested {statuses} in {report['requests_ms']:.0f}ms")
+        if report['template_errors']:
+            raise CommandError('Templates that do not compile:\n  ' + '\n  '.join(
+                f'{name}: {error}' for name, error in report['template_errors'].items()
+            ))
+        self.stdout.write(self.style.SUCCESS('Warm-up complete.'))
+
+    def profile(self, options):
+        paths = options['paths'] or settings.FRESHMART_WARMUP_PATHS
+        # Import times come from a run of their own: -X importtime slows imports down
+        _, stderr = self.start_process(paths, warm=False, flags=['-X', 'importtime'])
+        self.report_imports(parse_importtime(stderr), options['top'])
+        results = defaultdict(list)
+        for _ in range(options['runs']):
+            for mode in ('cold', 'warmed'):
+                results[mode].append(self.start_process(paths, warm=mode == 'warmed')[0])
+        self.report_startup(results, paths)
+
+    def start_process(self, paths, warm, flags=()):
+        env = {**os.environ, 'FRESHMART_WARMUP': '1' if warm else '0'}
+        spawned = time.time()
+        output = subprocess.run([sys.executable, *flags, '-c', PROFILE_SCRIPT, *paths],
+                                env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if output.returncode:
+            raise CommandError(output.stderr[-3000:])
+        run = json.loads(output.stdout.strip().splitlines()[-1])
+        run['first_response_ms'] = (run['first_response_at'] - spawned) * 1000
+        return run, output.stderr
+
+    def report_imports(self, rows, top):
+        total = sum(own for _, own, _ in rows)
+        self.stdout.write(f"\nImports at startup: {len(rows)} modules, {total / 1000:.0f}ms (own time, under -X importtime)")
+        packages = defaultdict(int)
+        for name, own, _ in rows:
+            packages[name.split('.')[0]] += own
+        self.stdout.write(f"\n{'package':<32} {'ms':>8}")
+        for name, own in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"{name:<32} {own / 1000:>8.1f}")
+        self.stdout.write(f"\n{'module':<48} {'own ms':>8} {'cumul. ms':>10}")
+        for name, own, cumulative in sorted(rows, key=lambda row: -row[1])[:top]:
+            self.stdout.write(f"{name:<48} {own / 1000:>8.1f} {cumulative / 1000:>10.1f}")
+
+    def report_startup(self, results, paths):
+        def median(mode, value):
+            return statistics.median(value(run) for run in results[mode])
+
+        self.stdout.write(f"\nMedians of {len(results['cold'])} processes per mode")
+        self.stdout.write(f"{'':<30} {'cold':>10} {'warmed':>10}")
+        rows = [('app ready (ms)', lambda run: run['ready_ms']),
+                ('process start to 1st response', lambda run: run['first_response_ms'])]
+        for n, path in enumerate(paths):
+            rows.append((f'{path} 1st hit (ms)', lambda run, n=n: run['hits'][n][2]))
+            rows.append((f'{path} 2nd hit (ms)', lambda run, n=n: run['hits'][n][3]))
+        for label, value in rows:
+            self.stdout.write(f"{label:<30} {median('cold', value):>10.1f} {median('warmed', value):>10.1f}")
+        failed = {hit[0]: hit[1] for run in results['cold'] for hit in run['hits'] if hit[1] >= 400}
+        if failed:
+            self.stdout.write(self.style.WARNING(f"Some pages failed: {failed}"))
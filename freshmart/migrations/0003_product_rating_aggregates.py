@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('freshmart', 'Product')
+    Review = apps.get_model('freshmart', 'Review')
+    totals = (
+        Review.objects.order_by()
+        .values('product_id')
+        .annotate(
+            review_count=Count('pk'),
+            rating_sum=Sum('rating'),
+            **{f'stars_{star}': Count('pk', filter=Q(rating=star)) for star in range(1, 6)},
+        )
+    )
+    for row in totals.iterator():
+        Product.objects.filter(pk=row.pop('product_id')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freshmart', '0002_product_catalog_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-created_at'], name='review_product_created_idx'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:17
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_snapshots_and_totals(apps, schema_editor):
+    Product = apps.get_model('freshmart', 'Product')
+    Order = apps.get_model('freshmart', 'Order')
+    OrderItem = apps.get_model('freshmart', 'OrderItem')
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    # Existing lines have no recorded purchase price; the current price is the best we have
+    OrderItem.objects.filter(unit_price__isnull=True).update(
+        unit_price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    )
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    Order.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(n=Sum('quantity')).values('n')), 0),
+        total=Coalesce(
+            Subquery(items.annotate(t=Sum(F('quantity') * F('unit_price'), output_field=money)).values('t')),
+            Value(0, output_field=money),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freshmart', '0003_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.RunPython(backfill_snapshots_and_totals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8),
+        ),
+    ]
@@ -0,0 +1,81 @@
+from django.db import migrations
+
+# FTS5 index over product name, description and category name (rowid = product id).
+# The triggers below are dropped again by 0006_product_sku: the index is now kept in
+# sync from Python, by the receivers in freshmart.signals and by index_products() in
+# freshmart.search for bulk writes (import_catalog) that skip them.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS freshmart_product_fts USING fts5(
+        name, description, category,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS freshmart_product_fts_ai AFTER INSERT ON freshmart_product BEGIN
+        INSERT INTO freshmart_product_fts (rowid, name, description, category)
+        VALUES (new.id, new.name, new.description,
+                (SELECT name FROM freshmart_category WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS freshmart_product_fts_au AFTER UPDATE OF name, description, category_id
+    ON freshmart_product
+    WHEN old.name IS NOT new.name OR old.description IS NOT new.description
+         OR old.category_id IS NOT new.category_id
+    BEGIN
+        UPDATE freshmart_product_fts
+        SET name = new.name, description = new.description,
+            category = (SELECT name FROM freshmart_category WHERE id = new.category_id)
+        WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS freshmart_product_fts_ad AFTER DELETE ON freshmart_product BEGIN
+        DELETE FROM freshmart_product_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS freshmart_category_fts_au AFTER UPDATE OF name ON freshmart_category
+    WHEN old.name IS NOT new.name
+    BEGIN
+        UPDATE freshmart_product_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM freshmart_product WHERE category_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO freshmart_product_fts (rowid, name, description, category)
+    SELECT p.id, p.name, p.description, c.name
+    FROM freshmart_product p JOIN freshmart_category c ON c.id = p.category_id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS freshmart_category_fts_au",
+    "DROP TRIGGER IF EXISTS freshmart_product_fts_ad",
+    "DROP TRIGGER IF EXISTS freshmart_product_fts_au",
+    "DROP TRIGGER IF EXISTS freshmart_product_fts_ai",
+    "DROP TABLE IF EXISTS freshmart_product_fts",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        # FTS5 is SQLite only; other databases fall back to icontains in freshmart.search
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freshmart', '0004_order_totals_and_price_snapshots'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
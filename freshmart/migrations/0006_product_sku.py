@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:22
+
+from django.db import migrations, models
+
+# SQLite applies AddField(unique=True) by rebuilding freshmart_product, which drops
+# the search triggers from 0005 (and breaks the category one). The index is kept in
+# sync from Python instead now (freshmart.signals / freshmart.search), so drop them.
+DROP_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS freshmart_category_fts_au",
+    "DROP TRIGGER IF EXISTS freshmart_product_fts_ad",
+    "DROP TRIGGER IF EXISTS freshmart_product_fts_au",
+    "DROP TRIGGER IF EXISTS freshmart_product_fts_ai",
+]
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_TRIGGERS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freshmart', '0005_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
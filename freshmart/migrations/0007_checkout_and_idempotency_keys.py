@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_completed_at(apps, schema_editor):
+    # Orders completed before checkout existed: the creation time is the best we have
+    Order = apps.get_model('freshmart', 'Order')
+    Order.objects.filter(completed=True, completed_at__isnull=True).update(completed_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freshmart', '0006_product_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='order',
+            name='delivery_address',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='notes',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='phone_number',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=80)),
+                ('key', models.CharField(max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('response', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to='freshmart.order')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner', 'key'), name='idempotency_owner_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freshmart', '0007_checkout_and_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
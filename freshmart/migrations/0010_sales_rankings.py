@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freshmart', '0009_catalog_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Bestseller',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('7d', 'Last 7 days'), ('30d', 'Last 30 days')], max_length=3)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('units', models.PositiveIntegerField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='freshmart.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bestseller_ranks', to='freshmart.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['window', 'category', 'rank'], name='bestseller_window_cat_rank_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='freshmart.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='daily_sales_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='daily_sales_product_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales', serialize=False, to='freshmart.product')),
+                ('units_7d', models.PositiveIntegerField(default=0)),
+                ('units_30d', models.PositiveIntegerField(default=0)),
+                ('as_of', models.DateField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='freshmart.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', '-units_7d'], name='sales_cat_units_7d_idx'), models.Index(fields=['category', '-units_30d'], name='sales_cat_units_30d_idx'), models.Index(fields=['-units_7d'], name='sales_units_7d_idx'), models.Index(fields=['-units_30d'], name='sales_units_30d_idx')],
+            },
+        ),
+    ]
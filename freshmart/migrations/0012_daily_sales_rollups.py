@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freshmart', '0011_copurchase_recommendations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'category daily sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'daily sales',
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='productdailysales',
+            options={'verbose_name_plural': 'product daily sales'},
+        ),
+        migrations.AddField(
+            model_name='productdailysales',
+            name='orders',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['completed_at', 'id'], name='order_completed_at_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='categorydailysales',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='freshmart.category'),
+        ),
+        migrations.AddConstraint(
+            model_name='categorydailysales',
+            constraint=models.UniqueConstraint(fields=('day', 'category'), name='cat_daily_sales_day_cat_uniq'),
+        ),
+    ]
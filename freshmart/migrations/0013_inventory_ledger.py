@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freshmart', '0012_daily_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stock',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock', serialize=False, to='freshmart.product')),
+                ('on_hand', models.PositiveIntegerField(default=0)),
+                ('reserved', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'stock',
+            },
+        ),
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='freshmart.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='freshmart.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='reservation_expires_at_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='reservation_order_product_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('receive', 'Received'), ('adjust', 'Stock count'), ('reserve', 'Reserved'), ('release', 'Released'), ('expire', 'Reservation expired'), ('sell', 'Sold')], max_length=10)),
+                ('on_hand_delta', models.IntegerField(default=0)),
+                ('reserved_delta', models.IntegerField(default=0)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='freshmart.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='freshmart.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-created_at'], name='movement_product_created_idx')],
+            },
+        ),
+    ]
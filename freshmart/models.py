@@ -1,12 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
 # Create your models here.
 from django.contrib.auth.models import User
 
+RATING_CHOICES = [(i, i) for i in range(1, 6)]
+
 # Product categories (e.g., Fruits, Vegetables, Dairy, Snacks)
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -15,28 +22,107 @@ class Category(models.Model):
 # Products available in the shop
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="products")
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # Supplier code, used by import_catalog
     name = models.CharField(max_length=200)
     description = models.TextField()
     price = models.DecimalField(max_digits=8, decimal_places=2)
     image_url = models.URLField(blank=True)   # You already use image links in your HTML
+    # Content hash of the image's resized renditions in MEDIA_ROOT (freshmart.images); '' until generated
+    image_hash = models.CharField(max_length=40, blank=True, editable=False)
     featured = models.BooleanField(default=False)  # For homepage "bestsellers"
+    updated_at = models.DateTimeField(auto_now=True)  # Also bumped by rating changes and import_catalog
+
+    # Review aggregates, kept in step with Review rows (see apply_rating_changes)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    stars_1 = models.PositiveIntegerField(default=0, editable=False)
+    stars_2 = models.PositiveIntegerField(default=0, editable=False)
+    stars_3 = models.PositiveIntegerField(default=0, editable=False)
+    stars_4 = models.PositiveIntegerField(default=0, editable=False)
+    stars_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Composite indexes for the shop sort modes; `id` is the keyset tie breaker
+        indexes = [
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_id_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='product_cat_name_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @property
+    def rating_histogram(self):
+        # [(5, n), (4, n), ...] - highest rating first, like most storefronts show it
+        return [(star, getattr(self, f'stars_{star}')) for star in range(5, 0, -1)]
+
+
+def apply_rating_changes(changes):
+    """
+    Apply review changes to the Product aggregates.
+
+    `changes` is an iterable of (product_id, rating, sign) where sign is +1 for a
+    review that now counts and -1 for one that no longer does. Changes are merged
+    per product and written with one F() UPDATE each, so concurrent reviews can't
+    lose increments.
+    """
+    per_product = {}
+    for product_id, rating, sign in changes:
+        deltas = per_product.setdefault(product_id, {})
+        deltas['review_count'] = deltas.get('review_count', 0) + sign
+        deltas['rating_sum'] = deltas.get('rating_sum', 0) + sign * rating
+        deltas[f'stars_{rating}'] = deltas.get(f'stars_{rating}', 0) + sign
+    for product_id, deltas in per_product.items():
+        updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if updates:
+            Product.objects.filter(pk=product_id).update(**updates, updated_at=Now())
+
 
 # Customer reviews for products
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reviews")
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)  # Optional: link to Django user
     name = models.CharField(max_length=100)  # For guest users
-    rating = models.IntegerField(choices=[(i, i) for i in range(1, 6)])  # 1–5 stars
+    rating = models.IntegerField(choices=RATING_CHOICES)  # 1–5 stars
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='review_product_created_idx'),
+        ]
 
     def __str__(self):
         return f"Review for {self.product.name} by {self.name}"
 
+    def save(self, *args, **kwargs):
+        # The review row and the Product aggregates are written in one transaction
+        with transaction.atomic():
+            changes = []
+            if self.pk is not None:
+                previous = Review.objects.filter(pk=self.pk).values_list('product_id', 'rating').first()
+                if previous is not None:
+                    changes.append((*previous, -1))
+            super().save(*args, **kwargs)
+            changes.append((self.product_id, self.rating, +1))
+            apply_rating_changes(changes)
+
+
+# Deletes go through the deletion collector (also for queryset and cascade deletes),
+# which sends post_delete inside its own transaction.
+@receiver(post_delete, sender=Review)
+def remove_review_from_aggregates(sender, instance, **kwargs):
+    apply_rating_changes([(instance.product_id, instance.rating, -1)])
+
 
 # Contact form messages
 class ContactMessage(models.Model):
@@ -54,6 +140,19 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     completed = models.BooleanField(default=False)
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)  # Set by checkout
+    delivery_address = models.TextField(blank=True)
+    phone_number = models.CharField(max_length=20, blank=True)
+    notes = models.TextField(blank=True)
+    # Stored totals, recalculated from the item snapshots whenever items change
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Incremental jobs walk completed orders from a watermark (see Watermark)
+            models.Index(fields=['completed_at', 'id'], name='order_completed_at_id_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id}"
@@ -63,6 +162,285 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2)  # Product.price when the item was added
 
     def __str__(self):
         return f"{self.quantity} × {self.product.name}"
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = Product.objects.values_list('price', flat=True).get(pk=self.product_id)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            recalculate_order_totals([self.order_id])
+
+
+# Inventory, maintained by freshmart.inventory. Products without a Stock row aren't
+# stock-tracked and can always be bought.
+
+class Stock(models.Model):
+    """
+    Units of a product in the store and held by open carts. Only ever changed with
+    conditional F() updates, each recorded in StockMovement; available = on_hand - reserved.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="stock")
+    on_hand = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'stock'
+
+    def __str__(self):
+        return f"{self.product_id}: {self.on_hand} on hand, {self.reserved} reserved"
+
+    @property
+    def available(self):
+        return max(0, self.on_hand - self.reserved)
+
+
+class Reservation(models.Model):
+    """Units of a product held for an open cart until expires_at; released by the sweeper after that."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='reservation_order_product_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservation_expires_at_idx'),
+        ]
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of Stock changes: summing the deltas of a product gives its
+    counters, which is how rebuild_stock audits and repairs them.
+    """
+    KIND_CHOICES = [
+        ('receive', 'Received'),
+        ('adjust', 'Stock count'),
+        ('reserve', 'Reserved'),
+        ('release', 'Released'),
+        ('expire', 'Reservation expired'),
+        ('sell', 'Sold'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="stock_movements")
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    on_hand_delta = models.IntegerField(default=0)
+    reserved_delta = models.IntegerField(default=0)
+    note = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='movement_product_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.product_id} ({self.on_hand_delta:+}/{self.reserved_delta:+})"
+
+
+# Daily sales rollups, maintained by freshmart.reports from completed orders. A day is
+# the (local) day an order was completed; revenue uses the order items' price snapshots.
+
+class DailySales(models.Model):
+    day = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily sales'
+
+    def __str__(self):
+        return str(self.day)
+
+
+class CategoryDailySales(models.Model):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="daily_sales")
+    day = models.DateField()
+    orders = models.PositiveIntegerField(default=0)  # orders with at least one product of the category
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'category daily sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='cat_daily_sales_day_cat_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.category_id} on {self.day}"
+
+
+class ProductDailySales(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    day = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'product daily sales'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='daily_sales_product_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='daily_sales_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.units}"
+
+
+# Sales rankings, maintained by freshmart.rankings from the daily rollups
+
+class ProductSales(models.Model):
+    """Rolling sales counters of a product; only products that sold in the last 30 days have a row."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="sales")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="+")  # copy of product.category
+    units_7d = models.PositiveIntegerField(default=0)
+    units_30d = models.PositiveIntegerField(default=0)
+    as_of = models.DateField()  # last day of both windows
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', '-units_7d'], name='sales_cat_units_7d_idx'),
+            models.Index(fields=['category', '-units_30d'], name='sales_cat_units_30d_idx'),
+            models.Index(fields=['-units_7d'], name='sales_units_7d_idx'),
+            models.Index(fields=['-units_30d'], name='sales_units_30d_idx'),
+        ]
+
+
+class Bestseller(models.Model):
+    """One row of a precomputed top-N list, per window and category (no category: the whole shop)."""
+    WINDOW_CHOICES = [('7d', 'Last 7 days'), ('30d', 'Last 30 days')]
+
+    window = models.CharField(max_length=3, choices=WINDOW_CHOICES)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="bestseller_ranks")
+    units = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['window', 'category', 'rank'], name='bestseller_window_cat_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.rank} ({self.window}): {self.product_id}"
+
+
+# "Frequently bought together", maintained by freshmart.recommendations
+
+class CoPurchase(models.Model):
+    """
+    Number of completed orders containing both products. Stored in both directions
+    so a product's row range is one index seek; product == other holds the number
+    of orders containing the product.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='copurchase_product_other_uniq'),
+        ]
+
+
+class Recommendation(models.Model):
+    """One of a product's top-k co-purchased products, ranked by score."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="recommendations")
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="recommended_for")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'rank'], name='recommend_product_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} → {self.recommended_id} (#{self.rank})"
+
+
+class Watermark(models.Model):
+    """
+    How far an incremental job has got through completed orders: (completed_at, order id).
+    The submission outbox (freshmart.outbox) only uses order_id, for its last entry id.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    order_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.completed_at} / #{self.order_id}"
+
+    def pending_orders(self):
+        """Completed orders past the watermark, in (completed_at, id) order, as (id, completed_at)."""
+        orders = Order.objects.filter(completed=True, completed_at__isnull=False)
+        if self.completed_at is not None:
+            orders = orders.filter(
+                models.Q(completed_at__gt=self.completed_at)
+                | models.Q(completed_at=self.completed_at, pk__gt=self.order_id)
+            )
+        return orders.order_by('completed_at', 'pk').values_list('pk', 'completed_at')
+
+    def advance(self, order):
+        """Move past `order`, an (id, completed_at) pair from pending_orders."""
+        self.order_id, self.completed_at = order
+        self.save()
+
+
+class IdempotencyKey(models.Model):
+    """A completed checkout request, so a retry with the same key gets the original response."""
+    owner = models.CharField(max_length=80)  # "user:<id>" or "session:<key>"
+    key = models.CharField(max_length=64)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="idempotency_keys")
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'key'], name='idempotency_owner_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} → Order #{self.order_id}"
+
+
+def recalculate_order_totals(order_ids=None):
+    """
+    Recompute Order.item_count and Order.total from the item snapshots.
+
+    Runs as a single UPDATE with correlated subqueries (no join to Product).
+    Pass `None` to recalculate every order. Call this after bulk_create /
+    bulk_update on OrderItem, which skip OrderItem.save().
+    """
+    money = DecimalField(max_digits=12, decimal_places=2)
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    orders = Order.objects.all() if order_ids is None else Order.objects.filter(pk__in=order_ids)
+    return orders.update(
+        item_count=Coalesce(Subquery(items.annotate(n=Sum('quantity')).values('n')), 0),
+        total=Coalesce(
+            Subquery(items.annotate(t=Sum(F('quantity') * F('unit_price'), output_field=money)).values('t')),
+            Value(0, output_field=money),
+        ),
+    )
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_item_from_order_totals(sender, instance, **kwargs):
+    recalculate_order_totals([instance.order_id])
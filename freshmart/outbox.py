@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+
+from .db import serialized_write
+from .models import ContactMessage, Product, Review, Watermark, apply_rating_changes
+from .signals import invalidate
+
+# Contact messages and reviews are validated in the request, then appended to an
+# outbox: a small SQLite file of its own, so a burst of submissions never waits
+# for (or holds) the main database's write lock. drain() moves them over in
+# batches. The id of the last entry applied is stored in the main database, in the
+# same transaction as the rows, so a crash at any point neither loses nor
+# duplicates a submission: entries up to it are only deleted from the outbox
+# afterwards, and skipped if still there. Entry ids restart at 1 in a new outbox
+# file (another host or volume, or the file deleted), so each file gets a random id
+# when it is created and the watermark is kept per file: 'outbox:<file id>'.
+WATERMARK = 'outbox'
+KINDS = ('contact', 'review')
+
+_local = threading.local()
+log = logging.getLogger('freshmart.outbox')
+
+
+def outbox_path():
+    return str(getattr(settings, 'FRESHMART_OUTBOX_PATH', settings.BASE_DIR / 'outbox.sqlite3'))
+
+
+def _connect():
+    path = outbox_path()
+    conn = getattr(_local, 'conn', None)
+    # Not shared across a fork (e.g. preloading servers): each process opens its own
+    if conn is None or _local.key != (path, os.getpid()):
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        # FULL: an entry is on disk before the visitor is told it was received
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=FULL')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Files from before the per-file ids have entries but no id: they keep the plain watermark
+            legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'entry'").fetchone() is not None
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entry ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL,'
+                ' payload TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('queue_id', ?)", ('' if legacy else uuid.uuid4().hex,))
+            queue_id = conn.execute("SELECT value FROM meta WHERE key = 'queue_id'").fetchone()[0]
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        _local.conn, _local.key = conn, (path, os.getpid())
+        _local.watermark = f'{WATERMARK}:{queue_id}' if queue_id else WATERMARK
+    return conn
+
+
+def watermark_name():
+    """Name of the Watermark recording the last entry of this outbox file applied."""
+    _connect()
+    return _local.watermark
+
+
+def enqueue(kind, data):
+    """Durably queue one validated submission; `data` is the model fields as JSON-able values."""
+    if kind not in KINDS:
+        raise ValueError(f'Unknown submission kind {kind!r}.')
+    _connect().execute(
+        'INSERT INTO entry (kind, payload, created_at) VALUES (?, ?, ?)',
+        (kind, json.dumps(data), time.time()),
+    )
+    if getattr(settings, 'FRESHMART_OUTBOX_THREAD', True):
+        _worker.wake()
+
+
+def pending(after=0, limit=None):
+    """Queued entries past `after` as (id, kind, data, created_at), oldest first."""
+    sql = 'SELECT id, kind, payload, created_at FROM entry WHERE id > ? ORDER BY id'
+    params = [after]
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return [(pk, kind, json.loads(payload), created) for pk, kind, payload, created in
+            _connect().execute(sql, params)]
+
+
+def purge(through):
+    """Forget the entries that were applied to the main database."""
+    _connect().execute('DELETE FROM entry WHERE id <= ?', (through,))
+
+
+def stats():
+    """Entries waiting per kind, and the enqueue time of the oldest one."""
+    conn = _connect()
+    applied = Watermark.objects.filter(name=watermark_name()).values_list('order_id', flat=True).first() or 0
+    counts = dict(conn.execute('SELECT kind, COUNT(*) FROM entry WHERE id > ? GROUP BY kind', (applied,)))
+    oldest = conn.execute('SELECT MIN(created_at) FROM entry WHERE id > ?', (applied,)).fetchone()[0]
+    return {'pending': {kind: counts.get(kind, 0) for kind in KINDS}, 'oldest': oldest, 'applied_through': applied}
+
+
+@serialized_write
+def apply_batch(limit):
+    """
+    Write up to `limit` queued entries with bulk_create and update the rating
+    aggregates, in one transaction. Returns (entries applied, last entry id).
+
+    The watermark is read inside the transaction, which holds the write lock, so
+    several drainers (threads or processes) never apply an entry twice.
+    """
+    watermark, _ = Watermark.objects.get_or_create(name=watermark_name())
+    entries = pending(after=watermark.order_id, limit=limit)
+    if not entries:
+        return 0, watermark.order_id
+    messages, reviews = [], []
+    for _, kind, data, _ in entries:
+        if kind == 'contact':
+            messages.append(ContactMessage(**data))
+        else:
+            reviews.append(Review(**data))
+    # A product deleted while its review waited in the queue takes the review with it,
+    # and a deleted account leaves it anonymous (like on_delete=SET_NULL), rather than
+    # failing the foreign key check and with it every batch from then on
+    existing = set(Product.objects.filter(pk__in={review.product_id for review in reviews}).values_list('pk', flat=True))
+    reviews = [review for review in reviews if review.product_id in existing]
+    users = set(User.objects.filter(pk__in={review.user_id for review in reviews}).values_list('pk', flat=True))
+    for review in reviews:
+        if review.user_id not in users:
+            review.user_id = None
+
+    ContactMessage.objects.bulk_create(messages)
+    Review.objects.bulk_create(reviews)
+    # bulk_create skips Review.save() and post_save, so do their work once per batch
+    apply_rating_changes((review.product_id, review.rating, +1) for review in reviews)
+    if reviews:
+        categories = Product.objects.filter(pk__in=existing).values_list('category_id', flat=True).distinct()
+        invalidate('reviews', 'products', *(f'product:{pk}' for pk in existing),
+                   *(f'category:{pk}' for pk in categories))
+    watermark.order_id = entries[-1][0]
+    watermark.save()
+    return len(entries), watermark.order_id
+
+
+def drain(batch_size=500):
+    """Apply everything queued so far; returns the number of entries applied."""
+    applied = 0
+    while True:
+        count, through = apply_batch(batch_size)
+        # Also clears entries a crashed run applied but didn't get to delete
+        purge(through)
+        if not count:
+            return applied
+        applied += count
+
+
+class _Worker:
+    """
+    In-process drainer: a daemon thread that wakes on enqueue and drains after a
+    short delay, so a burst is written as one batch. Deployments that run
+    `manage.py drain_outbox` as a separate process can turn it off with
+    FRESHMART_OUTBOX_THREAD = False.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='freshmart-outbox', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        delay = getattr(settings, 'FRESHMART_OUTBOX_DELAY', 0.5)
+        while True:
+            self._event.wait()
+            time.sleep(delay)
+            self._event.clear()
+            try:
+                drain()
+            except Exception:
+                log.exception('Draining the submission outbox failed')
+                # Entries stay queued; the next submission or drain_outbox retries them
+                self._event.set()
+                time.sleep(delay * 10)
+            finally:
+                connection.close()  # This thread's own connection
+
+
+_worker = _Worker()
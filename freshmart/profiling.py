@@ -0,0 +1,199 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+SAMPLES_PER_VIEW = 1000  # latest samples kept per view for the percentiles
+DUPLICATE_THRESHOLD = 3  # the same SQL this many times in one request looks like an N+1
+SLOW_LOG_NAME = 'slow_requests.jsonl'
+SLOW_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_LOG_BACKUPS = 5
+FLUSH_INTERVAL = 10  # seconds between writes of this process's view stats
+
+slow_log = logging.getLogger('freshmart.slow_requests')
+
+# Profile of the request being handled, for the template timer
+_active = contextvars.ContextVar('freshmart_request_profile', default=None)
+
+
+class RequestProfile:
+    """Counters for one request. Also the execute_wrapper that times every query."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            # ORM SQL keeps its values in params, so the text identifies the query shape
+            self.signatures[sql] += 1
+
+    def duplicates(self):
+        return [
+            {'sql': sql[:500], 'count': count}
+            for sql, count in self.signatures.most_common(5) if count >= DUPLICATE_THRESHOLD
+        ]
+
+
+def _timed_render(self, context=None, request=None):
+    profile = _active.get()
+    if profile is None or profile.rendering:
+        return _original_render(self, context, request)
+    profile.rendering = True
+    started, db_before = time.perf_counter(), profile.db_time
+    try:
+        return _original_render(self, context, request)
+    finally:
+        # Queries run lazily from the template are already counted as DB time
+        profile.template_time += time.perf_counter() - started - (profile.db_time - db_before)
+        profile.rendering = False
+
+
+_original_render = DjangoTemplate.render
+
+
+class ViewStats:
+    """Per-view latency samples for this process, flushed to a JSON file for profile_report."""
+
+    def __init__(self, directory):
+        self.path = Path(directory) / f'views-{os.getpid()}.json'
+        self.samples = defaultdict(lambda: deque(maxlen=SAMPLES_PER_VIEW))
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def add(self, view, wall_ms, db_ms, queries):
+        with self.lock:
+            self.samples[view].append((round(wall_ms, 2), round(db_ms, 2), queries))
+            self.counts[view] += 1
+        if time.monotonic() - self.last_flush > FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.monotonic()
+            data = {view: {'count': self.counts[view], 'samples': list(samples)}
+                    for view, samples in self.samples.items()}
+        if not data:
+            return
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
+
+def load_view_stats(directory):
+    """Merge the stats files of every process into {view: {'count': n, 'samples': [...]}}."""
+    merged = defaultdict(lambda: {'count': 0, 'samples': []})
+    for path in Path(directory).glob('views-*.json'):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for view, stats in data.items():
+            merged[view]['count'] += stats['count']
+            merged[view]['samples'].extend(stats['samples'])
+    return dict(merged)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class RequestProfilerMiddleware:
+    """
+    Opt-in request profiling: query count, DB time, repeated queries, template and wall time.
+
+    Enabled by FRESHMART_PROFILE_SAMPLE_RATE (fraction of requests profiled). At 0
+    the middleware removes itself from the stack, so it costs nothing. Profiled
+    requests get a Server-Timing header, requests slower than FRESHMART_PROFILE_SLOW_MS
+    go to a rotating JSON-lines log, and per-view percentiles are kept for
+    `manage.py profile_report`. Put it first in MIDDLEWARE so wall time covers
+    the whole stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'FRESHMART_PROFILE_SAMPLE_RATE', 0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.slow_ms = getattr(settings, 'FRESHMART_PROFILE_SLOW_MS', 500)
+        directory = Path(settings.FRESHMART_PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        DjangoTemplate.render = _timed_render
+        if not slow_log.handlers:  # unless LOGGING already configures it
+            handler = RotatingFileHandler(directory / SLOW_LOG_NAME, maxBytes=SLOW_LOG_MAX_BYTES,
+                                          backupCount=SLOW_LOG_BACKUPS, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            slow_log.addHandler(handler)
+            slow_log.setLevel(logging.INFO)
+            slow_log.propagate = False
+        self.stats = ViewStats(directory)
+        atexit.register(self.stats.flush)
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _active.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _active.reset(token)
+        wall_ms = (time.perf_counter() - started) * 1000
+        db_ms = profile.db_time * 1000
+        template_ms = profile.template_time * 1000
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.1f};desc="{profile.queries} queries"',
+            f'tpl;dur={template_ms:.1f}',
+            f'app;dur={max(0.0, wall_ms - db_ms - template_ms):.1f}',
+            f'total;dur={wall_ms:.1f}',
+        ])
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        self.stats.add(view, wall_ms, db_ms, profile.queries)
+
+        if wall_ms >= self.slow_ms:
+            slow_log.info(json.dumps({
+                'time': datetime.now(timezone.utc).isoformat(),
+                'method': request.method,
+                'path': request.get_full_path(),
+                'view': view,
+                'status': response.status_code,
+                'wall_ms': round(wall_ms, 1),
+                'db_ms': round(db_ms, 1),
+                'template_ms': round(template_ms, 1),
+                'queries': profile.queries,
+                'duplicates': profile.duplicates(),
+            }))
+        return response
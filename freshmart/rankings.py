@@ -0,0 +1,115 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import Bestseller, Product, ProductSales
+from .signals import invalidate
+
+# Rolling windows, in days (including today)
+WINDOWS = {'7d': 7, '30d': 30}
+LONGEST_WINDOW = max(WINDOWS.values())
+
+
+def top_size():
+    return getattr(settings, 'FRESHMART_BESTSELLERS', 12)
+
+
+def window_start(today, days):
+    return today - timedelta(days=days - 1)
+
+
+def update_rankings(product_ids, today=None):
+    """
+    Refresh the rankings these products can change, after their sales were rolled up.
+
+    Only their counters are recomputed, and only their categories' top lists rebuilt.
+    """
+    if not product_ids:
+        return
+    categories = refresh_windows(list(product_ids), today=today)
+    if refresh_top_lists(categories):
+        invalidate('bestsellers')
+
+
+def refresh_windows(product_ids=None, today=None):
+    """
+    Recompute the rolling counters from the daily rows; returns the categories involved.
+
+    `product_ids=None` recomputes every product, which also lets counters of
+    products that stopped selling decay (run it daily, see rebuild_bestsellers).
+    """
+    today = today or timezone.localdate()
+    in_window = Q(daily_sales__day__gte=window_start(today, LONGEST_WINDOW), daily_sales__day__lte=today)
+    products = Product.objects.filter(in_window)
+    stale = ProductSales.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+        stale = stale.filter(product_id__in=product_ids)
+    counters = {
+        f'units_{window}': Sum('daily_sales__units', filter=Q(daily_sales__day__gte=window_start(today, days)))
+        for window, days in WINDOWS.items()
+    }
+    rows = [
+        ProductSales(product_id=row['pk'], category_id=row['category_id'], as_of=today,
+                     **{field: row[field] or 0 for field in counters})
+        for row in products.order_by().values('pk', 'category_id').annotate(**counters)
+    ]
+    categories = set(stale.values_list('category_id', flat=True))
+    stale.delete()
+    ProductSales.objects.bulk_create(rows, batch_size=500)
+    return categories | {row.category_id for row in rows}
+
+
+def refresh_top_lists(category_ids=None):
+    """
+    Rebuild the top-N lists of these categories and of the whole shop (all categories
+    if None); returns whether the products or order of any list changed.
+
+    Nearly every sale changes some unit counts, but rarely a ranking: lists whose
+    order stays the same only get their counts updated, which pages don't show, so
+    the caller needn't invalidate the "bestsellers" pages for them.
+    """
+    if category_ids is None:
+        category_ids = set(ProductSales.objects.values_list('category_id', flat=True).distinct())
+        category_ids |= set(Bestseller.objects.exclude(category=None).values_list('category_id', flat=True))
+    changed = False
+    for window in WINDOWS:
+        for category_id in [None, *category_ids]:
+            field = f'units_{window}'
+            candidates = ProductSales.objects.filter(**{f'{field}__gt': 0})
+            current = Bestseller.objects.filter(window=window)
+            if category_id is None:
+                current = current.filter(category__isnull=True)
+            else:
+                candidates = candidates.filter(category_id=category_id)
+                current = current.filter(category_id=category_id)
+            top = list(candidates.order_by(f'-{field}', 'product_id').values_list('product_id', field)[:top_size()])
+            rows = list(current.order_by('rank'))
+            if [row.product_id for row in rows] == [product_id for product_id, _ in top]:
+                stale = []
+                for row, (_, units) in zip(rows, top):
+                    if row.units != units:
+                        row.units = units
+                        stale.append(row)
+                Bestseller.objects.bulk_update(stale, ['units'])
+                continue
+            current.delete()
+            Bestseller.objects.bulk_create([
+                Bestseller(window=window, category_id=category_id, rank=rank, product_id=product_id, units=units)
+                for rank, (product_id, units) in enumerate(top, start=1)
+            ])
+            changed = True
+    return changed
+
+
+def top_products(window='7d', category_id=None, limit=None):
+    """Products of a precomputed top list, best first: one indexed query."""
+    ranks = {'bestseller_ranks__window': window}
+    if category_id is None:
+        ranks['bestseller_ranks__category__isnull'] = True
+    else:
+        ranks['bestseller_ranks__category_id'] = category_id
+    products = Product.objects.filter(**ranks).order_by('bestseller_ranks__rank')
+    return products[:limit] if limit else products
@@ -0,0 +1,153 @@
+import functools
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+# Anonymous input (contact messages, guest reviews) is limited per client IP and per
+# session with token buckets: a bucket holds up to `requests` tokens, refilled evenly
+# over `seconds`, and every POST takes one. Over-limit POSTs get a 429 from the view
+# decorator before the form is validated or the database is touched. The session comes
+# from its cookie alone (loading it would be a query); clients without one are only
+# limited by IP.
+
+
+class TokenBuckets:
+    """
+    Token buckets in a thread-safe per-process LRU table of at most `max_entries`
+    (tokens, last update) pairs. A bucket that is evicted, like one never seen, is full.
+    """
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period, now):
+        """Take a token from `key`'s bucket; returns 0 if it had one, else seconds until it will."""
+        with self._lock:
+            state = self._data.get(key)
+            if state is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, state[0] + (now - state[1]) * capacity / period)
+                self._data.move_to_end(key)
+            if tokens >= 1:
+                self._data[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._data[key] = (tokens, now)
+                wait = (1 - tokens) * period / capacity
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CacheTokenBuckets:
+    """
+    The same buckets in a Django cache backend, shared by the workers using it. The
+    read and the write are separate calls, so workers racing on one bucket may let a
+    few extra requests through: enough for shedding a flood, not for exact quotas.
+    """
+
+    evictions = 0
+
+    def __init__(self, alias, prefix='fm:rl'):
+        self.alias = alias
+        self.prefix = prefix
+
+    def take(self, key, capacity, period, now):
+        cache = caches[self.alias]
+        key = f'{self.prefix}:{key}'
+        state = cache.get(key)
+        tokens = capacity if state is None else min(capacity, state[0] + (now - state[1]) * capacity / period)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) * period / capacity
+        # Expires once the bucket would be full again anyway
+        cache.set(key, (tokens - 1 if not wait else tokens, now), timeout=int(period) + 1)
+        return wait
+
+    def clear(self):
+        pass  # entries expire on their own
+
+    def __len__(self):
+        return 0
+
+
+def client_ip(request):
+    header = settings.FRESHMART_CLIENT_IP_HEADER
+    if header and request.META.get(header):
+        # X-Forwarded-For style lists: the proxy appends the address it saw last
+        return request.META[header].rsplit(',', 1)[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class RateLimiter:
+    """Checks requests against FRESHMART_RATE_LIMITS and counts what it allowed and rejected."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.stats = Counter()
+
+    def check(self, request, scope):
+        """Seconds the client must wait before `scope` takes another request from it, 0 if it may go ahead."""
+        limits = settings.FRESHMART_RATE_LIMITS.get(scope, {})
+        # Wall clock rather than monotonic time, so buckets kept in a shared cache agree
+        now = time.time()
+        # Session first: a flood from one session shouldn't drain the bucket it shares with
+        # everyone else behind the same address
+        for kind, client in (('session', request.COOKIES.get(settings.SESSION_COOKIE_NAME)),
+                             ('ip', client_ip(request))):
+            if not client or kind not in limits:
+                continue
+            requests, seconds = limits[kind]
+            wait = self.buckets.take(f'{scope}:{kind}:{client}', requests, seconds, now)
+            if wait:
+                self.stats[f'{scope}_rejected_by_{kind}'] += 1
+                return wait
+        self.stats[f'{scope}_allowed'] += 1
+        return 0.0
+
+    def snapshot(self):
+        return {**dict(sorted(self.stats.items())), 'buckets': len(self.buckets), 'evictions': self.buckets.evictions}
+
+    def clear(self):
+        self.buckets.clear()
+        self.stats.clear()
+
+
+def make_buckets():
+    if settings.FRESHMART_RATE_LIMIT_CACHE:
+        return CacheTokenBuckets(settings.FRESHMART_RATE_LIMIT_CACHE)
+    return TokenBuckets(settings.FRESHMART_RATE_LIMIT_ENTRIES)
+
+
+limiter = RateLimiter(make_buckets())
+
+
+def rate_limited(scope, methods=('POST',)):
+    """Answer `methods` requests to the view with 429 Too Many Requests once a client is over `scope`'s limits."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                wait = limiter.check(request, scope)
+                if wait:
+                    response = HttpResponse('Too many requests, please try again later.\n', status=429,
+                                            content_type='text/plain; charset=utf-8')
+                    response['Retry-After'] = str(int(wait) + 1)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
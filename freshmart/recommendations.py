@@ -0,0 +1,148 @@
+import heapq
+import math
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+import django
+from django.conf import settings
+from django.db.models import F
+
+from .db import add_counts, serialized_write
+from .models import CoPurchase, OrderItem, Recommendation, Watermark
+from .signals import invalidate
+
+WATERMARK = 'recommendations'
+# A huge basket (a wholesale order) says little about which products go together and
+# would add len² pairs: its products are counted, but not paired.
+MAX_BASKET = 50
+MIN_SUPPORT = 2  # pairs bought together in fewer orders than this aren't recommended
+
+
+def top_k():
+    return getattr(settings, 'FRESHMART_RECOMMENDATIONS', 8)
+
+
+def count_pairs(baskets):
+    """
+    Co-occurrence counts of a list of baskets (sorted product id tuples) as
+    {(a, b): orders} with a <= b; (a, a) counts the orders containing a.
+
+    Pure and picklable, so batches can be counted in worker processes.
+    """
+    pairs = Counter()
+    for basket in baskets:
+        if len(basket) > MAX_BASKET:
+            pairs.update((product, product) for product in basket)
+            continue
+        for i, product in enumerate(basket):
+            for other in basket[i:]:
+                pairs[product, other] += 1
+    return pairs
+
+
+def read_baskets(order_ids):
+    items = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .order_by('order_id', 'product_id')
+        .values_list('order_id', 'product_id')
+        .distinct()
+    )
+    return [tuple(product for _, product in rows) for _, rows in groupby(items, key=lambda row: row[0])]
+
+
+@serialized_write
+def add_pairs(pairs, watermark, last_order):
+    """Add pair counts (both directions) and move the watermark, in one transaction."""
+    rows = []
+    for (product, other), orders in pairs.items():
+        rows.append((product, other, orders))
+        if product != other:
+            rows.append((other, product, orders))
+    add_counts(CoPurchase, ['product', 'other'], ['orders'], rows)
+    watermark.advance(last_order)
+
+
+def index_new_orders(batch_size=5000, workers=1, log=None):
+    """
+    Count the co-purchases of orders completed since the last run; returns
+    (orders processed, ids of the products whose neighbours changed).
+
+    Orders are read `batch_size` at a time, so memory is bounded by one batch's
+    pairs whatever the history size. With workers > 1 each batch is split and
+    counted in that many processes; the database is only touched here.
+    """
+    watermark, _ = Watermark.objects.get_or_create(name=WATERMARK)
+    touched, processed = set(), 0
+    # Workers only count; django.setup lets them unpickle this module's functions under "spawn" too
+    pool = ProcessPoolExecutor(workers, initializer=django.setup) if workers > 1 else None
+    try:
+        while True:
+            orders = list(watermark.pending_orders()[:batch_size])
+            if not orders:
+                break
+            baskets = read_baskets([pk for pk, _ in orders])
+            if pool:
+                size = max(1, math.ceil(len(baskets) / workers))
+                pairs = Counter()
+                for counted in pool.map(count_pairs, [baskets[i:i + size] for i in range(0, len(baskets), size)]):
+                    pairs.update(counted)
+            else:
+                pairs = count_pairs(baskets)
+            add_pairs(pairs, watermark, orders[-1])
+            touched.update(product for pair in pairs for product in pair)
+            processed += len(orders)
+            if log:
+                log(f'{processed} orders, {len(pairs)} pairs in the last batch')
+    finally:
+        if pool:
+            pool.shutdown()
+    return processed, touched
+
+
+def refresh_recommendations(product_ids, chunk_size=500):
+    """
+    Rebuild the top-k lists of these products from the pair counts.
+
+    Score is the cosine similarity orders(a, b) / sqrt(orders(a) * orders(b)),
+    so products that are simply in every basket don't crowd out real pairings.
+    Lists of products without new orders keep their scores until they are
+    touched again or the index is rebuilt with --full.
+    """
+    product_ids = sorted(product_ids)
+    k = top_k()
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        neighbours = {}
+        for product, other, orders in CoPurchase.objects.filter(product_id__in=chunk).values_list(
+                'product_id', 'other_id', 'orders'):
+            neighbours.setdefault(product, []).append((other, orders))
+        others = {other for pairs in neighbours.values() for other, _ in pairs}
+        totals = dict(
+            CoPurchase.objects.filter(product_id__in=others | set(chunk), other_id=F('product_id'))
+            .values_list('product_id', 'orders')
+        )
+        rows = []
+        for product, pairs in neighbours.items():
+            scored = (
+                (orders / math.sqrt(totals[product] * totals[other]), other)
+                for other, orders in pairs if other != product and orders >= MIN_SUPPORT
+            )
+            for rank, (score, other) in enumerate(heapq.nlargest(k, scored), start=1):
+                rows.append(Recommendation(product_id=product, recommended_id=other, rank=rank, score=round(score, 6)))
+        replace_recommendations(chunk, rows)
+
+
+@serialized_write
+def replace_recommendations(product_ids, rows):
+    Recommendation.objects.filter(product_id__in=product_ids).delete()
+    Recommendation.objects.bulk_create(rows, batch_size=500)
+    invalidate(*(f'product:{pk}' for pk in product_ids))
+
+
+@serialized_write
+def reset():
+    """Forget every count, list and the watermark, for a rebuild from the whole history."""
+    Recommendation.objects.all().delete()
+    CoPurchase.objects.all().delete()
+    Watermark.objects.filter(name=WATERMARK).delete()
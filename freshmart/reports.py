@@ -0,0 +1,154 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Sum
+from django.utils import timezone
+
+from .db import add_counts, serialized_write
+from .models import CategoryDailySales, DailySales, OrderItem, ProductDailySales, Watermark
+
+WATERMARK = 'sales_rollups'
+# Checkout rolls up at most this many pending orders inline (normally just its own);
+# a backlog, e.g. right after deploying, is left to `manage.py rollup_sales`
+INLINE_ROLLUP_ORDERS = 50
+
+GROUPINGS = ('day', 'category', 'product')
+
+
+class ReportError(ValueError):
+    """Raised for report parameters that can't be answered."""
+
+
+@serialized_write
+def roll_up_batch(limit):
+    """
+    Add up to `limit` orders past the watermark to the three rollups and move the
+    watermark past them; returns (orders rolled up, their product ids).
+
+    The watermark is read inside the transaction, so concurrent runs (checkout's
+    inline one and the command) never count an order twice.
+    """
+    watermark, _ = Watermark.objects.get_or_create(name=WATERMARK)
+    orders = list(watermark.pending_orders()[:limit])
+    if not orders:
+        return 0, set()
+    days = {order_id: timezone.localdate(completed_at) for order_id, completed_at in orders}
+    money = DecimalField(max_digits=12, decimal_places=2)
+    lines = (
+        OrderItem.objects.filter(order_id__in=days)
+        .order_by().values('order_id', 'product_id', 'product__category_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('quantity') * F('unit_price'), output_field=money))
+    )
+    per_day = defaultdict(lambda: [set(), 0, Decimal('0')])  # orders, units, revenue
+    per_category = defaultdict(lambda: [set(), 0, Decimal('0')])
+    per_product = defaultdict(lambda: [set(), 0, Decimal('0')])
+    for line in lines:
+        day = days[line['order_id']]
+        for totals in (per_day[day], per_category[day, line['product__category_id']],
+                       per_product[day, line['product_id']]):
+            totals[0].add(line['order_id'])
+            totals[1] += line['units']
+            totals[2] += line['revenue']
+
+    add_counts(DailySales, ['day'], ['orders', 'units', 'revenue'],
+               [(day, len(o), units, revenue) for day, (o, units, revenue) in per_day.items()])
+    add_counts(CategoryDailySales, ['day', 'category'], ['orders', 'units', 'revenue'],
+               [(*key, len(o), units, revenue) for key, (o, units, revenue) in per_category.items()])
+    add_counts(ProductDailySales, ['day', 'product'], ['orders', 'units', 'revenue'],
+               [(*key, len(o), units, revenue) for key, (o, units, revenue) in per_product.items()])
+    watermark.advance(orders[-1])
+    return len(orders), {product_id for _, product_id in per_product}
+
+
+def roll_up(batch_size=2000, max_orders=None):
+    """
+    Add the orders completed since the high-water mark to the daily rollups.
+
+    Each batch is one transaction that also moves the watermark, so an
+    interrupted run resumes where it stopped and no order is counted twice.
+    Returns (orders rolled up, ids of the products they contain).
+    """
+    processed, product_ids = 0, set()
+    while max_orders is None or processed < max_orders:
+        count, products = roll_up_batch(batch_size if max_orders is None else min(batch_size, max_orders - processed))
+        if not count:
+            break
+        processed += count
+        product_ids |= products
+    return processed, product_ids
+
+
+@serialized_write
+def reset_rollups():
+    for model in (DailySales, CategoryDailySales, ProductDailySales):
+        model.objects.all().delete()
+    Watermark.objects.filter(name=WATERMARK).delete()
+
+
+def parse_period(start=None, end=None):
+    """ISO dates to a (start, end) pair of dates, month to date by default."""
+    today = timezone.localdate()
+    try:
+        end = date.fromisoformat(end) if end else today
+        start = date.fromisoformat(start) if start else end.replace(day=1)
+    except ValueError:
+        raise ReportError('Dates must be given as YYYY-MM-DD.')
+    if start > end:
+        raise ReportError('The start date is after the end date.')
+    return start, end
+
+
+def sales_report(start, end, by='day', category_id=None, limit=50):
+    """
+    Sales between two days (inclusive), read from the rollups only.
+
+    Grouped by day, category or product; the totals always cover the whole
+    period. A category's order count is the number of orders that contained
+    any of its products, so those don't add up to the total across categories.
+    """
+    if by not in GROUPINGS:
+        raise ReportError(f"Group by one of: {', '.join(GROUPINGS)}.")
+    period = {'day__gte': start, 'day__lte': end}
+    sums = {'orders': Sum('orders'), 'units': Sum('units'), 'revenue': Sum('revenue')}
+    if category_id is None:
+        totals = DailySales.objects.filter(**period).aggregate(**sums)
+    else:
+        totals = CategoryDailySales.objects.filter(**period, category_id=category_id).aggregate(**sums)
+
+    if by == 'day':
+        if category_id is None:
+            rows = DailySales.objects.filter(**period).order_by('day').values('day', 'orders', 'units', 'revenue')
+        else:
+            rows = (CategoryDailySales.objects.filter(**period, category_id=category_id)
+                    .order_by('day').values('day', 'orders', 'units', 'revenue'))
+    elif by == 'category':
+        rows = CategoryDailySales.objects.filter(**period)
+        if category_id is not None:
+            rows = rows.filter(category_id=category_id)
+        rows = rows.values('category_id', 'category__name').annotate(**sums).order_by('-revenue')[:limit]
+    else:
+        rows = ProductDailySales.objects.filter(**period)
+        if category_id is not None:
+            rows = rows.filter(product__category_id=category_id)
+        rows = rows.values('product_id', 'product__name').annotate(**sums).order_by('-revenue')[:limit]
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'by': by,
+        'totals': {
+            'orders': totals['orders'] or 0,
+            'units': totals['units'] or 0,
+            'revenue': f"{totals['revenue'] or 0:.2f}",
+        },
+        'rows': [{key.replace('__', '_'): _json_value(value) for key, value in row.items()} for row in rows],
+    }
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return f'{value:.2f}'  # SQLite sums come back without the trailing zeros
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
@@ -0,0 +1,168 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+
+from .catalog import CARD_FIELDS, CatalogError, MAX_PAGE_SIZE, aresolve_category, resolve_category
+from .models import Product
+
+# FTS5 table holding name, description and category name per product (rowid = product id).
+# Created by migration 0005_product_search_index; kept in sync by the receivers in
+# freshmart.signals, and by index_products() for bulk writes that skip signals.
+FTS_TABLE = 'freshmart_product_fts'
+
+# bm25() column weights: a hit in the name matters most, then the category, then the description
+RANK = f'bm25({FTS_TABLE}, 10.0, 2.0, 5.0)'
+
+SEARCH_SQL = f"""
+    SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE}
+    {{join}}
+    WHERE {FTS_TABLE} MATCH %s {{where}}
+    ORDER BY {RANK}
+    LIMIT %s OFFSET %s
+"""
+
+INDEX_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, description, category)
+    SELECT p.id, p.name, p.description, c.name
+    FROM freshmart_product p JOIN freshmart_category c ON c.id = p.category_id
+    WHERE {{where}}
+"""
+
+UNINDEX_SQL = f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM freshmart_product p WHERE {{where}})"
+
+REBUILD_SQL = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, description, category)
+    SELECT p.id, p.name, p.description, c.name
+    FROM freshmart_product p JOIN freshmart_category c ON c.id = p.category_id
+    """,
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')",
+]
+
+# Ids of every matching product, e.g. for queryset.filter(pk__in=RawSQL(MATCH_IDS_SQL, [match]))
+MATCH_IDS_SQL = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """
+    Turn free text from a search box into a safe FTS5 MATCH expression.
+
+    Every word is quoted (so FTS syntax in user input is never interpreted) and
+    the last word becomes a prefix query, which is what makes typeahead work:
+    "organic app" -> "organic" "app"*
+    """
+    tokens = TOKEN_RE.findall(text or '')[:10]
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _search_params(text, cursor, limit):
+    match = build_match_query(text)
+    if match is None:
+        return None, None, None
+    try:
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        offset = max(0, int(cursor or 0))
+    except (TypeError, ValueError):
+        raise CatalogError('Invalid limit or cursor.')
+    return match, limit, offset
+
+
+def _matching_ids(text, match, category_id, limit, offset):
+    """Ids of one page of matches, best first, plus one to tell whether there's a next page."""
+    if not fts_available():
+        queryset = Product.objects.filter(name__icontains=' '.join(TOKEN_RE.findall(text)))
+        if category_id is not None:
+            queryset = queryset.filter(category_id=category_id)
+        return list(queryset.order_by('name', 'id').values_list('pk', flat=True)[offset:offset + limit + 1])
+    join, where, params = '', '', [match]
+    if category_id is not None:
+        join = f'JOIN freshmart_product p ON p.id = {FTS_TABLE}.rowid'
+        where = 'AND p.category_id = %s'
+        params.append(category_id)
+    with connection.cursor() as db:
+        db.execute(SEARCH_SQL.format(join=join, where=where), params + [limit + 1, offset])
+        return [row[0] for row in db.fetchall()]
+
+
+def _next_cursor(ids, limit, offset):
+    if len(ids) > limit:
+        return ids[:limit], str(offset + limit)
+    return ids, None
+
+
+def search_products(text, category=None, cursor=None, limit=20):
+    """
+    Return one page of BM25-ranked products as (rows, next_cursor).
+
+    The cursor is the offset of the next page; relevance order has no stable
+    keyset, and people rarely page deep into search results.
+    """
+    match, limit, offset = _search_params(text, cursor, limit)
+    if match is None:
+        return [], None
+    category_id = resolve_category(category)
+    ids, next_cursor = _next_cursor(_matching_ids(text, match, category_id, limit, offset), limit, offset)
+    by_id = {row['id']: row for row in Product.objects.filter(pk__in=ids).values(*CARD_FIELDS)}
+    return [by_id[pk] for pk in ids if pk in by_id], next_cursor
+
+
+async def asearch_products(text, category=None, cursor=None, limit=20):
+    """search_products for async views. Django has no async cursor, so the raw FTS query runs in a thread."""
+    match, limit, offset = _search_params(text, cursor, limit)
+    if match is None:
+        return [], None
+    category_id = await aresolve_category(category)
+    ids = await sync_to_async(_matching_ids)(text, match, category_id, limit, offset)
+    ids, next_cursor = _next_cursor(ids, limit, offset)
+    by_id = {row['id']: row async for row in Product.objects.filter(pk__in=ids).values(*CARD_FIELDS)}
+    return [by_id[pk] for pk in ids if pk in by_id], next_cursor
+
+
+def _reindex(where, params):
+    with connection.cursor() as db:
+        db.execute(UNINDEX_SQL.format(where=where), params)
+        db.execute(INDEX_SQL.format(where=where), params)
+
+
+def index_products(ids=None, skus=None, category_id=None):
+    """(Re)index the given products: by id, by sku (bulk upserts don't return ids) or a whole category."""
+    if not fts_available():
+        return
+    for column, values in (('p.id', ids), ('p.sku', skus)):
+        values = list(values or [])
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            _reindex(f"{column} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+    if category_id is not None:
+        _reindex('p.category_id = %s', [category_id])
+
+
+def unindex_products(ids):
+    if not fts_available():
+        return
+    ids = list(ids)
+    with connection.cursor() as db:
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            db.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        for sql in REBUILD_SQL:
+            cursor.execute(sql)
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
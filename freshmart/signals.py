@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import catalog_cache
+from .images import ImageError, ensure_product_image
+from .models import Bestseller, Category, Product, Review
+from .search import index_products, unindex_products
+
+SEARCH_FIELDS = ('name', 'description', 'category_id')
+
+# Renditions of changed images are generated in the background, off the request
+_image_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='freshmart-images')
+
+
+# Cache namespaces (see freshmart.cache.TieredCache):
+#   categories      category list fragments and the shop filter options
+#   featured        the homepage grid's fallback: products flagged as featured
+#   bestsellers     the precomputed sales rankings (freshmart.rankings)
+#   reviews         the homepage "Customer Reviews" block
+#   products        catalog listings across all categories
+#   category:<id>   catalog listings of one category
+#   product:<id>    one product page
+def invalidate(*namespaces):
+    # Bump after commit, so no request can cache the old rows under the new version
+    transaction.on_commit(lambda: catalog_cache.bump(*namespaces))
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_product(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk is not None:
+        instance._previous = (
+            Product.objects.filter(pk=instance.pk).values('featured', 'image_url', *SEARCH_FIELDS).first()
+        )
+    if instance._previous is None or instance._previous['image_url'] != instance.image_url:
+        instance.image_hash = ''  # Old renditions are for the old picture
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+
+    namespaces = ['products', f'product:{instance.pk}', f'category:{instance.category_id}']
+    featured = instance.featured
+    if previous is not None:
+        namespaces.append(f"category:{previous['category_id']}")
+        featured = featured or previous['featured']
+    if featured:
+        namespaces.append('featured')
+    if Bestseller.objects.filter(product=instance).exists():
+        namespaces.append('bestsellers')  # The ranked grids show the name, price and picture
+    invalidate(*namespaces)
+
+    # Price or flag edits (e.g. list_editable in the admin) don't touch the search index
+    if previous is None or any(previous[field] != getattr(instance, field) for field in SEARCH_FIELDS):
+        index_products(ids=[instance.pk])
+
+    if instance.image_url and not instance.image_hash:
+        transaction.on_commit(lambda: _image_pool.submit(generate_product_image, instance.pk))
+
+
+def generate_product_image(product_id):
+    try:
+        ensure_product_image(product_id)
+    except (ImageError, Product.DoesNotExist):
+        pass  # The proxy view retries on the next request, and falls back to the original URL
+    finally:
+        connection.close()  # This thread's own connection
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    namespaces = ['products', f'product:{instance.pk}', f'category:{instance.category_id}']
+    if instance.featured:
+        namespaces.append('featured')
+    namespaces.append('bestsellers')  # Its ranks are gone with it
+    invalidate(*namespaces)
+    unindex_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    # Product cards and the search index carry the category name
+    invalidate('categories', 'products', f'category:{instance.pk}')
+    if not created:
+        index_products(category_id=instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    invalidate('categories', 'products', f'category:{instance.pk}')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_product(sender, instance, **kwargs):
+    # Listings show the rating, so the product's category listing is affected as well
+    category_id = Product.objects.filter(pk=instance.product_id).values_list('category_id', flat=True).first()
+    invalidate('reviews', 'products', f'product:{instance.product_id}', f'category:{category_id}')
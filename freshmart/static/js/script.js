@@ -3,9 +3,10 @@
  * Handles interactivity for the FreshMart Grocery Website Template.
  * Version: Includes dynamic Cart Modal Title update.
  * Includes: Mobile Menu, Theme Toggle, Scroll-to-Top,
- * Product Loading (Bestsellers, Shop Page), Filtering/Sorting,
+ * Product Loading (Shop Page), Filtering/Sorting,
  * Product Detail Modal, Shopping Cart Modal & Functionality.
- * Assumes products.js (with 'products' and 'bestsellerIds' arrays) is loaded first.
+ * Shop page products come from the JSON catalog API (paged with a cursor).
+ * The cart is kept on the server (cart API) and synced in debounced batches of changes.
  */
 document.addEventListener('DOMContentLoaded', () => {
 
@@ -81,40 +82,101 @@ document.addEventListener('DOMContentLoaded', () => {
     const productDetailContainer = document.getElementById('product-detail-container');
 
     let cart = []; // Initialize cart array
+    const catalogCache = new Map(); // Products received from the catalog API, keyed by id
+
+    // Look up a product received from the catalog API by id
+    function findProduct(productId) {
+        return catalogCache.get(String(productId));
+    }
 
     // ==================================
-    // CART HELPER FUNCTIONS (LocalStorage, Counter Update)
+    // CART HELPER FUNCTIONS (Server Sync, Counter Update)
     // ==================================
-    function loadCart() {
-        const storedCart = localStorage.getItem('freshmartCart');
-        if (storedCart) {
-            try {
-                cart = JSON.parse(storedCart);
-                if (!Array.isArray(cart)) { // Basic validation
-                     cart = [];
-                     console.warn("Stored cart was not an array, resetting.");
-                     localStorage.removeItem('freshmartCart');
-                }
-                // Ensure quantities are numbers
-                cart = cart.map(item => ({ ...item, quantity: parseInt(item.quantity) || 1 }));
+    // The cart lives on the server (an open Order). Clicks update the local copy at once
+    // and queue a quantity delta; queued deltas go out together once clicking pauses,
+    // and the server answers with the re-priced cart.
+    const cartApiUrl = cartIcon ? cartIcon.dataset.cartUrl : null;
+    const CART_SYNC_DELAY = 400; // ms of no cart changes before syncing
+    const pendingChanges = new Map(); // productId -> quantity delta not sent yet
+    let syncTimer = null;
+    let syncInFlight = null; // promise of the request being sent
+
+    function getCookie(name) {
+        const match = document.cookie.match(new RegExp(`(?:^|; )${name}=([^;]*)`));
+        return match ? decodeURIComponent(match[1]) : null;
+    }
 
-            } catch (error) {
-                console.error("Error parsing cart from localStorage:", error);
-                cart = [];
-                localStorage.removeItem('freshmartCart');
-            }
-        } else {
-            cart = [];
+    function changeLocalQuantity(productId, delta) {
+        const item = cart.find(entry => entry.id === productId);
+        if (item) {
+            item.quantity = Math.max(0, item.quantity + delta);
+            cart = cart.filter(entry => entry.quantity > 0);
+        } else if (delta > 0) {
+            const product = findProduct(productId) || {};
+            cart.push({ id: productId, quantity: delta, name: product.name, price: product.price, imageSrc: product.imageSrc });
+        }
+    }
+
+    function applyServerCart(data) {
+        cart = data.items.map(item => ({ ...item, id: String(item.id) }));
+        // Changes queued while the request was in flight are not in the response yet
+        pendingChanges.forEach((delta, productId) => changeLocalQuantity(productId, delta));
+        updateCartCounter();
+        if (cartModal && cartModal.classList.contains('open')) displayCartItems();
+    }
+
+    function queueCartChange(productId, delta) {
+        if (!delta) return;
+        changeLocalQuantity(productId, delta);
+        pendingChanges.set(productId, (pendingChanges.get(productId) || 0) + delta);
+        updateCartCounter();
+        clearTimeout(syncTimer);
+        syncTimer = setTimeout(syncCart, CART_SYNC_DELAY);
+    }
+
+    // Returns a promise that settles once every change queued so far has been sent
+    function syncCart(keepalive = false) {
+        if (syncInFlight) return syncInFlight.then(() => syncCart(keepalive));
+        if (!cartApiUrl || pendingChanges.size === 0) return Promise.resolve();
+        syncInFlight = sendCartChanges(keepalive).finally(() => { syncInFlight = null; });
+        return syncInFlight;
+    }
+
+    async function sendCartChanges(keepalive) {
+        const changes = [...pendingChanges].map(([product, delta]) => ({ product, delta }));
+        pendingChanges.clear();
+        try {
+            const response = await fetch(cartApiUrl, {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') || '' },
+                body: JSON.stringify({ changes }),
+                keepalive,
+            });
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.error || `HTTP ${response.status}`);
+            applyServerCart(data);
+        } catch (error) {
+            console.error("Error syncing the cart:", error);
+            await loadCart(); // Fall back to whatever the server has
         }
-        updateCartCounter(); // Update counter after loading/resetting
     }
 
-    function saveCart() {
+
+    async function loadCart() {
+        // Carts saved by the old localStorage-only script refer to the static demo catalog
+        localStorage.removeItem('freshmartCart');
+        if (!cartApiUrl) {
+            updateCartCounter();
+            return;
+        }
         try {
-            localStorage.setItem('freshmartCart', JSON.stringify(cart));
+            const response = await fetch(cartApiUrl, { credentials: 'same-origin' });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            applyServerCart(await response.json());
         } catch (error) {
-            console.error("Error saving cart to localStorage:", error);
-            // Optionally notify the user that the cart couldn't be saved
+            console.error("Error loading the cart:", error);
+            updateCartCounter();
         }
     }
 
@@ -129,30 +191,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // CORE CART LOGIC FUNCTIONS
     // ==================================
      function addToCart(productId, quantity = 1) {
-         if (typeof products === 'undefined') {
-            console.error("'products' array not found. Ensure products.js is loaded before script.js.");
-            alert("Error: Could not load product data.");
-            return;
-        }
-        const product = products.find(p => p.id === productId);
-        if (!product) {
-            console.error(`Product with ID ${productId} not found.`);
-            return;
-        }
-
-        const existingCartItemIndex = cart.findIndex(item => item.id === productId);
-
-        if (existingCartItemIndex > -1) {
-            // Item exists, increase quantity
-             cart[existingCartItemIndex].quantity = (cart[existingCartItemIndex].quantity || 0) + quantity;
-        } else {
-            // Add new item
-            cart.push({ id: productId, quantity: quantity });
-        }
-
-        console.log('Cart updated:', cart);
-        updateCartCounter();
-        saveCart();
+        queueCartChange(String(productId), quantity);
 
         // Animate cart icon as visual feedback
          const cartIconElement = document.querySelector('.cart-icon i');
@@ -167,23 +206,17 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     function removeFromCart(productId) {
-        cart = cart.filter(item => item.id !== productId);
-        console.log(`Item ${productId} removed. Cart:`, cart);
-        updateCartCounter();
-        saveCart();
+        const item = cart.find(entry => entry.id === productId);
+        if (item) queueCartChange(productId, -item.quantity);
         displayCartItems(); // Re-render the cart modal view immediately
     }
 
     function updateCartItemQuantity(productId, newQuantityInput) {
-        const itemIndex = cart.findIndex(item => item.id === productId);
-        if (itemIndex > -1) {
+        const item = cart.find(entry => entry.id === productId);
+        if (item) {
             // Ensure quantity is a number and at least 1
             const newQuantity = Math.max(1, parseInt(newQuantityInput) || 1);
-            cart[itemIndex].quantity = newQuantity;
-
-            console.log(`Quantity for ${productId} updated to ${newQuantity}. Cart:`, cart);
-            updateCartCounter();
-            saveCart();
+            queueCartChange(productId, newQuantity - item.quantity);
             displayCartItems(); // Re-render the cart modal view immediately
         }
     }
@@ -193,8 +226,8 @@ document.addEventListener('DOMContentLoaded', () => {
     // ==================================
     function displayCartItems() {
         // Ensure elements and product data are available
-        if (!cartItemsContainer || !cartSummaryDiv || !cartActionsDiv || !cartModalTitle || typeof products === 'undefined') {
-            console.error("DisplayCartItems: Critical elements (container, summary, actions, title) or products array missing.");
+        if (!cartItemsContainer || !cartSummaryDiv || !cartActionsDiv || !cartModalTitle) {
+            console.error("DisplayCartItems: Critical elements (container, summary, actions, title) missing.");
             if (cartModalTitle) cartModalTitle.textContent = "Error";
             if (cartItemsContainer) cartItemsContainer.innerHTML = '<p class="no-products">Error loading cart items.</p>';
             if (cartSummaryDiv) cartSummaryDiv.style.display = 'none';
@@ -240,7 +273,8 @@ document.addEventListener('DOMContentLoaded', () => {
              }
 
             cart.forEach(item => {
-                const product = products.find(p => p.id === item.id);
+                // Server cart items carry their current name, price and image
+                const product = item.price !== undefined ? item : findProduct(item.id);
                 if (product) {
                     const itemQuantity = item.quantity || 0;
                     const itemTotal = product.price * itemQuantity;
@@ -287,11 +321,11 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     function displayProductDetail(productId) {
-        if (typeof products === 'undefined' || !productDetailContainer || !productDetailModal) {
-            console.error("Cannot display product detail. Container, modal, or products array missing.");
+        if (!productDetailContainer || !productDetailModal) {
+            console.error("Cannot display product detail. Container or modal missing.");
             return;
         }
-        const product = products.find(p => p.id === productId);
+        const product = findProduct(productId);
         if (!product) {
             console.error(`Product with ID ${productId} not found for detail view.`);
             productDetailContainer.innerHTML = '<p class="no-products">Sorry, product details could not be loaded.</p>';
@@ -325,13 +359,21 @@ document.addEventListener('DOMContentLoaded', () => {
     // ==================================
     // HELPER: RENDER PRODUCT CARDS ON GRIDS (Card Redesign Applied)
     // ==================================
+    // Catalog data now comes from the database, so escape it before building markup
+    function escapeHTML(value) {
+        return String(value ?? '').replace(/[&<>"']/g, ch => ({
+            '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+        })[ch]);
+    }
+
     function renderProductCardHTML(product) {
         if (!product) return '';
         // Removed description and add-to-cart button from card
+        const name = escapeHTML(product.name);
         return `
-            <div class="product-card" data-id="${product.id}" data-category="${product.category}" data-name="${product.name}" data-price="${product.price}">
-                 <img src="${product.imageSrc}" alt="${product.name}">
-                 <h3>${product.name}</h3>
+            <div class="product-card" data-id="${escapeHTML(product.id)}" data-category="${escapeHTML(product.category)}" data-name="${name}" data-price="${product.price}">
+                 <img src="${escapeHTML(product.imageSrc)}" alt="${name}">
+                 <h3>${name}</h3>
                  <p class="price">$${product.price.toFixed(2)}${product.unit ? ` <span>${product.unit}</span>` : ''}</p>
             </div>
         `;
@@ -361,64 +403,58 @@ document.addEventListener('DOMContentLoaded', () => {
     // ATTACHING EVENT LISTENERS & INITIAL RENDERING
     // ==================================
 
-    // --- Homepage Bestseller Logic ---
-    const bestsellerGrid = document.getElementById('bestseller-grid');
-    if (bestsellerGrid) {
-         if (typeof products !== 'undefined' && typeof bestsellerIds !== 'undefined') {
-            console.log("Setting up Bestsellers...");
-            const bestsellerProducts = bestsellerIds.map(id => products.find(p => p.id === id)).filter(p => p !== undefined);
-            bestsellerGrid.innerHTML = bestsellerProducts.length > 0
-                ? bestsellerProducts.map(renderProductCardHTML).join('')
-                : '<p class="no-products">No bestsellers found.</p>';
-            // Attach the grid click handler AFTER rendering
-            bestsellerGrid.addEventListener('click', handleProductGridClick);
-         } else {
-             console.error("Bestseller grid: 'products' or 'bestsellerIds' missing. Load products.js first.");
-             bestsellerGrid.innerHTML = '<p class="no-products">Error loading bestseller data.</p>';
-         }
-    }
-
     // --- Shop Page Logic ---
+    // Filtering, sorting and paging are done by the catalog API; we only append pages.
+    // With ?search= in the URL the grid is filled from the (relevance ranked) search API instead.
     const categoryFilter = document.getElementById('category-filter');
     const sortOptions = document.getElementById('sort-options');
     const productGridShop = document.getElementById('product-grid-shop');
-    if (categoryFilter && sortOptions && productGridShop) {
-         if (typeof products !== 'undefined') {
-            console.log("Setting up Shop Page...");
-            // Define display and filter/sort functions locally
-            function displayShopProducts(productsToDisplay) {
-                if (!productGridShop) return;
-                productGridShop.innerHTML = productsToDisplay.length === 0
-                    ? '<p class="no-products">No products found matching your criteria.</p>'
-                    : productsToDisplay.map(renderProductCardHTML).join(''); // Uses updated card renderer
+    const loadMoreBtn = document.getElementById('load-more-btn');
+    if (categoryFilter && sortOptions && productGridShop && productGridShop.dataset.apiUrl) {
+        console.log("Setting up Shop Page...");
+        let nextCursor = null;
+        let requestId = 0; // Ignore responses for a filter/sort that is no longer selected
+        const searchQuery = productGridShop.dataset.search || '';
+        const apiUrl = searchQuery ? productGridShop.dataset.searchUrl : productGridShop.dataset.apiUrl;
+
+        async function loadShopPage(reset) {
+            const thisRequest = reset ? ++requestId : requestId;
+            const params = new URLSearchParams({
+                category: categoryFilter.value,
+                sort: sortOptions.value,
+            });
+            if (searchQuery) params.set('q', searchQuery);
+            if (!reset && nextCursor) params.set('cursor', nextCursor);
+            if (loadMoreBtn) loadMoreBtn.disabled = true;
+            try {
+                const response = await fetch(`${apiUrl}?${params}`);
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                const data = await response.json();
+                if (thisRequest !== requestId) return;
+
+                data.results.forEach(product => catalogCache.set(String(product.id), product));
+                if (reset) productGridShop.innerHTML = '';
+                if (reset && data.results.length === 0) {
+                    productGridShop.innerHTML = '<p class="no-products">No products found matching your criteria.</p>';
+                } else {
+                    productGridShop.insertAdjacentHTML('beforeend', data.results.map(renderProductCardHTML).join(''));
+                }
+                nextCursor = data.next_cursor;
+                if (loadMoreBtn) loadMoreBtn.style.display = nextCursor ? '' : 'none';
+            } catch (error) {
+                console.error("Error loading products from the catalog API:", error);
+                if (reset) productGridShop.innerHTML = '<p class="no-products">Error loading product data.</p>';
+            } finally {
+                if (loadMoreBtn) loadMoreBtn.disabled = false;
             }
-            const filterAndSortProducts = () => {
-                const selectedCategory = categoryFilter.value;
-                const selectedSort = sortOptions.value;
-                let filtered = products.filter(p => selectedCategory === 'all' || p.category === selectedCategory);
-                filtered.sort((a, b) => {
-                    const nameA = a.name.toLowerCase(); const nameB = b.name.toLowerCase();
-                    const priceA = a.price; const priceB = b.price;
-                    switch (selectedSort) {
-                        case 'price-asc': return priceA - priceB;
-                        case 'price-desc': return priceB - priceA;
-                        case 'name-asc': return nameA.localeCompare(nameB);
-                        case 'name-desc': return nameB.localeCompare(nameA);
-                        default: return 0;
-                    }
-                });
-                displayShopProducts(filtered);
-            };
-            // Attach listeners and render initial state
-            categoryFilter.addEventListener('change', filterAndSortProducts);
-            sortOptions.addEventListener('change', filterAndSortProducts);
-            filterAndSortProducts(); // Initial render
-            // Attach the grid click handler AFTER initial rendering
-            productGridShop.addEventListener('click', handleProductGridClick);
-         } else {
-             console.error("Shop grid: 'products' array missing. Load products.js first.");
-             productGridShop.innerHTML = '<p class="no-products">Error loading product data.</p>';
-         }
+        }
+
+        // Attach listeners and render initial state
+        categoryFilter.addEventListener('change', () => loadShopPage(true));
+        sortOptions.addEventListener('change', () => loadShopPage(true));
+        if (loadMoreBtn) loadMoreBtn.addEventListener('click', () => loadShopPage(false));
+        loadShopPage(true); // Initial render
+        productGridShop.addEventListener('click', handleProductGridClick);
     }
 
     // --- Modal Open/Close Listeners ---
@@ -516,33 +552,91 @@ document.addEventListener('DOMContentLoaded', () => {
          });
      }
 
-     // --- Checkout Button Listener ---
-     // Note: This listener is attached to the modal container and relies on the button being present when cart not empty
+     // --- Checkout ---
+     // "Proceed to Checkout" swaps in a delivery form. Each checkout attempt gets an
+     // idempotency key that is reused on retries, so a double click or a retry after a
+     // network error can never place the order twice.
+     const checkoutApiUrl = cartIcon ? cartIcon.dataset.checkoutUrl : null;
+     let checkoutKey = null;
+
+     function showCheckoutForm() {
+         cartActionsDiv.innerHTML = `
+             <form class="checkout-form">
+                 <textarea name="delivery_address" rows="3" placeholder="Enter your full delivery address" required></textarea>
+                 <input type="tel" name="phone_number" placeholder="+12345677890" required>
+                 <textarea name="notes" rows="2" placeholder="Any special instructions (optional)"></textarea>
+                 <p class="checkout-error" role="alert"></p>
+                 <button type="submit" class="btn btn-primary place-order-btn">Place Order</button>
+             </form>
+         `;
+     }
+
+     async function placeOrder(form) {
+         const button = form.querySelector('.place-order-btn');
+         const errorBox = form.querySelector('.checkout-error');
+         button.disabled = true;
+         errorBox.textContent = '';
+         checkoutKey = checkoutKey || (crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random()}`);
+         try {
+             // The order must contain everything clicked so far
+             clearTimeout(syncTimer);
+             await syncCart();
+             const response = await fetch(checkoutApiUrl, {
+                 method: 'POST',
+                 credentials: 'same-origin',
+                 headers: {
+                     'Content-Type': 'application/json',
+                     'X-CSRFToken': getCookie('csrftoken') || '',
+                     'Idempotency-Key': checkoutKey,
+                 },
+                 body: JSON.stringify(Object.fromEntries(new FormData(form))),
+             });
+             const data = await response.json();
+             if (!response.ok) {
+                 const fieldErrors = data.fields ? Object.values(data.fields).flat().join(' ') : '';
+                 errorBox.textContent = `${data.error || 'Checkout failed.'} ${fieldErrors}`.trim();
+                 if (response.status === 409) checkoutKey = null;
+                 return;
+             }
+             checkoutKey = null;
+             cart = [];
+             updateCartCounter();
+             displayCartItems();
+             cartModalTitle.textContent = `Order #${data.order} placed!`;
+             if (cartEmptyMsg) cartEmptyMsg.textContent = `Thank you! We'll deliver ${data.item_count} item(s), total $${Number(data.total).toFixed(2)}.`;
+         } catch (error) {
+             console.error("Checkout failed:", error);
+             errorBox.textContent = 'Could not reach the server. Please try again.';
+         } finally {
+             button.disabled = false;
+         }
+     }
+
      if (cartActionsDiv && cartModal) { // Check parent exists
           cartActionsDiv.addEventListener('click', (event) => {
-             // Check specifically for the checkout button IF it exists
-              if (event.target.classList.contains('checkout-btn')) {
-                  if (cart.length > 0) {
-                      alert(`Proceeding to checkout with ${cart.length} item type(s)! (Functionality not implemented)`);
-                      console.log("Checkout initiated with cart:", JSON.stringify(cart));
-                      cartModal.classList.remove('open');
-                      document.body.style.overflow = '';
-                      // Optional: Clear cart after checkout simulation
-                      // cart = []; saveCart(); updateCartCounter(); displayCartItems();
-                  } else {
-                      // This case shouldn't happen if button is replaced correctly, but good fallback
-                      alert('Your cart is empty.');
-                  }
+              if (event.target.classList.contains('checkout-btn') && cart.length > 0) {
+                  showCheckoutForm();
               }
               // Note: The 'Shop Now' link has its own temporary listener added in displayCartItems
           });
+          cartActionsDiv.addEventListener('submit', (event) => {
+              if (event.target.classList.contains('checkout-form')) {
+                  event.preventDefault();
+                  placeOrder(event.target);
+              }
+          });
       }
 
 
     // ==================================
     // INITIALIZATION
     // ==================================
-    loadCart(); // Load cart from storage FIRST
+    loadCart(); // Load the cart from the server FIRST
+    // Send changes still waiting for the debounce when the visitor leaves the page
+    window.addEventListener('pagehide', () => {
+        clearTimeout(syncTimer);
+        syncCart(true);
+    });
 
     // --- Update Footer Year ---
     const currentYearSpan = document.getElementById('current-year');
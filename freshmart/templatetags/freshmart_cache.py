@@ -0,0 +1,45 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from freshmart.cache import catalog_cache
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, namespaces):
+        self.nodelist = nodelist
+        self.name = name
+        self.namespaces = namespaces
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        namespaces = [ns.resolve(context) for ns in self.namespaces]
+        # On a hit the block isn't rendered, so its lazy querysets never run
+        return mark_safe(catalog_cache.get_or_set(
+            f'fragment:{name}', namespaces, lambda: self.nodelist.render(context),
+        ))
+
+
+@register.tag
+def fragment_cache(parser, token):
+    """
+    Cache a template block in the tiered catalog cache.
+
+        {% fragment_cache "bestseller_grid" "featured" %} ... {% endfragment_cache %}
+
+    The first argument names the fragment; the rest are the cache namespaces it
+    depends on (see freshmart.signals for which saves bump which namespace).
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires a fragment name and at least one namespace."
+        )
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    return FragmentCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
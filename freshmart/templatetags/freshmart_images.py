@@ -0,0 +1,24 @@
+from django import template
+from django.utils.html import format_html
+
+from freshmart.images import rendition_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_picture(product, size='card'):
+    """
+    A <picture> of a product's resized image: WebP, with a JPEG fallback.
+
+        {% product_picture product "large" %}
+
+    Renders nothing for a product without an image.
+    """
+    if not product.image_url:
+        return ''
+    args = (product.pk, product.image_url, product.image_hash, size)
+    return format_html(
+        '<picture><source srcset="{}" type="image/webp"><img src="{}" alt="{}" loading="lazy"></picture>',
+        rendition_url(*args, fmt='webp'), rendition_url(*args, fmt='jpg'), product.name,
+    )
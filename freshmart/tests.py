@@ -1,3 +1,1387 @@
-from django.test import TestCase
+import csv
+import functools
+import gzip
+import importlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import OperationalError, connection
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.backends.django import Template as DjangoTemplate
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches
+from django.utils import timezone
+
+from . import urls as freshmart_urls
+from .assets import minify_css, minify_js
+from .benchmarks import compare, run_client_suite
+from .cache import cached_response, catalog_cache
+from .catalog import SORTS
+from .checkout import roll_up_sales
+from .db import add_counts, serialized_write
+from .exports import streaming_export_response
+from .feeds import build
+from .images import ImageError, ensure_product_image, fetch_url, rendition_url
+from .inventory import audit, rebuild, receive_stock, release_expired
+from .models import (
+    Bestseller, Category, ContactMessage, CoPurchase, DailySales, IdempotencyKey, Order, OrderItem, Product,
+    ProductDailySales, Recommendation, Reservation, Review, Stock, StockMovement,
+)
+from .outbox import apply_batch, drain, enqueue, pending, stats
+from .profiling import RequestProfilerMiddleware, load_view_stats
+from .rankings import top_products, update_rankings
+from .ratelimit import TokenBuckets, limiter
+from .search import fts_available, search_products
+from .warmup import warm_up
+
+
+def add_to_cart(client, changes):
+    return client.post('/api/cart/', json.dumps({'changes': changes}), content_type='application/json')
+
+
+def checkout(client, key, **details):
+    data = {'delivery_address': '1 Market Street', 'phone_number': '+1234567890', **details}
+    return client.post('/api/checkout/', json.dumps(data), content_type='application/json',
+                       HTTP_IDEMPOTENCY_KEY=key)
+
+
+class CachingTests(TestCase):
+    def setUp(self):
+        catalog_cache.clear()
+        cache.clear()
+        self.category = Category.objects.create(name='Fruit')
+
+    def test_pages_are_cached_until_a_namespace_they_depend_on_changes(self):
+        first = self.client.get('/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        second = self.client.get('/')
+        self.assertEqual((second['X-Cache'], second.content), ('HIT', first.content))
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Dairy')
+        third = self.client.get('/')
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertContains(third, 'Dairy')
+
+    def test_conditional_gets_are_answered_with_304(self):
+        page = self.client.get('/')
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=page['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/', HTTP_IF_MODIFIED_SINCE=page['Last-Modified']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=page['ETag']).status_code, 200)
+
+    def test_per_visitor_responses_are_not_cached(self):
+        @cached_response(['products'])
+        def form_page(request):
+            return HttpResponse(get_token(request))
+
+        @cached_response(['products'])
+        def plain_page(request):
+            response = HttpResponse('same for everyone', content_type='text/plain')
+            response['Content-Language'] = 'en'
+            return response
+
+        def get(view):
+            request = RequestFactory().get('/page/')
+            request.user = AnonymousUser()
+            return view(request)
+
+        tokens = [get(form_page) for _ in range(2)]
+        self.assertEqual([response['X-Cache'] for response in tokens], ['MISS', 'MISS'])
+        self.assertNotEqual(tokens[0].content, tokens[1].content)
+        get(plain_page)
+        replayed = get(plain_page)
+        self.assertEqual((replayed['X-Cache'], replayed['Content-Type'], replayed['Content-Language']),
+                         ('HIT', 'text/plain', 'en'))
+
+
+class AsyncApiTests(TestCase):
+    """The async catalog, search and cart views that urls.py serves under ASGI answer like the sync ones."""
+
+    def setUp(self):
+        fruit = Category.objects.create(name='Fruit')
+        self.products = [
+            Product.objects.create(category=fruit, name=name, description='Fresh', price=Decimal(price))
+            for name, price in (('Apple', '1.50'), ('Apricot', '3.00'), ('Banana', '0.40'))
+        ]
+        self.addCleanup(self.route_api, async_views=False)
+
+    def route_api(self, async_views):
+        with override_settings(FRESHMART_ASYNC_VIEWS=async_views):
+            importlib.reload(freshmart_urls)
+        # The project's URLconf holds on to the resolver for the old patterns
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+        catalog_cache.clear()
+        cache.clear()
+
+    def responses(self, method, path, data=None):
+        """(sync response, async response) to the same request."""
+        answers = []
+        for async_views, client in ((False, Client()), (True, AsyncClient())):
+            self.route_api(async_views)
+            if method == 'post':
+                send = functools.partial(client.post, path, json.dumps(data), content_type='application/json')
+            else:
+                send = functools.partial(client.get, path, data)
+            response = async_to_sync(send)() if async_views else send()
+            self.assertEqual(iscoroutinefunction(response.resolver_match.func), async_views)
+            answers.append(response)
+        return answers
+
+    def test_catalog_and_search_answer_the_same(self):
+        for path, params in (('/api/products/', {'sort': 'price-desc', 'limit': 2}),
+                             ('/api/products/', {'category': 'fruit', 'sort': 'name-asc'}),
+                             ('/api/products/', {'cursor': 'bad'}),
+                             ('/api/search/', {'q': 'ap'}),
+                             ('/api/search/', {'q': 'fresh', 'limit': 1, 'cursor': '1'})):
+            sync, async_ = self.responses('get', path, params)
+            self.assertEqual((async_.status_code, async_.json()), (sync.status_code, sync.json()), params)
+
+    def test_cart_answers_the_same(self):
+        apple, _, banana = self.products
+        changes = {'changes': [{'product': apple.pk, 'delta': 2}, {'product': banana.pk, 'delta': 1}]}
+        sync, async_ = self.responses('post', '/api/cart/', changes)
+        self.assertEqual(async_.status_code, 200)
+        self.assertEqual({**async_.json(), 'id': None}, {**sync.json(), 'id': None})  # each made its own cart
+        self.assertEqual(async_.json()['items'][0]['quantity'], 2)
+        sync, async_ = self.responses('post', '/api/cart/', {'changes': [{'product': 0, 'delta': 1}]})
+        self.assertEqual((async_.status_code, async_.json()), (sync.status_code, sync.json()))
+        self.assertEqual(async_.status_code, 400)
+
+
+def fetch_test_image(url):
+    """FRESHMART_IMAGE_FETCHER for the tests: an 800x400 picture, or an error for .../missing.png."""
+    from PIL import Image
+
+    if url.endswith('/missing.png'):
+        raise ImageError(f'Could not fetch {url}: 404')
+    data = io.BytesIO()
+    Image.new('RGB', (800, 400), 'green').save(data, 'PNG')
+    return data.getvalue()
+
+
+class ProductImageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name, FRESHMART_IMAGE_FETCHER='freshmart.tests.fetch_test_image')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.category = Category.objects.create(name='Fruit')
+
+    def product(self, image_url):
+        return Product.objects.create(category=self.category, name='Kiwi', description='', price=Decimal('0.50'),
+                                      image_url=image_url)
+
+    def test_the_proxy_renders_renditions_once_and_redirects_to_them(self):
+        from PIL import Image
+
+        product = self.product('https://img.example/kiwi.png')
+        response = self.client.get(f'/images/{product.pk}/card.webp')
+        self.assertEqual(response.status_code, 302)
+        product.refresh_from_db()
+        self.assertEqual(response['Location'], rendition_url(product.pk, product.image_url, product.image_hash))
+        rendition = self.client.get(response['Location'])
+        self.assertEqual((rendition['Content-Type'], rendition['Cache-Control']),
+                         ('image/webp', 'public, max-age=31536000, immutable'))
+        with Image.open(io.BytesIO(b''.join(rendition.streaming_content))) as image:
+            self.assertEqual(image.size, (480, 240))
+
+        # Another product with the same picture shares the files
+        with mock.patch('freshmart.images.render_renditions') as render:
+            self.assertEqual(ensure_product_image(self.product('https://img.example/copy.png').pk), product.image_hash)
+        render.assert_not_called()
+        self.assertEqual(self.client.get(f'/images/{product.pk}/huge.webp').status_code, 404)
+
+    def test_unusable_images_fall_back_to_the_original(self):
+        missing = self.product('https://img.example/missing.png')
+        response = self.client.get(f'/images/{missing.pk}/thumb.jpg')
+        self.assertEqual((response.status_code, response['Location']), (302, 'https://img.example/missing.png'))
+        self.assertEqual(Product.objects.get(pk=missing.pk).image_hash, '')
+        self.assertEqual(self.client.get(f'/images/{self.product("").pk}/thumb.jpg').status_code, 404)
+
+    def test_the_default_fetcher_only_fetches_http(self):
+        for url in ('file:///etc/passwd', 'ftp://example.com/a.png', '/etc/passwd'):
+            with self.assertRaisesMessage(ImageError, 'Not an http(s) URL'):
+                fetch_url(url)
+
+
+class CatalogApiTests(TestCase):
+    def setUp(self):
+        catalog_cache.clear()
+        cache.clear()
+        self.fruit, self.bakery = Category.objects.create(name='Fruit'), Category.objects.create(name='Bakery')
+        # Few distinct prices and names, so pages end in the middle of runs of equal values
+        self.products = [
+            Product.objects.create(category=self.bakery if n % 3 else self.fruit, name=f'Item {n % 4}',
+                                   description='', price=Decimal('1.00') + n % 3)
+            for n in range(23)
+        ]
+
+    def walk(self, limit=4, **params):
+        ids, cursor = [], None
+        while True:
+            page = {**params, 'limit': limit, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get('/api/products/', page)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['results']), limit)
+            ids += [product['id'] for product in data['results']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_every_product_once_in_each_sort_order(self):
+        for sort, (field, descending) in SORTS.items():
+            for category in (None, self.bakery):
+                products = [product for product in self.products if category in (None, product.category)]
+                expected = [product.pk for product in sorted(
+                    products, key=lambda product: (getattr(product, field), product.pk), reverse=descending)]
+                params = {'sort': sort, **({'category': category.pk} if category else {})}
+                self.assertEqual(self.walk(**params), expected, params)
+
+    def test_a_cursor_still_works_after_its_product_is_deleted(self):
+        first = self.client.get('/api/products/', {'sort': 'price-asc', 'limit': 5}).json()
+        Product.objects.get(pk=first['results'][-1]['id']).delete()
+        rest = self.client.get('/api/products/', {'sort': 'price-asc', 'cursor': first['next_cursor']}).json()
+        self.assertEqual(len(first['results']) + len(rest['results']), 23)
+
+    def test_bad_parameters_are_rejected(self):
+        name_cursor = self.client.get('/api/products/', {'sort': 'name-asc', 'limit': 1}).json()['next_cursor']
+        for params in ({'cursor': 'not a cursor'}, {'cursor': 'W10'}, {'cursor': name_cursor},
+                       {'sort': 'cheapest'}, {'category': 'Dairy'}, {'limit': 'all'}):
+            response = self.client.get('/api/products/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+
+    def test_deep_pages_cost_the_same_queries_as_the_first(self):
+        self.client.get('/api/products/', {'limit': 1})  # loads the category names once per process
+        pages, cursor = [], None
+        for _ in range(5):
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get('/api/products/', {'sort': 'name-desc', 'limit': 4,
+                                                          **({'cursor': cursor} if cursor else {})}).json()
+            pages.append(len(queries))
+            cursor = data['next_cursor']
+        self.assertEqual(pages, [1] * 5)
+
+
+class SubmissionTests(TestCase):
+    def setUp(self):
+        catalog_cache.clear()
+        cache.clear()
+        limiter.clear()
+        outbox = tempfile.TemporaryDirectory()
+        self.addCleanup(outbox.cleanup)
+        settings = override_settings(FRESHMART_OUTBOX_PATH=f'{outbox.name}/outbox.sqlite3', FRESHMART_OUTBOX_THREAD=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        category = Category.objects.create(name='Bakery')
+        self.product = Product.objects.create(category=category, name='Sourdough', description='', price=Decimal('4.00'))
+
+    def review(self, name, rating=5):
+        return {'product_id': self.product.pk, 'user_id': None, 'name': name, 'rating': rating, 'comment': 'Tasty'}
+
+    def test_every_visitor_can_post_a_review_from_the_product_page(self):
+        url = f'/product/{self.product.pk}/'
+        for name in ('Ann', 'Bob'):
+            visitor = Client(enforce_csrf_checks=True)
+            page = visitor.get(url)
+            self.assertIn('csrftoken', page.cookies)
+            token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', page.content.decode()).group(1)
+            response = visitor.post(f'{url}review/', {'name': name, 'rating': 4, 'comment': 'Good',
+                                                      'csrfmiddlewaretoken': token})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(catalog_cache.stats['local_hits'], 2)  # the second visitor got the cached fragments
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(drain(), 2)
+        self.assertContains(Client().get(url), 'Bob')
+
+    def test_entries_applied_before_a_crash_are_not_applied_again(self):
+        enqueue('review', self.review('Ann'))
+        enqueue('contact', {'name': 'Ann', 'email': 'ann@example.com', 'message': 'Hi'})
+        # Applied, then the drainer died before purging: the entries are delivered again
+        self.assertEqual(apply_batch(10)[0], 2)
+        self.assertEqual(len(pending()), 2)
+        enqueue('review', self.review('Bob', rating=3))
+        self.assertEqual(drain(), 1)
+        self.assertEqual(drain(), 0)
+        self.assertEqual(pending(), [])
+        self.product.refresh_from_db()
+        self.assertEqual((Review.objects.count(), self.product.review_count, self.product.rating_sum), (2, 2, 8))
+
+    def test_a_failed_batch_leaves_its_entries_queued(self):
+        enqueue('review', self.review('Ann'))
+        with mock.patch('freshmart.outbox.apply_rating_changes', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                drain()
+        self.assertEqual((Review.objects.count(), len(pending())), (0, 1))
+        self.assertEqual(drain(), 1)
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_a_new_outbox_file_is_not_skipped_by_the_old_watermark(self):
+        for n in range(3):
+            enqueue('contact', {'name': f'Ann {n}', 'email': 'ann@example.com', 'message': 'Hi'})
+        self.assertEqual(drain(), 3)
+        # The queue file is recreated (a new volume, or deleted): its ids start at 1 again
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(FRESHMART_OUTBOX_PATH=f'{directory.name}/outbox.sqlite3'):
+            enqueue('contact', {'name': 'Bob', 'email': 'bob@example.com', 'message': 'Hello'})
+            self.assertEqual(pending()[0][0], 1)
+            self.assertEqual(stats()['pending']['contact'], 1)
+            self.assertEqual(drain(), 1)
+        self.assertTrue(ContactMessage.objects.filter(name='Bob').exists())
+
+    def test_a_review_by_a_deleted_account_is_kept_anonymous(self):
+        user = User.objects.create_user('ann')
+        enqueue('review', {**self.review('Ann'), 'user_id': user.pk})
+        enqueue('review', self.review('Bob'))
+        user.delete()
+        self.assertEqual(drain(), 2)
+        self.assertEqual(pending(), [])
+        self.assertEqual(sorted(Review.objects.values_list('name', 'user')), [('Ann', None), ('Bob', None)])
+
+    def test_rating_aggregates_follow_review_updates_and_deletes(self):
+        other = Product.objects.create(category=self.product.category, name='Rye', description='', price=Decimal('3.00'))
+        ann, bob, cat = (Review.objects.create(product=self.product, name=name, rating=rating, comment='')
+                         for name, rating in (('Ann', 5), ('Bob', 3), ('Cat', 4)))
+
+        def aggregates(product):
+            product.refresh_from_db()
+            return product.review_count, product.rating_sum, product.rating_histogram
+
+        bob.rating = 1
+        bob.save()
+        self.assertEqual(aggregates(self.product), (3, 10, [(5, 1), (4, 1), (3, 0), (2, 0), (1, 1)]))
+        self.assertEqual(self.product.average_rating, 10 / 3)
+
+        cat.product = other
+        cat.save()
+        ann.delete()
+        self.assertEqual(aggregates(self.product), (1, 1, [(5, 0), (4, 0), (3, 0), (2, 0), (1, 1)]))
+        self.assertEqual(aggregates(other), (1, 4, [(5, 0), (4, 1), (3, 0), (2, 0), (1, 0)]))
+
+        Review.objects.all().delete()
+        self.assertEqual(aggregates(self.product)[:2], (0, 0))
+        self.assertEqual(aggregates(other)[:2], (0, 0))
+        self.assertIsNone(self.product.average_rating)
+
+
+class AdminChangelistTests(TestCase):
+    """Changelist pages make the same queries however many rows they show."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', None))
+        self.batches = 0
+
+    def add_rows(self):
+        self.batches += 1
+        user = User.objects.create_user(f'customer{self.batches}')
+        for n in range(3):
+            category = Category.objects.create(name=f'Category {self.batches}.{n}')
+            product = Product.objects.create(category=category, name=f'Product {self.batches}.{n}', description='',
+                                             price=Decimal('1.00'), image_url='https://img.example/p.png')
+            Review.objects.create(product=product, user=user, name='Ann', rating=4, comment='Good')
+            order = Order.objects.create(user=user if n else None)
+            OrderItem.objects.create(order=order, product=product, quantity=2)
+
+    def test_changelists_make_a_fixed_number_of_queries(self):
+        pages = ['/admin/freshmart/category/', '/admin/freshmart/product/', '/admin/freshmart/order/',
+                 '/admin/freshmart/review/']
+        self.add_rows()
+        queries = {}
+        for page in pages:
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.client.get(page).status_code, 200)
+            queries[page] = len(captured)
+        self.add_rows()
+        self.add_rows()
+        for page in pages:
+            with self.subTest(page), self.assertNumQueries(queries[page]):
+                response = self.client.get(page)
+            self.assertContains(response, 'data-actions-icnt="9"')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Fruit')
+        self.apple = Product.objects.create(category=category, name='Apple', description='', price=Decimal('2.50'),
+                                            image_url='https://img.example/apple.png')
+        self.pear = Product.objects.create(category=category, name='Pear', description='', price=Decimal('1.20'),
+                                           image_url='https://img.example/pear.png')
+        self.user = User.objects.create_user('ann', 'ann@example.com')
+        self.order = Order.objects.create(user=self.user, completed=True)
+        OrderItem.objects.create(order=self.order, product=self.apple, quantity=2)
+        OrderItem.objects.create(order=self.order, product=self.pear, quantity=1)
+        self.empty_order = Order.objects.create()
+
+    def test_csv_has_one_row_per_order_line(self):
+        response = streaming_export_response(Order.objects.all(), 'csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertRegex(response['Content-Disposition'], r'^attachment; filename="freshmart-orders-[\d-]+\.csv"$')
+
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(row['order_id'], row['product'], row['quantity'], row['line_total']) for row in rows], [
+            (str(self.order.pk), 'Apple', '2', '5.00'),
+            (str(self.order.pk), 'Pear', '1', '1.20'),
+            (str(self.empty_order.pk), '', '', ''),  # Orders without lines still get a row
+        ])
+        self.assertEqual((rows[0]['customer'], rows[0]['email'], rows[0]['total']), ('ann', 'ann@example.com', '6.20'))
+
+    def test_gzip_csv_decompresses_to_the_plain_export(self):
+        plain = b''.join(streaming_export_response(Order.objects.all(), 'csv').streaming_content)
+        response = streaming_export_response(Order.objects.all(), 'csv', compress=True)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertRegex(response['Content-Disposition'], r'filename="freshmart-orders-[\d-]+\.csv\.gz"$')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    def test_jsonl_has_one_record_per_line(self):
+        Review.objects.create(product=self.apple, user=self.user, name='Ann', rating=5, comment='Crisp, "sweet"')
+        Review.objects.create(product=self.pear, name='Bob', rating=2, comment='Gritty\nand dry')
+        response = streaming_export_response(Review.objects.all(), 'jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertRegex(response['Content-Disposition'], r'filename="freshmart-reviews-[\d-]+\.jsonl"$')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([(r['product'], r['username'], r['rating'], r['comment']) for r in records], [
+            ('Apple', 'ann', 5, 'Crisp, "sweet"'),
+            ('Pear', '', 2, 'Gritty\nand dry'),
+        ])
+
+    def test_related_rows_do_not_cost_a_query_each(self):
+        def export_queries():
+            with CaptureQueriesContext(connection) as captured:
+                b''.join(streaming_export_response(Order.objects.all(), 'jsonl').streaming_content)
+            return len(captured)
+
+        queries = export_queries()
+        for n in range(5):
+            order = Order.objects.create(user=User.objects.create_user(f'customer{n}'))
+            OrderItem.objects.create(order=order, product=self.apple, quantity=1)
+        self.assertEqual(export_queries(), queries)
+
+    def test_admin_action_streams_the_selected_rows(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', None))
+        response = self.client.post('/admin/freshmart/order/', {
+            'action': 'export_jsonl', '_selected_action': [self.order.pk],
+        })
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([record['order_id'] for record in records], [self.order.pk])
+
+    def test_command_writes_the_export_to_a_file(self):
+        ContactMessage.objects.create(name='Cy', email='cy@example.com', message='Hello, there')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'contacts.csv.gz')
+            out = io.StringIO()
+            call_command('export_data', 'contacts', '--gzip', '--output', path, '--chunk-size', '1', stdout=out)
+            with gzip.open(path, 'rt', newline='') as f:
+                rows = list(csv.DictReader(f))
+        self.assertIn(f'Exported contacts to {path}', out.getvalue())
+        self.assertEqual([(row['name'], row['email'], row['message']) for row in rows],
+                         [('Cy', 'cy@example.com', 'Hello, there')])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.jsonl')
+            call_command('export_data', 'orders', '--format', 'jsonl', '--output', path, stdout=io.StringIO())
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual([len(record['items']) for record in records], [2, 0])
+
+        with self.assertRaises(CommandError):
+            call_command('export_data', 'orders', '--output', os.path.join(directory, 'missing', 'x.csv'))
+
+
+class OrderTotalTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Fruit')
+        self.apple = Product.objects.create(category=category, name='Apple', description='', price=Decimal('1.50'))
+        self.pear = Product.objects.create(category=category, name='Pear', description='', price=Decimal('2.00'))
+        self.order = Order.objects.create()
+
+    def totals(self, order=None):
+        order = order or self.order
+        order.refresh_from_db()
+        return order.item_count, order.total
+
+    def test_totals_follow_the_items_at_their_snapshot_prices(self):
+        apples = OrderItem.objects.create(order=self.order, product=self.apple, quantity=2)
+        pears = OrderItem.objects.create(order=self.order, product=self.pear)
+        self.assertEqual(self.totals(), (3, Decimal('5.00')))
+        apples.quantity = 4
+        apples.save()
+        self.assertEqual(self.totals(), (5, Decimal('8.00')))
+
+        # Price changes apply to items added later, not to those already in orders
+        self.apple.price = Decimal('9.99')
+        self.apple.save()
+        self.assertEqual(self.totals(), (5, Decimal('8.00')))
+        OrderItem.objects.create(order=self.order, product=self.apple)
+        self.assertEqual(self.totals(), (6, Decimal('17.99')))
+
+        pears.delete()
+        self.assertEqual(self.totals(), (5, Decimal('15.99')))
+        self.order.items.all().delete()
+        self.assertEqual(self.totals(), (0, Decimal('0.00')))
+
+    def test_backfill_recalculates_every_order(self):
+        orders = [self.order, Order.objects.create(), Order.objects.create()]
+        for n, order in enumerate(orders):
+            OrderItem.objects.create(order=order, product=self.pear, quantity=n + 1)
+        Order.objects.update(item_count=0, total=0)  # e.g. rows from before the stored totals
+        output = io.StringIO()
+        call_command('backfill_order_totals', batch_size=2, stdout=output)
+        self.assertIn('Recalculated totals for 3 orders', output.getvalue())
+        self.assertEqual([self.totals(order) for order in orders],
+                         [(1, Decimal('2.00')), (2, Decimal('4.00')), (3, Decimal('6.00'))])
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        catalog_cache.clear()
+        cache.clear()
+        category = Category.objects.create(name='Fruit')
+        self.apple = Product.objects.create(category=category, name='Apple', description='', price=Decimal('1.50'))
+        self.pear = Product.objects.create(category=category, name='Pear', description='', price=Decimal('2.00'))
+        self.client = Client()
+        add_to_cart(self.client, [{'product': self.apple.pk, 'delta': 2}, {'product': self.pear.pk, 'delta': 1}])
+
+    def test_checkout_reprices_and_completes_the_order(self):
+        Product.objects.filter(pk=self.apple.pk).update(price=Decimal('1.75'))
+        response = checkout(self.client, 'key-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['total'], '5.50')
+        self.assertEqual(response['Idempotent-Replayed'], 'false')
+        order = Order.objects.get()
+        self.assertTrue(order.completed)
+        self.assertIsNotNone(order.completed_at)
+        self.assertEqual(order.delivery_address, '1 Market Street')
+        self.assertEqual(order.item_count, 3)
+        self.assertEqual(self.client.get('/api/cart/').json()['items'], [])
+
+    def test_retry_with_the_same_key_returns_the_original_response(self):
+        first = checkout(self.client, 'key-1')
+        Product.objects.filter(pk=self.apple.pk).update(price=Decimal('9.00'))
+        with self.assertNumQueries(2):  # session and idempotency key: nothing is re-executed
+            second = checkout(self.client, 'key-1')
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.filter(completed=True).count(), 1)
+
+    def test_checkout_needs_a_key_details_and_items(self):
+        self.assertEqual(checkout(self.client, '').status_code, 400)
+        self.assertEqual(checkout(self.client, 'key-1', phone_number='nope').status_code, 400)
+        self.assertEqual(checkout(Client(), 'key-1').status_code, 400)
+        self.assertFalse(Order.objects.filter(completed=True).exists())
+
+    def test_a_checked_out_cart_cannot_be_checked_out_again(self):
+        cart_id = self.client.session['cart_id']
+        checkout(self.client, 'key-1')
+        session = self.client.session
+        session['cart_id'] = cart_id
+        session.save()
+        self.assertEqual(checkout(self.client, 'key-2').status_code, 409)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_a_failing_rollup_does_not_fail_the_checkout(self):
+        with mock.patch('freshmart.checkout.roll_up', side_effect=RuntimeError('rollup failed')), \
+                self.assertLogs('freshmart.checkout', 'ERROR'):
+            response = checkout(self.client, 'key-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Order.objects.get(pk=response.json()['order']).completed)
+        self.assertFalse(ProductDailySales.objects.exists())
+        roll_up_sales()  # the next checkout, or `manage.py rollup_sales`, catches up
+        self.assertEqual(ProductDailySales.objects.get(product=self.apple).units, 2)
+
+
+class SalesReportTests(TestCase):
+    def setUp(self):
+        fruit, self.bakery = Category.objects.create(name='Fruit'), Category.objects.create(name='Bakery')
+        apple = Product.objects.create(category=fruit, name='Apple', description='', price=Decimal('1.50'))
+        pear = Product.objects.create(category=fruit, name='Pear', description='', price=Decimal('2.00'))
+        bread = Product.objects.create(category=self.bakery, name='Bread', description='', price=Decimal('4.00'))
+        for n, items in enumerate([[(apple, 2), (bread, 1)], [(pear, 1)]]):
+            client = Client()
+            add_to_cart(client, [{'product': product.pk, 'delta': quantity} for product, quantity in items])
+            self.assertEqual(checkout(client, f'key-{n}').status_code, 201)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.today = timezone.localdate().isoformat()
+
+    def report(self, **params):
+        response = self.client.get('/api/reports/sales/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_every_grouping_with_and_without_a_category(self):
+        report = self.report(by='day')
+        self.assertEqual(report['totals'], {'orders': 2, 'units': 4, 'revenue': '9.00'})
+        self.assertEqual(report['rows'], [{'day': self.today, 'orders': 2, 'units': 4, 'revenue': '9.00'}])
+        report = self.report(by='day', category='Fruit')
+        self.assertEqual(report['totals'], {'orders': 2, 'units': 3, 'revenue': '5.00'})
+        self.assertEqual(report['rows'], [{'day': self.today, 'orders': 2, 'units': 3, 'revenue': '5.00'}])
+
+        rows = self.report(by='category')['rows']
+        self.assertEqual([(row['category_name'], row['orders'], row['revenue']) for row in rows],
+                         [('Fruit', 2, '5.00'), ('Bakery', 1, '4.00')])
+        report = self.report(by='category', category=self.bakery.pk)
+        self.assertEqual(report['totals'], {'orders': 1, 'units': 1, 'revenue': '4.00'})
+        self.assertEqual([row['category_name'] for row in report['rows']], ['Bakery'])
+
+        rows = self.report(by='product')['rows']
+        self.assertEqual([(row['product_name'], row['units'], row['revenue']) for row in rows],
+                         [('Bread', 1, '4.00'), ('Apple', 2, '3.00'), ('Pear', 1, '2.00')])
+        rows = self.report(by='product', category='fruit')['rows']
+        self.assertEqual([row['product_name'] for row in rows], ['Apple', 'Pear'])
+
+    def test_bad_parameters_and_other_users_are_turned_away(self):
+        for params in ({'by': 'week'}, {'category': 'Dairy'}, {'start': '2024-02-30'},
+                       {'start': self.today, 'end': '2000-01-01'}):
+            self.assertEqual(self.client.get('/api/reports/sales/', params).status_code, 400)
+        self.assertEqual(Client().get('/api/reports/sales/').status_code, 302)
+
+
+class RankingTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Fruit')
+        self.apple = Product.objects.create(category=category, name='Apple', description='', price=Decimal('1.50'))
+        self.pear = Product.objects.create(category=category, name='Pear', description='', price=Decimal('2.00'))
+
+    def sell(self, product, units):
+        row, _ = ProductDailySales.objects.get_or_create(product=product, day=timezone.localdate())
+        row.units += units
+        row.save()
+        with mock.patch('freshmart.rankings.invalidate') as invalidate:
+            update_rankings([product.pk])
+        return invalidate.called
+
+    def test_pages_are_invalidated_only_when_a_ranking_changes(self):
+        self.assertTrue(self.sell(self.apple, 5))
+        self.assertTrue(self.sell(self.pear, 3))
+        self.assertFalse(self.sell(self.apple, 1))  # same order, only the counts moved
+        self.assertEqual(Bestseller.objects.get(window='7d', category=None, product=self.apple).units, 6)
+        self.assertTrue(self.sell(self.pear, 10))
+        self.assertEqual(list(top_products('7d')), [self.pear, self.apple])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Fruit')
+        self.a, self.b, self.c, self.d = (
+            Product.objects.create(category=category, name=name, description='', price=Decimal('1.00'))
+            for name in 'ABCD'
+        )
+
+    def order(self, *products, completed=True):
+        order = Order.objects.create(completed=completed, completed_at=timezone.now() if completed else None)
+        for product in products:
+            OrderItem.objects.create(order=order, product=product)
+        return order
+
+    def build(self):
+        output = io.StringIO()
+        call_command('build_recommendations', stdout=output)
+        return int(re.search(r'Indexed (\d+) orders', output.getvalue()).group(1))
+
+    def pairs(self):
+        return {(row.product_id, row.other_id): row.orders for row in CoPurchase.objects.all()}
+
+    def recommended(self, product):
+        return [row.recommended for row in Recommendation.objects.filter(product=product).order_by('rank')]
+
+    def test_co_purchases_are_counted_once_and_ranked(self):
+        a, b, c, d = self.a, self.b, self.c, self.d
+        for basket in ((a, b), (a, b, c), (a, c), (b, a), (c, d)):
+            self.order(*basket)
+        open_order = self.order(c, d, completed=False)
+        self.assertEqual(self.build(), 5)
+        pairs = self.pairs()
+        self.assertEqual([pairs[a.pk, a.pk], pairs[a.pk, b.pk], pairs[b.pk, a.pk], pairs[a.pk, c.pk],
+                          pairs[b.pk, c.pk], pairs[c.pk, d.pk]], [4, 3, 3, 2, 1, 1])
+        # a-b: 3 / sqrt(4 * 3), a-c: 2 / sqrt(4 * 3); b-c and c-d are below MIN_SUPPORT
+        self.assertEqual(self.recommended(a), [b, c])
+        self.assertAlmostEqual(Recommendation.objects.get(product=a, rank=1).score, 3 / math.sqrt(12), places=5)
+        self.assertEqual((self.recommended(b), self.recommended(d)), ([a], []))
+
+        # Only orders completed since the last run are added
+        self.assertEqual(self.build(), 0)
+        self.assertEqual(self.pairs(), pairs)
+        Order.objects.filter(pk=open_order.pk).update(completed=True, completed_at=timezone.now())
+        self.assertEqual(self.build(), 1)
+        self.assertEqual(self.pairs(), {**pairs, (c.pk, d.pk): 2, (d.pk, c.pk): 2, (c.pk, c.pk): 4, (d.pk, d.pk): 2})
+        self.assertEqual(self.recommended(d), [c])
+
+    @override_settings(FRESHMART_RECOMMENDATIONS=1)
+    def test_only_the_top_products_are_kept(self):
+        for basket in ((self.a, self.b, self.c),) * 3 + ((self.a, self.b),):
+            self.order(*basket)
+        self.build()
+        self.assertEqual(self.recommended(self.a), [self.b])
+
+
+# Not a TestCase: serialized_write only retries outside a transaction
+@override_settings(FRESHMART_WRITE_RETRIES=2, FRESHMART_WRITE_BACKOFF=0.01)
+class SerializedWriteTests(TransactionTestCase):
+    def setUp(self):
+        sleep = mock.patch('freshmart.db.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def failing(self, *errors):
+        """A write that raises `errors` in turn (then succeeds), and the number of calls made."""
+        calls = []
+
+        @serialized_write
+        def write():
+            calls.append(1)
+            if len(calls) <= len(errors):
+                Category.objects.create(name=f'Attempt {len(calls)}')  # undone by the rollback
+                raise errors[len(calls) - 1]
+            return Category.objects.create(name='Written')
+        return write, calls
+
+    def test_lock_errors_are_retried_with_backoff(self):
+        write, calls = self.failing(OperationalError('database is locked'), OperationalError('database is locked'))
+        self.assertEqual(write().name, 'Written')
+        self.assertEqual((len(calls), self.sleep.call_count), (3, 2))
+        self.assertLess(*(call.args[0] for call in self.sleep.call_args_list))  # exponential
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Written'])
+
+    def test_other_errors_and_exhausted_retries_propagate(self):
+        write, calls = self.failing(OperationalError('no such table: x'))
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            write()
+        self.assertEqual(len(calls), 1)
+        write, calls = self.failing(*[OperationalError('database is locked')] * 3)
+        with self.assertRaisesMessage(OperationalError, 'locked'):
+            write()
+        self.assertEqual((len(calls), Category.objects.count()), (3, 0))
+
+    def test_writers_in_a_process_take_turns(self):
+        inside, release, order = threading.Event(), threading.Event(), []
+
+        @serialized_write
+        def slow():
+            order.append('slow started')
+            inside.set()
+            release.wait(5)
+            order.append('slow done')
+
+        @serialized_write
+        def fast():
+            order.append('fast')
+
+        threads = [threading.Thread(target=slow), threading.Thread(target=fast)]
+        threads[0].start()
+        inside.wait(5)
+        threads[1].start()
+        threads[1].join(0.2)
+        self.assertTrue(threads[1].is_alive())  # waiting for the lock
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, ['slow started', 'slow done', 'fast'])
+
+    def test_add_counts_inserts_then_increments(self):
+        day = timezone.localdate()
+        rows = [(day, 1, 2, Decimal('3.50')), (day - timedelta(days=1), 1, 1, Decimal('1.00'))]
+        add_counts(DailySales, ['day'], ['orders', 'units', 'revenue'], rows, batch_size=1)
+        add_counts(DailySales, ['day'], ['orders', 'units', 'revenue'], rows[:1] * 2)
+        self.assertEqual(list(DailySales.objects.order_by('day').values_list('orders', 'units', 'revenue')),
+                         [(1, 1, Decimal('1.00')), (3, 6, Decimal('10.50'))])
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Many customers checking out at once, each submitting several times."""
+
+    customers = 12
+    duplicates = 3  # concurrent submissions of the same request (double clicks, retries)
+
+    def test_no_duplicate_or_lost_orders(self):
+        catalog_cache.clear()
+        cache.clear()
+        category = Category.objects.create(name='Fruit')
+        products = [
+            Product.objects.create(category=category, name=f'Product {i}', description='', price=Decimal('1.25') * (i + 1))
+            for i in range(5)
+        ]
+        clients = []
+        for i in range(self.customers):
+            client = Client()
+            add_to_cart(client, [{'product': products[i % 5].pk, 'delta': i + 1},
+                                 {'product': products[(i + 1) % 5].pk, 'delta': 1}])
+            clients.append(client)
+        expected_totals = {
+            client.session['cart_id']: str(products[i % 5].price * (i + 1) + products[(i + 1) % 5].price)
+            for i, client in enumerate(clients)
+        }
+
+        results = defaultdict(list)
+        errors = []
+        barrier = threading.Barrier(self.customers * (self.duplicates + 1))
+
+        def submit(customer, key):
+            client = Client()
+            client.cookies = clients[customer].cookies
+            try:
+                barrier.wait()
+                response = checkout(client, key)
+                results[customer].append((key, response.status_code, response.json(), response.get('Idempotent-Replayed')))
+            except Exception as exc:  # Surface thread failures in the test
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = []
+        for customer in range(self.customers):
+            # The same key several times, plus one submission with a different key
+            keys = [f'order-{customer}'] * self.duplicates + [f'other-{customer}']
+            threads += [threading.Thread(target=submit, args=(customer, key)) for key in keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for customer, outcomes in results.items():
+            statuses = Counter((status, replayed) for _, status, _, replayed in outcomes)
+            self.assertEqual(statuses[(201, 'false')], 1, outcomes)  # executed exactly once
+            winner = next(key for key, status, _, replayed in outcomes if status == 201 and replayed == 'false')
+            for key, status, body, replayed in outcomes:
+                # Duplicates of the winning request get its response. Any other request finds the
+                # cart closed (409), or already gone from the session the winner updated (400).
+                if key == winner:
+                    self.assertEqual(status, 201, outcomes)
+                else:
+                    self.assertIn(status, (400, 409), outcomes)
+            self.assertEqual(len({json.dumps(body) for key, _, body, _ in outcomes if key == winner}), 1)
+
+        orders = Order.objects.filter(completed=True)
+        self.assertEqual(orders.count(), self.customers)  # none lost
+        self.assertEqual(IdempotencyKey.objects.count(), self.customers)  # none doubled
+        self.assertEqual({order.pk: str(order.total) for order in orders}, expected_totals)
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        catalog_cache.clear()
+        cache.clear()
+        category = Category.objects.create(name='Fruit')
+        self.apple = Product.objects.create(category=category, name='Apple', description='', price=Decimal('1.50'))
+        self.pear = Product.objects.create(category=category, name='Pear', description='', price=Decimal('2.00'))
+        receive_stock(self.apple.pk, 5)  # pears aren't stock-tracked
+
+    def stock(self):
+        return Stock.objects.values_list('on_hand', 'reserved').get(pk=self.apple.pk)
+
+    def test_carts_reserve_and_checkout_commits(self):
+        first, second = Client(), Client()
+        add_to_cart(first, [{'product': self.apple.pk, 'delta': 3}, {'product': self.pear.pk, 'delta': 50}])
+        self.assertEqual(self.stock(), (5, 3))
+        response = add_to_cart(second, [{'product': self.apple.pk, 'delta': 3}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['available'], {str(self.apple.pk): 2})
+        self.assertEqual(add_to_cart(second, [{'product': self.apple.pk, 'delta': 2}]).status_code, 200)
+        add_to_cart(first, [{'product': self.apple.pk, 'quantity': 1}])
+        self.assertEqual(self.stock(), (5, 3))
+
+        self.assertEqual(checkout(first, 'key-1').status_code, 201)
+        self.assertEqual(self.stock(), (4, 2))
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertEqual(audit(), [])
+
+    def test_expired_holds_are_given_back(self):
+        first, second = Client(), Client()
+        add_to_cart(first, [{'product': self.apple.pk, 'delta': 5}])
+        Reservation.objects.update(expires_at=timezone.now())
+        # A cart that runs short takes over expired holds without waiting for the sweeper
+        self.assertEqual(add_to_cart(second, [{'product': self.apple.pk, 'delta': 2}]).status_code, 200)
+        self.assertEqual(self.stock(), (5, 2))
+        response = checkout(first, 'key-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.filter(completed=True).exists())
+        Reservation.objects.update(expires_at=timezone.now())
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(self.stock(), (5, 0))
+        self.assertEqual(audit(), [])
+
+    def test_deleted_carts_release_and_rebuild_repairs_drift(self):
+        client = Client()
+        add_to_cart(client, [{'product': self.apple.pk, 'delta': 4}])
+        Order.objects.all().delete()
+        self.assertEqual(self.stock(), (5, 0))
+        self.assertEqual(list(StockMovement.objects.values_list('kind', 'reserved_delta').order_by('pk')),
+                         [('receive', 0), ('reserve', 4), ('release', -4)])
+
+        Stock.objects.update(on_hand=9, reserved=1)
+        self.assertEqual(len(audit()), 2)
+        self.assertEqual(rebuild(), 2)
+        self.assertEqual(self.stock(), (5, 0))
+        self.assertEqual(audit(), [])
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    """Hundreds of shoppers grabbing the last units of one product at the same moment."""
+
+    shoppers = 200
+    units = 50
+
+    def test_no_oversell(self):
+        catalog_cache.clear()
+        cache.clear()
+        product = Product.objects.create(category=Category.objects.create(name='Fruit'), name='Mango',
+                                         description='', price=Decimal('3.00'))
+        receive_stock(product.pk, self.units)
+        clients = [Client() for _ in range(self.shoppers)]
+        statuses, errors = [], []
+        barrier = threading.Barrier(self.shoppers)
+
+        def shop(client):
+            try:
+                barrier.wait()
+                statuses.append(add_to_cart(client, [{'product': product.pk, 'delta': 1}]).status_code)
+            except Exception as exc:  # Surface thread failures in the test
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=shop, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Counter(statuses), {200: self.units, 409: self.shoppers - self.units})
+        self.assertEqual(Stock.objects.values_list('on_hand', 'reserved').get(), (self.units, self.units))
+        self.assertEqual(Reservation.objects.count(), self.units)
+        self.assertEqual(audit(), [])
+
+
+class WarmupTests(TransactionTestCase):
+    # Not a TestCase: warm_up closes the database connections when it is done
+    def test_every_template_compiles_and_the_pages_render(self):
+        report = warm_up(get_wsgi_application(), paths=['/', '/shop/'])
+        self.assertEqual(report['template_errors'], {})
+        self.assertGreater(report['templates'], 10)
+        self.assertEqual(report['requests'], {'/': 200, '/shop/': 200})
+
+
+@mock.patch('freshmart.feeds.SHARD_SIZE', 2)
+class CatalogFileTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        settings = override_settings(FRESHMART_FEED_ROOT=self.root.name, FRESHMART_SITE_URL='https://shop.example')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        category = Category.objects.create(name='Bakery')
+        self.products = [
+            Product.objects.create(category=category, name=f'Loaf {n}', description='', price=Decimal('2.50'))
+            for n in range(5)
+        ]
+
+    def shard_of(self, product):
+        return product.pk // 2
+
+    def test_only_changed_shards_are_rewritten(self):
+        shards = sorted({self.shard_of(product) for product in self.products})
+        self.assertEqual(build()['written'], shards)
+        self.assertEqual(build()['written'], [])
+
+        changed = self.products[2]
+        changed.price = Decimal('3.00')
+        changed.save()
+        self.assertEqual(build()['written'], [self.shard_of(changed)])
+        Stock.objects.create(product=self.products[0], on_hand=0)
+        self.assertEqual(build()['written'], [self.shard_of(self.products[0])])
+
+        last = self.products[-1]
+        Product.objects.filter(pk__gte=self.shard_of(last) * 2).delete()
+        result = build()
+        self.assertEqual((result['written'], result['removed']), ([], [self.shard_of(last)]))
+        self.assertEqual(len(build(full=True)['written']), len(shards) - 1)
+
+    def test_a_shard_is_rewritten_when_other_products_sell_out(self):
+        first, second, third, fourth = (product.pk for product in self.products[:4])
+        self.assertEqual(fourth - first, 3)
+        Stock.objects.bulk_create(Stock(product=product, on_hand=5) for product in self.products)
+        Stock.objects.filter(pk__in=[first, fourth]).update(on_hand=0)
+        with mock.patch('freshmart.feeds.SHARD_SIZE', 1000):
+            build()
+            # Same number of sold out products, and the same sum of their ids
+            Stock.objects.filter(pk__in=[first, fourth]).update(on_hand=5)
+            Stock.objects.filter(pk__in=[second, third]).update(on_hand=0)
+            self.assertEqual(build()['written'], [first // 1000])
+        with gzip.open(f'{self.root.name}/feeds/products-{first // 1000:04d}.jsonl.gz', 'rt') as f:
+            availability = {row['id']: row['availability'] for row in map(json.loads, f)}
+        self.assertEqual([availability[pk] for pk in (first, second, third, fourth)],
+                         ['in stock', 'out of stock', 'out of stock', 'in stock'])
+
+    def test_files_are_served_without_queries(self):
+        build()
+        client = Client()
+        with self.assertNumQueries(0):
+            index = client.get('/sitemap.xml')
+            feed = client.get(f'/feeds/products-{self.shard_of(self.products[0]):04d}.csv.gz')
+            escaping = client.get('/feeds/../manifest.json')
+        self.assertEqual(index.status_code, 200)
+        self.assertIn(b'https://shop.example/sitemaps/products-', b''.join(index.streaming_content))
+        self.assertEqual(feed['Content-Type'], 'application/gzip')
+        rows = gzip.decompress(b''.join(feed.streaming_content)).decode().splitlines()
+        self.assertTrue(rows[0].startswith('id,sku,title'))
+        self.assertIn(f'https://shop.example/product/{self.products[0].pk}/', rows[1])
+        self.assertEqual(escaping.status_code, 400)
+        self.assertEqual(client.get('/sitemap.xml', HTTP_IF_MODIFIED_SINCE=index['Last-Modified']).status_code, 304)
+
+
+@skipUnless(fts_available(), 'the search index is an SQLite FTS5 table')
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Bakery')
+
+    def names(self, text):
+        return [row['name'] for row in search_products(text)[0]]
+
+    def test_the_index_follows_product_and_category_writes(self):
+        loaf = Product.objects.create(category=self.category, name='Sourdough loaf', description='Slow rise',
+                                      price=Decimal('4.00'))
+        self.assertEqual(self.names('sourd'), ['Sourdough loaf'])
+        self.assertEqual(self.names('slow'), ['Sourdough loaf'])
+
+        loaf.name = 'Rye loaf'
+        loaf.save()
+        self.assertEqual((self.names('sourdough'), self.names('rye')), ([], ['Rye loaf']))
+        self.category.name = 'Breads'
+        self.category.save()
+        self.assertEqual((self.names('bakery'), self.names('breads')), ([], ['Rye loaf']))
+
+        loaf.delete()
+        self.assertEqual(self.names('rye'), [])
+
+    def test_bulk_imports_are_indexed(self):
+        Product.objects.create(category=self.category, name='Bagel', sku='B-1', description='', price=Decimal('1.00'))
+        with tempfile.TemporaryDirectory() as directory:
+            with open(f'{directory}/feed.csv', 'w', encoding='utf-8') as f:
+                f.write('sku,name,category,price\nB-1,Seeded bagel,Bakery,1.10\nB-2,Brioche,Bakery,3.00\n')
+            call_command('import_catalog', f'{directory}/feed.csv', rejects=f'{directory}/rejects.jsonl',
+                         stdout=io.StringIO())
+        self.assertEqual(self.names('seeded'), ['Seeded bagel'])
+        self.assertEqual(sorted(self.names('bakery')), ['Brioche', 'Seeded bagel'])
+
+
+class AssetTests(TestCase):
+    def test_js_minifier_keeps_strings_regexes_templates_and_line_breaks(self):
+        source = (
+            "// header\n"
+            "const url = 'http://example.com/*x*/'; // trailing\n"
+            "const re = /\\/\\/|\\/\\*/g, set = /[/*]/;\n"
+            "let t = `a // b\n    ${ {k: 1}.k + `in ${x}` } /* c */`;\n"
+            "function f(x) {\n"
+            "    return /* multi\n    line */ x;\n"
+            "}\n"
+            "a\n"
+            "    ++b\n"
+            "let y = i++ / 2; let q = '/';\n"
+            "if (!/^\\d+$/.test(s)) {}\n"
+        )
+        self.assertEqual(minify_js(source), (
+            "const url = 'http://example.com/*x*/';\n"
+            "const re = /\\/\\/|\\/\\*/g, set = /[/*]/;\n"
+            "let t = `a // b\n    ${ {k: 1}.k + `in ${x}` } /* c */`;\n"
+            "function f(x) {\n"
+            "return\n"  # still returns undefined
+            "x;\n"
+            "}\n"
+            "a\n"
+            "++b\n"
+            "let y = i++ / 2; let q = '/';\n"
+            "if (!/^\\d+$/.test(s)) {}\n"
+        ))
+
+    def test_css_minifier_keeps_strings_and_calc_spacing(self):
+        source = (
+            '/* theme */\n.a , .b > .c:hover {\n  width: calc(100% - 2 * 1rem) ;\n'
+            '  content: "/* x */ ; }";\n}\n@media (min-width: 600px) and (max-width: 900px) { .e { color: red } }\n'
+        )
+        self.assertEqual(minify_css(source), (
+            '.a,.b>.c:hover{width:calc(100% - 2 * 1rem);content:"/* x */ ; }"}'
+            '@media (min-width:600px) and (max-width:900px){.e{color:red}}'
+        ))
+
+    def test_collectstatic_writes_fingerprinted_minified_and_compressed_files(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            call_command('collectstatic', interactive=False, verbosity=0, ignore_patterns=['admin'])
+            with open(f'{root}/staticfiles.json', encoding='utf-8') as f:
+                hashed = json.load(f)['paths']['js/script.js']
+            self.assertRegex(hashed, r'^js/script\.[0-9a-f]{12}\.js$')
+            with open(f'{root}/{hashed}', encoding='utf-8') as f:
+                minified = f.read()
+            with open(f'{root}/{hashed}.gz', 'rb') as f:
+                self.assertEqual(gzip.decompress(f.read()).decode(), minified)
+            self.assertNotIn('// --- Mobile Menu Toggle ---', minified)
+            self.assertTrue(minified.startswith("document.addEventListener('DOMContentLoaded', () => {\nconst menuToggle"))
+
+            response = Client().get(f'/static/{hashed}', HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'br' if os.path.exists(f'{root}/{hashed}.br') else 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.rejects = f'{self.dir.name}/rejects.jsonl'
+
+    def import_feed(self, name, content, **options):
+        path = f'{self.dir.name}/{name}'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        call_command('import_catalog', path, rejects=self.rejects, stdout=io.StringIO(), **options)
+
+    def test_products_are_upserted_by_sku_and_bad_rows_rejected(self):
+        feed = ('sku,name,category,price,featured\n'
+                'A-1,Apples,Fruit,1.20,yes\n'
+                'B-2,Bread,Bakery,$2.50,no\n'
+                'C-3,Cheese,Dairy,-4,no\n'
+                'D-4,,Dairy,1.00,no\n')
+        self.import_feed('feed.csv', feed)
+        self.import_feed('feed.csv', feed.replace('1.20', '1.35'))
+
+        self.assertEqual(Product.objects.count(), 2)
+        apples = Product.objects.get(sku='A-1')
+        self.assertEqual((apples.price, apples.featured, apples.category.name), (Decimal('1.35'), True, 'Fruit'))
+        with open(self.rejects, encoding='utf-8') as f:
+            rejects = [json.loads(line) for line in f]
+        self.assertEqual([(reject['line'], reject['row']['sku']) for reject in rejects], [(4, 'C-3'), (5, 'D-4')])
+        self.assertIn('Missing name', rejects[1]['error'])
+
+    def test_rows_only_overwrite_the_columns_they_have(self):
+        full = {'sku': 'A-1', 'name': 'Apples', 'category': 'Fruit', 'price': '1.20',
+                'description': 'Crisp', 'image_url': 'https://img.example/a.jpg', 'featured': True}
+        self.import_feed('feed.jsonl', json.dumps(full) + '\n' + json.dumps({**full, 'sku': 'B-2'}) + '\n')
+
+        # A full row first, then rows without description, image and flag, in one batch size
+        partial = {'name': 'Green apples', 'category': 'Fruit', 'price': '1.40'}
+        lines = [{**full, 'sku': 'C-3'}, {**partial, 'sku': 'A-1'}, {**partial, 'sku': 'B-2', 'featured': False}]
+        self.import_feed('update.jsonl', ''.join(json.dumps(line) + '\n' for line in lines), batch_size=10)
+
+        apples, other = Product.objects.get(sku='A-1'), Product.objects.get(sku='B-2')
+        self.assertEqual((apples.name, apples.price), ('Green apples', Decimal('1.40')))
+        self.assertEqual((apples.description, apples.image_url, apples.featured),
+                         ('Crisp', 'https://img.example/a.jpg', True))
+        self.assertEqual((other.description, other.featured), ('Crisp', False))
+        self.assertEqual(Product.objects.get(sku='C-3').description, 'Crisp')
+
+
+@override_settings(FRESHMART_RATE_LIMITS={'contact': {'ip': (3, 3600), 'session': (2, 3600)}})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        limiter.clear()
+        self.addCleanup(limiter.clear)
+
+    def test_buckets_refill_and_evict(self):
+        buckets = TokenBuckets(max_entries=2)
+        self.assertEqual(buckets.take('a', 1, 10, now=0), 0)
+        self.assertEqual(buckets.take('a', 1, 10, now=0), 10)
+        self.assertEqual(buckets.take('a', 1, 10, now=5), 5)
+        self.assertEqual(buckets.take('a', 1, 10, now=15), 0)
+        buckets.take('b', 1, 10, now=15)
+        buckets.take('c', 1, 10, now=15)
+        self.assertEqual((len(buckets), buckets.evictions), (2, 1))
+        self.assertEqual(buckets.take('a', 1, 10, now=15), 0)  # forgotten, so full again
+
+    def test_over_limit_posts_are_rejected_without_queries(self):
+        client = Client()
+        session = client.session
+        session['visited'] = True
+        session.save()
+        self.assertEqual([client.post('/contact/', {}).status_code for _ in range(2)], [200, 200])
+        with self.assertNumQueries(0):
+            response = client.post('/contact/', {})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(client.get('/contact/').status_code, 200)
+
+        # Without the session cookie, the same address still has one request left
+        other = Client()
+        self.assertEqual([other.post('/contact/', {}).status_code for _ in range(2)], [200, 429])
+        stats = limiter.snapshot()
+        self.assertEqual((stats['contact_allowed'], stats['contact_rejected_by_session'],
+                          stats['contact_rejected_by_ip']), (3, 1, 1))
+
+
+class BenchmarkTests(TestCase):
+    def seed(self, **options):
+        call_command('seed_bench', scale='tiny', products=50, reviews=300, orders=40, stdout=io.StringIO(), **options)
+
+    def test_seed_is_consistent_and_repeatable(self):
+        self.seed()
+        self.assertEqual((Product.objects.count(), Review.objects.count(), Order.objects.count()), (50, 300, 40))
+        for product in Product.objects.all():
+            ratings = list(product.reviews.values_list('rating', flat=True))
+            self.assertEqual(product.review_count, len(ratings))
+            self.assertEqual(product.rating_sum, sum(ratings))
+            self.assertEqual([getattr(product, f'stars_{star}') for star in range(1, 6)],
+                             [ratings.count(star) for star in range(1, 6)])
+        for order in Order.objects.annotate(lines=Sum(F('items__quantity') * F('items__unit_price'))):
+            self.assertTrue(order.completed)
+            self.assertEqual(order.total, order.lines)
+        first = list(OrderItem.objects.order_by('pk').values_list('product__sku', 'quantity'))
+
+        with self.assertRaises(CommandError):
+            self.seed()
+        OrderItem.objects.all().delete()
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+        self.seed(skip_derived=True)
+        self.assertEqual(list(OrderItem.objects.order_by('pk').values_list('product__sku', 'quantity')), first)
+
+    def test_client_suite_covers_every_scenario(self):
+        self.seed()
+        results = run_client_suite(requests=2, order_requests=1)
+        self.assertIn('admin_products', results)
+        self.assertEqual(Order.objects.filter(completed=True).count(), 41)
+        for row in results.values():
+            self.assertGreater(row['queries'], 0)
+
+    def test_compare_flags_regressions_past_the_threshold(self):
+        row = {'queries': 3, 'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0, 'rps': 100.0}
+        baseline = {'client': {'shop': row, 'home': {**row, 'p95_ms': 0.2, 'p99_ms': 0.3}}}
+        self.assertEqual(compare(baseline, baseline), [])
+        noise = {'client': {'shop': {**row, 'p95_ms': 24.0, 'rps': 80.0},
+                            'home': {**row, 'p95_ms': 0.9, 'p99_ms': 1.2}}}  # 4x, but under a millisecond
+        self.assertEqual(compare(baseline, noise), [])
+        worse = {'client': {'shop': {**row, 'queries': 4, 'p99_ms': 40.0, 'rps': 70.0}}}
+        self.assertEqual(len(compare(baseline, worse)), 3)
+        self.assertEqual(compare(baseline, worse, threshold=0.5), ['client/shop: 4 queries (baseline 3)'])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        # The middleware patches template rendering, adds a log handler and registers an exit flush
+        self.addCleanup(setattr, DjangoTemplate, 'render', DjangoTemplate.render)
+        self.addCleanup(self.reset_slow_log)
+        for patcher in [mock.patch('freshmart.profiling.atexit'), mock.patch('freshmart.profiling.FLUSH_INTERVAL', -1)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        catalog_cache.clear()
+        cache.clear()
+
+    def reset_slow_log(self):
+        slow_log = logging.getLogger('freshmart.slow_requests')
+        for handler in slow_log.handlers[:]:
+            slow_log.removeHandler(handler)
+            handler.close()
+        slow_log.setLevel(logging.NOTSET)
+        slow_log.propagate = True
+
+    def profile(self, rate, slow_ms=500):
+        overrides = override_settings(FRESHMART_PROFILE_SAMPLE_RATE=rate, FRESHMART_PROFILE_SLOW_MS=slow_ms,
+                                      FRESHMART_PROFILE_DIR=self.dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        return Client()  # A new client loads the middleware with these settings
+
+    def test_rate_zero_removes_the_middleware(self):
+        client = self.profile(0)
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestProfilerMiddleware(lambda request: HttpResponse())
+        response = client.get('/shop/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_rate_one_profiles_every_request(self):
+        client = self.profile(1)
+        for _ in range(3):
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get('/shop/')
+            timing = response['Server-Timing']
+            self.assertIn(f'desc="{len(captured)} queries"', timing)
+            self.assertEqual([metric.split(';')[0] for metric in timing.split(', ')], ['db', 'tpl', 'app', 'total'])
+        self.assertEqual(load_view_stats(self.dir)['freshmart:shop']['count'], 3)
+
+    def test_fractional_rate_samples_requests(self):
+        client = self.profile(0.5)
+        with mock.patch('freshmart.profiling.random.random', side_effect=[0.2, 0.7]):
+            self.assertIn('Server-Timing', client.get('/shop/'))
+            self.assertNotIn('Server-Timing', client.get('/shop/'))
+        self.assertEqual(load_view_stats(self.dir)['freshmart:shop']['count'], 1)
+
+    def test_execute_wrapper_counts_queries_and_logs_repeats(self):
+        self.profile(1, slow_ms=0)
+
+        def view(request):
+            for _ in range(3):
+                Product.objects.count()
+            Category.objects.count()
+            return HttpResponse()
+
+        response = RequestProfilerMiddleware(view)(RequestFactory().get('/slow/?page=2'))
+        self.assertIn('desc="4 queries"', response['Server-Timing'])
+
+        with open(os.path.join(self.dir, 'slow_requests.jsonl')) as f:
+            [entry] = [json.loads(line) for line in f]
+        self.assertEqual((entry['path'], entry['view'], entry['queries']), ('/slow/?page=2', 'unresolved', 4))
+        self.assertEqual(len(entry['duplicates']), 1)
+        self.assertEqual(entry['duplicates'][0]['count'], 3)
+        self.assertIn('freshmart_product', entry['duplicates'][0]['sql'])
+
+    def test_report_merges_every_process_file(self):
+        out = io.StringIO()
+        with override_settings(FRESHMART_PROFILE_DIR=self.dir):
+            call_command('profile_report', stdout=out)
+        self.assertIn('No profiling data', out.getvalue())
+
+        # Two server processes, each with its own stats file; samples are (wall ms, db ms, queries)
+        processes = {
+            'views-101.json': {'freshmart:shop': {'count': 2, 'samples': [[10, 2, 4], [30, 4, 4]]},
+                               'freshmart:home': {'count': 1, 'samples': [[5, 1, 2]]}},
+            'views-102.json': {'freshmart:shop': {'count': 2, 'samples': [[20, 3, 6], [40, 5, 6]]}},
+        }
+        for name, data in processes.items():
+            with open(os.path.join(self.dir, name), 'w') as f:
+                json.dump(data, f)
+
+        out = io.StringIO()
+        with override_settings(FRESHMART_PROFILE_DIR=self.dir):
+            call_command('profile_report', '--json', '--reset', stdout=out)
+        report, reset = out.getvalue().rstrip('\n').rsplit('\n', 1)
+        shop, home = json.loads(report)
+        self.assertEqual(shop, {'view': 'freshmart:shop', 'count': 4, 'p50': 30, 'p90': 40, 'p99': 40,
+                                'avg_db_ms': 3.5, 'avg_queries': 5.0})
+        self.assertEqual((home['view'], home['count'], home['p99']), ('freshmart:home', 1, 5))
+        self.assertIn('Profiling stats reset.', reset)
+        self.assertEqual(os.listdir(self.dir), [])
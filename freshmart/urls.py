@@ -1,14 +1,33 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 app_name = 'freshmart'
 
+# Under ASGI the catalog, search and cart APIs are the async implementations
+api = async_views if settings.FRESHMART_ASYNC_VIEWS else views
+
 urlpatterns = [
     path('', views.home, name='home'),
     path('admin/', admin.site.urls),
     path('shop/', views.shop, name='shop'),
     path('contact/', views.contact, name='contact'),
-    
+    path('product/<int:pk>/', views.product_detail, name='product_detail'),
+    path('product/<int:pk>/review/', views.add_review, name='add_review'),
+    path('api/products/', api.catalog_api, name='catalog_api'),
+    path('api/search/', api.search_api, name='search_api'),
+    path('api/cart/', api.cart_api, name='cart_api'),
+    path('api/checkout/', views.checkout_api, name='checkout_api'),
+    path('api/bestsellers/', views.bestsellers_api, name='bestsellers_api'),
+    path('api/reports/sales/', views.sales_report_api, name='sales_report_api'),
+    path('images/<int:pk>/<slug:size>.<slug:fmt>', views.product_image, name='product_image'),
+    path(f"{settings.MEDIA_URL.lstrip('/')}products/<path:path>", views.rendition_file, name='rendition_file'),
+    path(f"{settings.STATIC_URL.lstrip('/')}<path:path>", views.static_asset, name='static_asset'),
+    path('sitemap.xml', views.catalog_file, {'path': 'sitemap.xml'}, name='sitemap'),
+    path('sitemaps/<path:path>', views.catalog_file, {'directory': 'sitemaps'}, name='sitemap_file'),
+    path('feeds/<path:path>', views.catalog_file, {'directory': 'feeds'}, name='feed_file'),
+    path('api/cache-stats/', views.cache_stats, name='cache_stats'),
+    path('api/rate-limit-stats/', views.rate_limit_stats, name='rate_limit_stats'),
 ]
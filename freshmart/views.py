@@ -1,10 +1,316 @@
-from django.shortcuts import render
+import json
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_http_methods, require_POST
+from django.views.static import was_modified_since
+
+from .cache import cached_response, catalog_cache, conditional_response
+from .cart import SESSION_KEY, CartError, apply_changes, get_cart, parse_changes, read_cart
+from .checkout import MAX_KEY_LENGTH, CheckoutError, complete_order, find_replay, request_owner
+from .assets import FINGERPRINTED, precompressed
+from .forms import CheckoutForm, ContactForm, ProductReviewForm
+from .images import FORMATS, IMAGE_DIR, SIZES, ImageError, ensure_product_image, rendition_name
+from .inventory import InsufficientStock
+from .catalog import CARD_FIELDS, CatalogError, product_page, resolve_category, serialize_product
+from .models import Category, Order, Product, Review
+from .outbox import enqueue
+from .rankings import WINDOWS, top_products
+from .ratelimit import limiter, rate_limited
+from .reports import ReportError, parse_period, sales_report
+from .search import search_products
+
+
+def listing_namespaces(request):
+    # Catalog API pages only depend on their own category (or on every product for "all")
+    category_ids = catalog_cache.get_or_set('category-ids', ['categories'], lambda: {
+        name.lower(): pk for pk, name in Category.objects.values_list('pk', 'name')
+    })
+    value = (request.GET.get('category') or '').lower()
+    category_id = int(value) if value.isdigit() else category_ids.get(value)
+    return [f'category:{category_id}'] if category_id else ['products']
+
 
 # Create your views here.
+# Querysets are lazy: when the cached fragments in home.html hit, they never run.
+@conditional_response(['categories', 'featured', 'bestsellers', 'reviews'])
+@cached_response(['categories', 'featured', 'bestsellers', 'reviews'])
 def home(request):
-    return render(request, 'home.html')
+    return render(request, 'home.html', {
+        'categories': Category.objects.order_by('name').only('name'),
+        # The grid shows last week's bestsellers, else the last month's, else the featured flag
+        'bestsellers_7d': top_products('7d', limit=8),
+        'bestsellers_30d': top_products('30d', limit=8),
+        'featured_products': Product.objects.filter(featured=True).order_by('name')[:8],
+        'recent_reviews': Review.objects.select_related('product').order_by('-created_at')[:6],
+    })
 
+@conditional_response(['categories'])
+@cached_response(['categories'])
 def shop(request):
-    return render(request, 'shop.html')
+    categories = Category.objects.order_by('name').only('name')
+    return render(request, 'shop.html', {
+        'categories': categories,
+        'search_query': request.GET.get('search', ''),
+    })
+
+# Contact messages and reviews are queued (freshmart.outbox) and written to the
+# database in batches shortly after, so the request never waits for a write lock.
+# Floods are cut off by the rate limits first (freshmart.ratelimit).
+@rate_limited('contact')
 def contact(request):
-    return render(request, 'contact.html')
\ No newline at end of file
+    form = ContactForm(request.POST or None)
+    if request.method == 'POST' and form.is_valid():
+        enqueue('contact', form.cleaned_data)
+        messages.success(request, "Thanks for your message! We'll get back to you soon.")
+        return redirect('freshmart:contact')
+    return render(request, 'contact.html', {'form': form}, status=400 if form.errors else 200)
+
+
+@require_POST
+@rate_limited('review')
+def add_review(request, pk):
+    product = get_object_or_404(Product.objects.only('pk'), pk=pk)
+    form = ProductReviewForm(request.POST)
+    if form.is_valid():
+        enqueue('review', {
+            **form.cleaned_data,
+            'product_id': product.pk,
+            'user_id': request.user.pk if request.user.is_authenticated else None,
+        })
+        messages.success(request, 'Thanks for your review! It will appear in a moment.')
+    else:
+        for errors in form.errors.values():
+            messages.error(request, errors[0])
+    return redirect('freshmart:product_detail', pk=product.pk)
+
+# The page carries each visitor's CSRF token in its review form, so only the fragments
+# around the form are cached (product.html); their querysets don't run on a hit.
+@conditional_response(lambda request, pk: [f'product:{pk}'])
+def product_detail(request, pk):
+    # Rating summary comes from the aggregates on Product; only the latest reviews are loaded
+    product = get_object_or_404(Product.objects.select_related('category'), pk=pk)
+    reviews = product.reviews.order_by('-created_at')[:10]
+    # Precomputed by build_recommendations: one indexed lookup
+    bought_together = Product.objects.filter(recommended_for__product=product).order_by('recommended_for__rank')
+    return render(request, 'product.html', {
+        'product': product, 'reviews': reviews, 'bought_together': bought_together,
+        'namespace': f'product:{pk}',
+    })
+
+
+# JSON catalog used by the shop page (filtering, sorting and paging happen in the DB)
+@conditional_response(listing_namespaces)
+@cached_response(listing_namespaces)
+def catalog_api(request):
+    try:
+        rows, next_cursor = product_page(
+            category=request.GET.get('category'),
+            sort=request.GET.get('sort', 'default'),
+            cursor=request.GET.get('cursor'),
+            limit=request.GET.get('limit', 24),
+        )
+    except CatalogError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({
+        'results': [serialize_product(row) for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+
+# Ranked full-text search (FTS5); also used for typeahead with a small limit
+@conditional_response(['products'])
+@cached_response(['products'])
+def search_api(request):
+    try:
+        rows, next_cursor = search_products(
+            request.GET.get('q', ''),
+            category=request.GET.get('category'),
+            cursor=request.GET.get('cursor'),
+            limit=request.GET.get('limit', 20),
+        )
+    except CatalogError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({
+        'results': [serialize_product(row) for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+
+# Precomputed sales rankings: ?window=7d|30d and an optional ?category=<id or name>
+@conditional_response(['bestsellers', 'products'])
+@cached_response(['bestsellers', 'products'])
+def bestsellers_api(request):
+    window = request.GET.get('window', '7d')
+    if window not in WINDOWS:
+        return JsonResponse({'error': f"Unknown window {window!r}."}, status=400)
+    category_id = None
+    if request.GET.get('category'):
+        try:
+            category_id = resolve_category(request.GET['category'])
+        except CatalogError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+    rows = top_products(window, category_id).values(*CARD_FIELDS)
+    return JsonResponse({'window': window, 'results': [serialize_product(row) for row in rows]})
+
+
+# Server-side cart: GET returns it, POST applies a batch of changes and returns it re-priced.
+# The GET also hands out the CSRF cookie the storefront script needs for its POSTs.
+@ensure_csrf_cookie
+@require_http_methods(['GET', 'POST'])
+def cart_api(request):
+    if request.method == 'POST':
+        try:
+            changes = parse_changes(json.loads(request.body or b'{}'))
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc) if isinstance(exc, CartError) else 'Invalid JSON.'}, status=400)
+        if changes:
+            try:
+                apply_changes(get_cart(request, create=True).pk, changes)
+            except CartError as exc:
+                return JsonResponse({'error': str(exc)}, status=400)
+            except InsufficientStock as exc:
+                return JsonResponse({'error': str(exc), 'available': exc.available}, status=409)
+    return JsonResponse(read_cart(request))
+
+
+# Checkout: needs an Idempotency-Key header; a retry with the same key gets the original answer
+@require_POST
+def checkout_api(request):
+    key = request.headers.get('Idempotency-Key', '').strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return JsonResponse({'error': f'Send an Idempotency-Key header of at most {MAX_KEY_LENGTH} characters.'},
+                            status=400)
+    owner = request_owner(request)
+    replay = find_replay(owner, key)  # Cheap check without taking the write lock
+    if replay is None:
+        try:
+            data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON.'}, status=400)
+        form = CheckoutForm(data)
+        if not form.is_valid():
+            return JsonResponse({'error': 'Please check your delivery details.', 'fields': form.errors}, status=400)
+        cart_id = request.session.get(SESSION_KEY)
+        cart = get_cart(request)
+        try:
+            if cart is None:
+                # Possibly a duplicate of a request that completed the cart since our first check
+                replay = find_replay(owner, key)
+                if replay is None:
+                    if cart_id and Order.objects.filter(pk=cart_id, completed=True).exists():
+                        raise CheckoutError('This cart has already been checked out.', status=409)
+                    raise CheckoutError('Your cart is empty.')
+            else:
+                status, body, replayed = complete_order(cart.pk, owner, key, form.cleaned_data)
+                request.session.pop(SESSION_KEY, None)
+        except CheckoutError as exc:
+            return JsonResponse({'error': str(exc)}, status=exc.status)
+    if replay is not None:
+        (status, body), replayed = replay, True
+    response = JsonResponse(body, status=status)
+    response['Idempotent-Replayed'] = 'true' if replayed else 'false'
+    return response
+
+
+# Image proxy: makes a product's resized renditions on first use, then redirects to the stored file
+def product_image(request, pk, size, fmt):
+    if size not in SIZES or fmt not in FORMATS:
+        raise Http404('Unknown image size or format.')
+    image_url = get_object_or_404(Product.objects.values_list('image_url', flat=True), pk=pk)
+    if not image_url:
+        raise Http404('This product has no image.')
+    try:
+        image_hash = ensure_product_image(pk)
+    except ImageError:
+        # Better the full-size original than a broken image
+        if image_url.startswith(('http://', 'https://')):
+            return redirect(image_url)
+        raise Http404('This product image is unavailable.')
+    response = redirect(settings.MEDIA_URL + rendition_name(image_hash, size, fmt))
+    patch_cache_control(response, public=True, max_age=3600)
+    return response
+
+
+# Rendition paths contain the hash of their content, so they can be cached "forever".
+# In production the web server should serve MEDIA_ROOT with the same Cache-Control.
+def rendition_file(request, path):
+    full_path = safe_join(settings.MEDIA_ROOT, IMAGE_DIR, path)  # rejects ../ escapes
+    if not os.path.isfile(full_path):
+        raise Http404
+    response = FileResponse(open(full_path, 'rb'), content_type=f"image/{'jpeg' if path.endswith('.jpg') else 'webp'}")
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+# Collected static files, pre-compressed by collectstatic (see freshmart.assets). Fingerprinted
+# names change with their content, so browsers may keep them for a year without revalidating.
+# As with renditions, a web server in front should serve STATIC_ROOT the same way.
+def static_asset(request, path):
+    full_path = safe_join(settings.STATIC_ROOT, path)
+    if not os.path.isfile(full_path):
+        raise Http404
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    served_path, encoding = precompressed(full_path, request.headers.get('Accept-Encoding', ''))
+    response = FileResponse(open(served_path, 'rb'), content_type=content_type, filename=os.path.basename(full_path))
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if FINGERPRINTED.search(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        patch_cache_control(response, public=True, max_age=300)
+    return response
+
+
+# Sitemaps and product feeds, as written by `manage.py build_catalog_files` (freshmart.feeds).
+# Their names don't change when they are rewritten, so clients revalidate with If-Modified-Since.
+def catalog_file(request, path, directory=''):
+    full_path = safe_join(os.path.join(settings.FRESHMART_FEED_ROOT, directory), path)  # rejects ../ escapes
+    if not os.path.isfile(full_path):
+        raise Http404
+    modified = os.stat(full_path).st_mtime
+    if not was_modified_since(request.headers.get('If-Modified-Since'), modified):
+        return HttpResponseNotModified()
+    if path.endswith('.gz'):
+        content_type = 'application/gzip'  # the file itself, not a transfer encoding
+    else:
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    response['Last-Modified'] = http_date(modified)
+    patch_cache_control(response, public=True, max_age=3600)
+    return response
+
+
+# Sales between ?start and ?end (YYYY-MM-DD, month to date by default), ?by=day|category|product,
+# optionally for one ?category; read from the daily rollups (freshmart.reports) only
+@staff_member_required
+def sales_report_api(request):
+    try:
+        start, end = parse_period(request.GET.get('start'), request.GET.get('end'))
+        category_id = resolve_category(request.GET['category']) if request.GET.get('category') else None
+        report = sales_report(start, end, by=request.GET.get('by', 'day'), category_id=category_id)
+    except (ReportError, CatalogError) as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(report)
+
+
+@staff_member_required
+def cache_stats(request):
+    # Counters are per worker process
+    return JsonResponse(catalog_cache.snapshot())
+
+
+@staff_member_required
+def rate_limit_stats(request):
+    # Counters are per worker process
+    return JsonResponse(limiter.snapshot())
@@ -0,0 +1,121 @@
+import io
+import logging
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.urls import get_resolver
+
+logger = logging.getLogger('freshmart.warmup')
+
+# Work a fresh worker process would otherwise do on its first requests: parse every
+# template (kept by the cached loader for the life of the process), build the URL
+# resolver's lookup tables, and render a few pages once. wsgi.py / asgi.py run it
+# before handing out the application when FRESHMART_WARMUP is on; under a server that
+# forks workers from a preloaded app (gunicorn --preload) it happens once, in the master.
+
+
+def template_names(engine):
+    """Names of every template a Django engine can load, first directory winning."""
+    names = {}
+    for loader in engine.template_loaders:
+        for inner in getattr(loader, 'loaders', [loader]):
+            for directory in inner.get_dirs() if hasattr(inner, 'get_dirs') else []:
+                root = Path(directory)
+                if not root.is_dir():
+                    continue
+                for path in sorted(root.rglob('*')):
+                    if path.is_file() and not path.name.startswith('.'):
+                        names.setdefault(path.relative_to(root).as_posix(), path)
+    return list(names)
+
+
+def compile_templates(skip=None):
+    """
+    Load every template through the engines' loaders, except names starting with a
+    prefix in `skip` (default FRESHMART_WARMUP_SKIP_TEMPLATES); returns (count, {name: error}).
+    """
+    skip = tuple(settings.FRESHMART_WARMUP_SKIP_TEMPLATES if skip is None else skip)
+    count, errors = 0, {}
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for name in template_names(backend.engine):
+            if skip and name.startswith(skip):
+                continue
+            try:
+                backend.engine.get_template(name)
+                count += 1
+            except (TemplateSyntaxError, UnicodeDecodeError) as exc:
+                errors[name] = str(exc)
+    return count, errors
+
+
+def resolve_urls():
+    """Import the URLconf and build the resolver's reverse and namespace tables; returns the pattern count."""
+    # The first access to reverse_dict populates all three tables, compiling every pattern
+    return len(get_resolver().reverse_dict)
+
+
+def local_host():
+    """A Host header the settings accept, for requests made in-process."""
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+def wsgi_get(application, path, host=None):
+    """GET `path` from a WSGI application in-process; returns the status code."""
+    host = host or local_host()
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': host, 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    status = []
+    body = application(environ, lambda s, headers, exc_info=None: status.append(s))
+    try:
+        b''.join(body)
+    finally:
+        body.close()
+    return int(status[0].split()[0])
+
+
+def warm_up(application=None, paths=None):
+    """
+    Compile templates, resolve URLs and, given the WSGI application, GET `paths`
+    (default FRESHMART_WARMUP_PATHS). Returns timings in ms and what was done.
+    """
+    report = {}
+    started = time.perf_counter()
+    report['templates'], report['template_errors'] = compile_templates()
+    report['templates_ms'] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    report['url_names'] = resolve_urls()
+    report['urls_ms'] = (time.perf_counter() - started) * 1000
+
+    report['requests'] = {}
+    if application is not None:
+        started = time.perf_counter()
+        for path in settings.FRESHMART_WARMUP_PATHS if paths is None else paths:
+            try:
+                report['requests'][path] = wsgi_get(application, path)
+            except Exception:  # A failing page must not stop the worker from starting
+                logger.exception('Warm-up request to %s failed', path)
+                report['requests'][path] = None
+        report['requests_ms'] = (time.perf_counter() - started) * 1000
+        # Don't hand the warm-up's connections to forked workers or other threads
+        connections.close_all()
+
+    for name, error in report['template_errors'].items():
+        logger.warning('Template %s does not compile: %s', name, error)
+    logger.info('Warm-up: %d templates in %.0fms, %d URL names in %.0fms',
+                report['templates'], report['templates_ms'], report['url_names'], report['urls_ms'])
+    return report
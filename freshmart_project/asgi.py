@@ -7,10 +7,28 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import gc
 import os
 
-from django.core.asgi import get_asgi_application
+# The collector is paused during startup, as in wsgi.py
+gc.disable()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'freshmart_project.settings')
+# Serve the async versions of the catalog, search and cart APIs
+os.environ.setdefault('FRESHMART_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# Compile templates and render a few pages before serving (freshmart.warmup); the
+# pages are requested through a WSGI handler, which needs no event loop
+from django.conf import settings  # noqa: E402
+
+if settings.FRESHMART_WARMUP:
+    from django.core.wsgi import get_wsgi_application
+    from freshmart.warmup import warm_up
+    warm_up(get_wsgi_application())
+
+gc.freeze()
+gc.enable()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,6 +48,7 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 
 MIDDLEWARE = [
+    'freshmart.profiling.RequestProfilerMiddleware',  # no-op unless FRESHMART_PROFILE_SAMPLE_RATE > 0
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,13 +81,125 @@ WSGI_APPLICATION = 'freshmart_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite profiles. "tuned" is meant for serving traffic:
+# - WAL lets reads continue while a write commits; synchronous=NORMAL is safe with
+#   WAL (a power cut can lose the last commits, never corrupt the file)
+# - mmap_size / cache_size keep hot pages in memory (cache_size < 0 is in KiB)
+# - busy_timeout makes a writer wait for the lock instead of failing at once
+# - transaction_mode IMMEDIATE takes the write lock at BEGIN, so concurrent writers
+#   queue on busy_timeout rather than deadlocking when a read upgrades to a write
+# - persistent connections skip reconnecting and re-running the pragmas per request
+# "basic" is Django's default behaviour, kept for comparison (manage.py bench_sqlite).
+# Pick one with FRESHMART_SQLITE_PROFILE; FRESHMART_SQLITE_PATH overrides the file.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_PROFILES = {
+    'basic': {},
+    'tuned': {
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': '; '.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+    },
+}
+
+SQLITE_PROFILE = os.environ.get('FRESHMART_SQLITE_PROFILE', 'tuned')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('FRESHMART_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # A file rather than the shared in-memory default, so concurrency tests see
+        # the same WAL locking as production
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        **SQLITE_PROFILES[SQLITE_PROFILE],
+    }
+}
+
+# Serve the async catalog, search and cart APIs (freshmart.async_views); asgi.py turns
+# this on. Their ORM calls run in a thread per request, whose connection is never
+# reused, so persistent connections are off with them.
+FRESHMART_ASYNC_VIEWS = os.environ.get('FRESHMART_ASYNC_VIEWS') == '1'
+if FRESHMART_ASYNC_VIEWS:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Retries of freshmart.db.serialized_write when SQLite still reports the database
+# locked after busy_timeout; the wait doubles each time (with jitter)
+FRESHMART_WRITE_RETRIES = 5
+FRESHMART_WRITE_BACKOFF = 0.05  # seconds before the first retry
+
+# Contact messages and reviews are queued in this file and written to the database
+# in batches (freshmart.outbox). A thread in each web process drains it; set
+# FRESHMART_OUTBOX_THREAD = False when `manage.py drain_outbox` runs on its own.
+FRESHMART_OUTBOX_PATH = os.environ.get('FRESHMART_OUTBOX_PATH', BASE_DIR / 'outbox.sqlite3')
+FRESHMART_OUTBOX_THREAD = True
+
+# Stock put in a cart is held this long after the cart last changed (freshmart.inventory);
+# `manage.py release_reservations` gives back expired holds
+FRESHMART_RESERVATION_TTL = 30 * 60  # seconds
+
+# Rate limits for anonymous input (freshmart.ratelimit): POSTs over them are answered
+# with 429 before the form is validated. scope -> {'ip' | 'session': (requests, seconds)},
+# a token bucket of that many requests, refilled over that many seconds.
+FRESHMART_RATE_LIMITS = {
+    'contact': {'ip': (20, 60 * 60), 'session': (5, 60 * 60)},
+    'review': {'ip': (60, 60 * 60), 'session': (20, 60 * 60)},
+}
+FRESHMART_RATE_LIMIT_ENTRIES = 10_000  # buckets kept per process, least recently used evicted
+# A CACHES alias (e.g. a memcached on the host) to share the buckets between workers
+FRESHMART_RATE_LIMIT_CACHE = None
+# Where the client address comes from behind a proxy, e.g. 'HTTP_X_FORWARDED_FOR'; REMOTE_ADDR if None
+FRESHMART_CLIENT_IP_HEADER = None
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Shared tier of freshmart.cache.TieredCache. With several worker processes point
+# this at a backend they all see (FileBasedCache, Redis, Memcached) so cache
+# invalidations reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'freshmart',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
     }
 }
 
+FRESHMART_CACHE_LOCAL_ENTRIES = 256  # per-process LRU size
+FRESHMART_CACHE_TIMEOUT = 60 * 60
+# Part of the catalog pages' ETags: set it per deploy so template changes aren't answered with 304
+FRESHMART_RELEASE = os.environ.get('FRESHMART_RELEASE', '')
+
+
+# Worker warm-up (freshmart.warmup): wsgi.py / asgi.py compile every template, build the
+# URL tables and GET these pages before serving, instead of the first visitors paying
+# for it. On in settings_production; `manage.py warmup --profile` measures the effect.
+FRESHMART_WARMUP = os.environ.get('FRESHMART_WARMUP') == '1'
+FRESHMART_WARMUP_PATHS = ['/', '/shop/', '/api/products/']
+# Staff-only templates, left to compile on first use so storefront workers are ready sooner
+FRESHMART_WARMUP_SKIP_TEMPLATES = ['admin/']
+
+
+# Request profiling (freshmart.profiling.RequestProfilerMiddleware)
+# Fraction of requests profiled, e.g. 1.0 while developing or 0.01 in production.
+# Slow requests are logged to FRESHMART_PROFILE_DIR/slow_requests.jsonl; per-view
+# percentiles are printed by manage.py profile_report.
+
+FRESHMART_PROFILE_SAMPLE_RATE = float(os.environ.get('FRESHMART_PROFILE_SAMPLE_RATE', 0))
+FRESHMART_PROFILE_SLOW_MS = 500
+FRESHMART_PROFILE_DIR = BASE_DIR / 'profiling'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,12 +236,30 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = '/static/'
-STATICFILES_DIR = [BASE_DIR/'freshmart'/'static']
+# freshmart/static is found by the app directories finder; list any project-level dirs here
+STATICFILES_DIRS = []
 STATIC_ROOT = BASE_DIR/'staticfiles'
 
+# collectstatic minifies our CSS/JS, fingerprints every file and pre-compresses it
+# (freshmart.assets.AssetStorage); views.static_asset serves the result.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'freshmart.assets.AssetStorage'},
+}
+
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR/'media'
 
+# Product images are resized into MEDIA_ROOT/products (see freshmart.images) on first
+# request or by `manage.py prewarm_images`. The fetcher is a callable url -> bytes.
+FRESHMART_IMAGE_FETCHER = 'freshmart.images.fetch_url'
+
+# Sitemaps and product feeds are written to FRESHMART_FEED_ROOT by `manage.py build_catalog_files`
+# (run it from cron: it only rewrites the shards whose products changed) and served from
+# there by views.catalog_file, or by the web server in front. Their links start with FRESHMART_SITE_URL.
+FRESHMART_FEED_ROOT = BASE_DIR / 'feeds'
+FRESHMART_SITE_URL = os.environ.get('FRESHMART_SITE_URL', 'http://localhost:8000')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
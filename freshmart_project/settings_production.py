@@ -0,0 +1,41 @@
+"""
+Production settings: the development settings with DEBUG off, templates loaded once
+per process by the cached loader, and workers warmed up before they serve.
+
+Use with DJANGO_SETTINGS_MODULE=freshmart_project.settings_production; set
+DJANGO_SECRET_KEY and DJANGO_ALLOWED_HOSTS (comma-separated) in the environment.
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import TEMPLATES
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', '')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Set DJANGO_SECRET_KEY for the production settings.')
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+# Spelled out rather than left to Django's default, so nothing (e.g. a debug toolbar
+# setting 'loaders' for development) can turn template caching off here
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'debug': False,
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+FRESHMART_WARMUP = os.environ.get('FRESHMART_WARMUP', '1') == '1'
@@ -21,5 +21,6 @@ app_name ='freshmar'
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('accounts/', include('django.contrib.auth.urls')),
     path('', include('freshmart.urls')),   #
 ]
\ No newline at end of file
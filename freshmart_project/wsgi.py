@@ -7,10 +7,27 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
+import gc
 import os
 
-from django.core.wsgi import get_wsgi_application
+# Startup creates a great many long-lived objects (modules, classes, templates) and
+# almost no cyclic garbage, so the collector's repeated passes over them are wasted:
+# it is paused until the application is ready, and everything alive by then is frozen
+# out of later collections (also keeping those pages shared between forked workers)
+gc.disable()
+
+from django.core.wsgi import get_wsgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'freshmart_project.settings')
 
 application = get_wsgi_application()
+
+# Compile templates and render a few pages before serving (freshmart.warmup)
+from django.conf import settings  # noqa: E402
+
+if settings.FRESHMART_WARMUP:
+    from freshmart.warmup import warm_up
+    warm_up(application)
+
+gc.freeze()
+gc.enable()